@@ -2,30 +2,62 @@
 
 import time
 import json
+import base64
 import logging
-from typing import Dict, Any, Optional, Union
+import threading
+from typing import Dict, Any, Optional, Union, Iterator, Callable
 from dataclasses import dataclass
+from pathlib import Path
+from urllib.parse import urlsplit
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
+from urllib3.exceptions import ReadTimeoutError
 
 from config import get_config
+from singleflight import SingleFlight, payload_key
+from scheduler import get_scheduler, RequestCancelled
+from fileutil import atomic_write, Base64FieldDecoder, TeeWriter
+from balancer import get_backend_pool, get_balancer_stats
+from metrics import get_metrics
+from timeouts import get_timeouts
 
 
 logger = logging.getLogger(__name__)
 
+# Streaming downloads hold at most one chunk of the body in memory
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Reads block until a whole chunk arrived; streamed consumers get small ones
+STREAM_CHUNK_SIZE = 4 * 1024
+
+# Shared by every APIClient so identical requests from different
+# subsystems (TTS prefetch, playback, image generation) coalesce.
+_inflight = SingleFlight()
+
 
 @dataclass
 class APIResponse:
     """Wrapper for API responses."""
     status_code: int
-    data: Optional[Union[dict, bytes]]
+    data: Optional[Union[dict, bytes, Path]]
     error: Optional[str] = None
+    elapsed: float = 0.0
+    error_class: Optional[str] = None
     
     @property
     def success(self) -> bool:
         return 200 <= self.status_code < 300 and self.error is None
     
+    @property
+    def failure_class(self) -> Optional[str]:
+        """Short failure category (timeout, connection, http_503...) or None."""
+        if self.error_class:
+            return self.error_class
+        if self.success:
+            return None
+        return f"http_{self.status_code}"
+    
     def json(self) -> dict:
         """Get JSON data from response."""
         if isinstance(self.data, dict):
@@ -35,6 +67,203 @@ class APIResponse:
         return {}
 
 
+def _parse_stream_line(line: str) -> Optional[dict]:
+    """Parse one line of an SSE or NDJSON stream into a chunk dict.
+    
+    Returns None for blank lines, SSE comments and non-data fields.
+    The OpenAI ``data: [DONE]`` sentinel becomes ``{"done": True}``.
+    """
+    line = line.strip()
+    if not line or line.startswith(':'):
+        return None
+    
+    if line.startswith('data:'):
+        line = line[5:].strip()
+        if line == '[DONE]':
+            return {"done": True}
+    elif line.startswith(('event:', 'id:', 'retry:')):
+        return None
+    
+    return json.loads(line)
+
+
+def _extract_stream_token(chunk: dict) -> str:
+    """Get the text delta from a streamed chunk of any supported format."""
+    choices = chunk.get("choices")
+    if choices:
+        choice = choices[0]
+        delta = choice.get("delta") or {}
+        return delta.get("content") or choice.get("text") or ""
+    
+    # Ollama-style NDJSON: /api/generate and /api/chat
+    if "response" in chunk:
+        return chunk["response"] or ""
+    return (chunk.get("message") or {}).get("content") or ""
+
+
+def _connection_error_class(error: requests.exceptions.ConnectionError) -> str:
+    """Classify a ConnectionError; retried read timeouts surface as one."""
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return "timeout" if isinstance(reason, ReadTimeoutError) else "connection"
+
+
+@dataclass
+class _RequestTrace:
+    """Timing and transport details of one request, for metrics and timeouts."""
+    queued: float
+    model: Optional[str] = None
+    read_timeout: Optional[float] = None
+    granted: Optional[float] = None
+    response: Optional[requests.Response] = None
+    bytes_in: int = 0
+
+
+class CircuitBreaker:
+    """Tracks the health of one backend and fails fast while it is down.
+    
+    After failure_threshold consecutive failures the circuit opens and every
+    request fails immediately. A background thread then probes the backend
+    with exponential backoff and closes the circuit once it answers again.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, base_url: str, config):
+        """Initialize a closed breaker for base_url."""
+        self.base_url = base_url
+        self.config = config
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.total_failures = 0
+        self.times_opened = 0
+        self.avg_latency = 0.0
+        self.opened_at: Optional[float] = None
+        
+        self._lock = threading.Lock()
+        self._probe_thread: Optional[threading.Thread] = None
+    
+    @property
+    def degraded(self) -> bool:
+        """True once the backend has started failing (retries are skipped)."""
+        return self.consecutive_failures > 0
+    
+    def allow_request(self) -> bool:
+        """Check whether a request may be sent to this backend."""
+        return self.state == self.CLOSED
+    
+    def record(self, response: APIResponse):
+        """Record the outcome of a request."""
+        # Cancelled requests say nothing about backend health
+        if response.status_code == 499:
+            return
+        
+        failed = response.status_code >= 500 or response.status_code == 408
+        slow_limit = self.config.breaker_slow_call_threshold
+        if slow_limit and response.elapsed > slow_limit:
+            logger.warning(f"Slow call to {self.base_url}: {response.elapsed:.1f}s")
+            failed = True
+        
+        with self._lock:
+            if response.elapsed:
+                self.avg_latency = (response.elapsed if not self.avg_latency
+                                    else 0.8 * self.avg_latency + 0.2 * response.elapsed)
+            
+            if not failed:
+                self.consecutive_failures = 0
+                return
+            
+            self.consecutive_failures += 1
+            self.total_failures += 1
+            if (self.state == self.CLOSED and
+                    self.consecutive_failures >= self.config.breaker_failure_threshold):
+                self._open()
+    
+    def _open(self):
+        """Open the circuit and start probing (lock held)."""
+        self.state = self.OPEN
+        self.opened_at = time.time()
+        self.times_opened += 1
+        logger.error(f"Circuit opened for {self.base_url} after "
+                     f"{self.consecutive_failures} consecutive failures")
+        
+        if self._probe_thread is None or not self._probe_thread.is_alive():
+            self._probe_thread = threading.Thread(
+                target=self._probe_loop,
+                name=f"breaker-probe-{self.base_url}",
+                daemon=True
+            )
+            self._probe_thread.start()
+    
+    def _probe_loop(self):
+        """Probe the backend until it responds, then close the circuit."""
+        delay = self.config.breaker_reset_timeout
+        
+        while self.state != self.CLOSED:
+            time.sleep(delay)
+            self.state = self.HALF_OPEN
+            
+            if self._probe():
+                with self._lock:
+                    self.state = self.CLOSED
+                    self.consecutive_failures = 0
+                logger.info(f"Circuit closed for {self.base_url}")
+                return
+            
+            self.state = self.OPEN
+            delay = min(delay * 2, self.config.breaker_max_probe_interval)
+    
+    def _probe(self) -> bool:
+        """Send one health probe; anything but a gateway error means up."""
+        url = f"{self.base_url}{self.config.breaker_probe_path}"
+        try:
+            response = requests.get(
+                url,
+                headers={'Authorization': f'Bearer {self.config.api_key}'},
+                timeout=(self.config.connect_timeout, self.config.connect_timeout)
+            )
+            response.close()
+            return response.status_code not in (502, 503, 504)
+        except requests.exceptions.RequestException as e:
+            logger.debug(f"Probe of {url} failed: {e}")
+            return False
+    
+    def get_stats(self) -> dict:
+        """Get breaker state and counters."""
+        return {
+            'state': self.state,
+            'consecutive_failures': self.consecutive_failures,
+            'total_failures': self.total_failures,
+            'times_opened': self.times_opened,
+            'avg_latency': round(self.avg_latency, 3)
+        }
+
+
+# Breakers are keyed by backend (scheme://host:port) and shared by all clients
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(url: str, config=None) -> CircuitBreaker:
+    """Get or create the circuit breaker for the backend serving url."""
+    parts = urlsplit(url)
+    base_url = f"{parts.scheme}://{parts.netloc}"
+    
+    with _breakers_lock:
+        breaker = _breakers.get(base_url)
+        if breaker is None:
+            breaker = CircuitBreaker(base_url, config or get_config())
+            _breakers[base_url] = breaker
+        return breaker
+
+
+def get_breaker_stats() -> Dict[str, dict]:
+    """Get the state of every known backend."""
+    with _breakers_lock:
+        return {url: b.get_stats() for url, b in _breakers.items()}
+
+
 class APIClient:
     """HTTP client with retry logic and connection pooling."""
     
@@ -56,31 +285,104 @@ class APIClient:
         adapter = HTTPAdapter(
             max_retries=retry_strategy,
             pool_connections=10,
-            pool_maxsize=10
+            pool_maxsize=self.config.scheduler_slots
         )
         
         self.session.mount("http://", adapter)
         self.session.mount("https://", adapter)
         
+        # Shared priority scheduler gating every request
+        self.scheduler = get_scheduler(self.config)
+        
+        # Per-endpoint read timeouts learned from observed latency
+        self.timeouts = get_timeouts(self.config)
+        
+        # Per-endpoint request metrics, optionally dumped to JSON
+        self.metrics = get_metrics()
+        if self.config.metrics_dump_path:
+            self.metrics.start_periodic_dump(
+                self.config.metrics_dump_path,
+                self.config.metrics_dump_interval,
+                extra_fn=self._backend_stats
+            )
+        
         # Set default headers
         self.session.headers.update({
             'Authorization': f'Bearer {self.config.api_key}',
             'Content-Type': 'application/json'
         })
+        
+        # Session without retries for backends that have started failing,
+        # sharing the same headers
+        self.fail_fast_session = requests.Session()
+        fail_fast_adapter = HTTPAdapter(
+            max_retries=Retry(total=0, raise_on_status=False),
+            pool_connections=10,
+            pool_maxsize=self.config.scheduler_slots
+        )
+        self.fail_fast_session.mount("http://", fail_fast_adapter)
+        self.fail_fast_session.mount("https://", fail_fast_adapter)
+        self.fail_fast_session.headers = self.session.headers
     
-    def _make_request(self, method: str, url: str, **kwargs) -> APIResponse:
-        """Make HTTP request with error handling."""
+    def _make_request(self, method: str, url: str,
+                      key: Optional[str] = None, **kwargs) -> APIResponse:
+        """Make HTTP request through the backend's circuit breaker.
+        
+        Fails immediately while the circuit is open, and skips retries
+        while the backend is degraded.
+        """
+        breaker = get_circuit_breaker(url, self.config)
+        if not breaker.allow_request():
+            logger.debug(f"Circuit open, failing fast: {url}")
+            return APIResponse(
+                status_code=503,
+                data=None,
+                error=f"Circuit open for {breaker.base_url}",
+                error_class="circuit_open"
+            )
+        
+        session = self.fail_fast_session if breaker.degraded else self.session
+        response = self._send_request(session, method, url, key, **kwargs)
+        breaker.record(response)
+        return response
+    
+    def _send_request(self, session: requests.Session, method: str, url: str,
+                      key: Optional[str] = None, **kwargs) -> APIResponse:
+        """Make HTTP request with error handling and record its metrics.
+        
+        The request waits for a slot from the priority scheduler first;
+        key lets the scheduler boost it if a foreground caller coalesces.
+        """
+        payload = kwargs.get('json')
+        trace = _RequestTrace(
+            queued=time.monotonic(),
+            model=payload.get('model') if isinstance(payload, dict) else None
+        )
+        result = self._perform_request(session, method, url, key, trace, **kwargs)
+        self._record_outcome(url, result, trace, session)
+        return result
+    
+    def _perform_request(self, session: requests.Session, method: str, url: str,
+                         key: Optional[str], trace: '_RequestTrace',
+                         **kwargs) -> APIResponse:
+        """Send one request and map exceptions to APIResponse errors."""
+        elapsed = 0.0
         try:
-            # Set timeouts
-            kwargs.setdefault('timeout', (
-                self.config.connect_timeout,
-                self.config.read_timeout
-            ))
+            # Set timeouts from the endpoint's observed latency
+            kwargs.setdefault('timeout', self.timeouts.timeout(url, trace.model))
+            trace.read_timeout = kwargs['timeout'][1]
             
-            # Make request
-            response = self.session.request(method, url, **kwargs)
+            # Make request once the scheduler grants a slot
+            with self.scheduler.slot(key=key):
+                trace.granted = time.monotonic()
+                try:
+                    response = session.request(method, url, **kwargs)
+                    trace.response = response
+                finally:
+                    elapsed = time.monotonic() - trace.granted
             
             # Parse response
+            trace.bytes_in = len(response.content)
             if response.headers.get('content-type', '').startswith('application/json'):
                 data = response.json()
             else:
@@ -88,82 +390,287 @@ class APIClient:
             
             return APIResponse(
                 status_code=response.status_code,
-                data=data
+                data=data,
+                elapsed=elapsed
             )
-            
+        
+        except RequestCancelled as e:
+            logger.debug(f"Request cancelled: {url}")
+            return APIResponse(
+                status_code=499,
+                data=None,
+                error=f"Request cancelled: {str(e)}",
+                error_class="cancelled"
+            )
+        
         except requests.exceptions.Timeout as e:
             logger.error(f"Request timeout: {e}")
             return APIResponse(
                 status_code=408,
                 data=None,
-                error=f"Request timeout: {str(e)}"
+                error=f"Request timeout: {str(e)}",
+                elapsed=elapsed,
+                error_class="timeout"
             )
-            
+        
         except requests.exceptions.ConnectionError as e:
             logger.error(f"Connection error: {e}")
             return APIResponse(
                 status_code=503,
                 data=None,
-                error=f"Connection error: {str(e)}"
+                error=f"Connection error: {str(e)}",
+                error_class=_connection_error_class(e)
             )
-            
+        
         except requests.exceptions.RequestException as e:
             logger.error(f"Request error: {e}")
             return APIResponse(
                 status_code=500,
                 data=None,
-                error=f"Request error: {str(e)}"
+                error=f"Request error: {str(e)}",
+                error_class=type(e).__name__
             )
-            
+        
         except json.JSONDecodeError as e:
             logger.error(f"JSON decode error: {e}")
             return APIResponse(
-                status_code=response.status_code if 'response' in locals() else 500,
-                data=response.content if 'response' in locals() else None,
-                error=f"JSON decode error: {str(e)}"
+                status_code=trace.response.status_code if trace.response is not None else 500,
+                data=trace.response.content if trace.response is not None else None,
+                error=f"JSON decode error: {str(e)}",
+                error_class="decode"
             )
-            
+        
         except Exception as e:
             logger.error(f"Unexpected error: {e}")
             return APIResponse(
                 status_code=500,
                 data=None,
-                error=f"Unexpected error: {str(e)}"
+                error=f"Unexpected error: {str(e)}",
+                error_class=type(e).__name__
+            )
+    
+    def _record_outcome(self, url: str, result: APIResponse,
+                        trace: '_RequestTrace', session: requests.Session):
+        """Record one finished request in the metrics and timeout windows."""
+        if result.error_class == "cancelled":
+            return
+        
+        now = time.monotonic()
+        granted = trace.granted if trace.granted is not None else now
+        response = trace.response
+        
+        ttfb = None
+        bytes_out = 0
+        retries = 0
+        if response is not None:
+            ttfb = response.elapsed.total_seconds()
+            body = response.request.body
+            bytes_out = len(body) if body else 0
+            raw_retries = getattr(response.raw, 'retries', None)
+            retries = len(raw_retries.history) if raw_retries is not None else 0
+        elif result.error_class == "connection" and session is self.session:
+            # Connection errors surface only after every retry is exhausted
+            retries = self.config.max_retries
+        
+        if ttfb is not None:
+            self.timeouts.observe(url, trace.model, ttfb)
+        elif result.error_class == "timeout" and trace.read_timeout:
+            self.timeouts.observe(url, trace.model, trace.read_timeout)
+        
+        self.metrics.record(
+            url,
+            latency=now - granted,
+            error_class=result.failure_class,
+            queue_wait=granted - trace.queued,
+            ttfb=ttfb,
+            bytes_out=bytes_out,
+            bytes_in=trace.bytes_in,
+            retries=retries
+        )
+    
+    def _stream_chunks(self, url: str, data: Dict[str, Any]) -> Iterator[dict]:
+        """POST JSON and yield parsed chunks from a streaming response.
+        
+        Errors are logged and end the stream early; the response is always
+        closed, even if the caller stops iterating.
+        """
+        breaker = get_circuit_breaker(url, self.config)
+        if not breaker.allow_request():
+            logger.error(f"Circuit open, not streaming from {url}")
+            return
+        
+        trace = _RequestTrace(queued=time.monotonic(), model=data.get('model'))
+        timeout = self.timeouts.timeout(url, trace.model)
+        trace.read_timeout = timeout[1]
+        result = APIResponse(status_code=200, data=None)
+        slot = None
+        try:
+            slot = self.scheduler.acquire()
+            start = trace.granted = time.monotonic()
+            response = trace.response = self.session.post(
+                url, json=data, stream=True, timeout=timeout
             )
+            breaker.record(APIResponse(
+                status_code=response.status_code,
+                data=None,
+                elapsed=time.monotonic() - start
+            ))
+            
+            if not 200 <= response.status_code < 300:
+                logger.error(f"Stream request failed with status "
+                             f"{response.status_code}: {response.text[:200]}")
+                result.status_code = response.status_code
+                result.error = "Stream request failed"
+                return
+            
+            for line in response.iter_lines(decode_unicode=False):
+                trace.bytes_in += len(line) + 1
+                chunk = _parse_stream_line(line.decode('utf-8'))
+                if chunk is None:
+                    continue
+                if chunk.get("error"):
+                    logger.error(f"Stream error: {chunk['error']}")
+                    result.error, result.error_class = chunk['error'], "stream_error"
+                    return
+                yield chunk
+                if chunk.get("done"):
+                    return
+        
+        except RequestCancelled as e:
+            logger.debug(f"Stream request cancelled: {e}")
+            result.error, result.error_class = str(e), "cancelled"
+        
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Stream request error: {e}")
+            result.error = str(e)
+            if isinstance(e, requests.exceptions.Timeout):
+                result.error_class = "timeout"
+            elif isinstance(e, requests.exceptions.ConnectionError):
+                result.error_class = _connection_error_class(e)
+            else:
+                result.error_class = type(e).__name__
+            if trace.response is None:
+                breaker.record(APIResponse(status_code=503, data=None, error=str(e)))
+        
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            logger.error(f"Stream decode error: {e}")
+            result.error, result.error_class = str(e), "decode"
+        
+        finally:
+            if trace.response is not None:
+                trace.response.close()
+            if slot is not None:
+                self.scheduler.release(slot)
+            self._record_outcome(url, result, trace, self.session)
+    
+    def _route(self, endpoint: str, base_url: Optional[str], service: str,
+               send: Callable[[str], APIResponse]) -> APIResponse:
+        """Send a request to an explicit base URL or a pooled backend.
+        
+        Without base_url the backend is picked from the service's pool. If
+        it is unreachable (connection error or open circuit) the request
+        fails over to the next backend.
+        """
+        if base_url:
+            return send(f"{base_url}{endpoint}")
+        
+        pool = get_backend_pool(service, self.config)
+        tried = []
+        response = None
+        
+        while True:
+            with pool.acquire(exclude=tried) as backend:
+                if backend is None:
+                    break
+                response = send(f"{backend.url}{endpoint}")
+                pool.record(backend, response.elapsed, response.success)
+            
+            tried.append(backend)
+            unreachable = response.status_code == 503 and response.data is None
+            if not unreachable:
+                return response
+            logger.warning(f"{service} backend {backend.url} unreachable, failing over")
+        
+        return response or APIResponse(
+            status_code=503,
+            data=None,
+            error=f"No {service} backends configured"
+        )
+    
+    def stream_json(self, endpoint: str, data: Dict[str, Any],
+                    base_url: Optional[str] = None,
+                    service: str = "api") -> Iterator[str]:
+        """POST JSON to a streaming endpoint and yield text tokens."""
+        if base_url:
+            yield from self._stream_tokens(f"{base_url}{endpoint}", data)
+            return
+        
+        pool = get_backend_pool(service, self.config)
+        with pool.acquire() as backend:
+            if backend is None:
+                logger.error(f"No {service} backends configured")
+                return
+            
+            received = False
+            try:
+                for token in self._stream_tokens(f"{backend.url}{endpoint}", data):
+                    received = True
+                    yield token
+            finally:
+                pool.record(backend, 0.0, received)
+    
+    def _stream_tokens(self, url: str, data: Dict[str, Any]) -> Iterator[str]:
+        """Yield the text tokens of one streaming request."""
+        logger.debug(f"POST (stream) {url}")
+        for chunk in self._stream_chunks(url, data):
+            token = _extract_stream_token(chunk)
+            if token:
+                yield token
     
     def post_json(self, endpoint: str, data: Dict[str, Any], 
-                  base_url: Optional[str] = None) -> APIResponse:
-        """POST JSON data to endpoint."""
-        base = base_url or self.config.api_base_url
-        url = f"{base}{endpoint}"
+                  base_url: Optional[str] = None,
+                  service: str = "api") -> APIResponse:
+        """POST JSON data to endpoint.
+        
+        Without base_url the request goes to a backend chosen from the
+        service's pool ('api', 'tts' or 'sd').
+        """
+        logger.debug(f"POST {base_url or service}:{endpoint}")
+        key = payload_key('POST', base_url or service, endpoint, data)
         
-        logger.debug(f"POST {url}")
-        return self._make_request('POST', url, json=data)
+        # If this request is already queued at a lower priority, lift it
+        self.scheduler.boost(key)
+        return _inflight.do(key, lambda: self._route(
+            endpoint, base_url, service,
+            lambda url: self._make_request('POST', url, key=key, json=data)
+        ))
     
     def get(self, endpoint: str, params: Optional[Dict[str, Any]] = None,
-            base_url: Optional[str] = None) -> APIResponse:
+            base_url: Optional[str] = None,
+            service: str = "api") -> APIResponse:
         """GET from endpoint."""
-        base = base_url or self.config.api_base_url
-        url = f"{base}{endpoint}"
-        
-        logger.debug(f"GET {url}")
-        return self._make_request('GET', url, params=params)
+        logger.debug(f"GET {base_url or service}:{endpoint}")
+        return self._route(
+            endpoint, base_url, service,
+            lambda url: self._make_request('GET', url, params=params)
+        )
     
     def post_binary(self, endpoint: str, data: bytes, 
                     content_type: str = 'application/octet-stream',
-                    base_url: Optional[str] = None) -> APIResponse:
+                    base_url: Optional[str] = None,
+                    service: str = "api") -> APIResponse:
         """POST binary data to endpoint."""
-        base = base_url or self.config.api_base_url
-        url = f"{base}{endpoint}"
-        
-        logger.debug(f"POST (binary) {url}")
+        logger.debug(f"POST (binary) {base_url or service}:{endpoint}")
         
         # Temporarily override content-type
         old_content_type = self.session.headers.get('Content-Type')
         self.session.headers['Content-Type'] = content_type
         
         try:
-            response = self._make_request('POST', url, data=data)
+            response = self._route(
+                endpoint, base_url, service,
+                lambda url: self._make_request('POST', url, data=data)
+            )
         finally:
             # Restore original content-type
             if old_content_type:
@@ -172,8 +679,19 @@ class APIClient:
         return response
     
     def generate_text(self, prompt: str, model: Optional[str] = None,
-                     temperature: float = 0.7, max_tokens: int = 2000) -> Optional[str]:
-        """Generate text using the /api/generate endpoint."""
+                     temperature: float = 0.7, max_tokens: int = 2000,
+                     on_token: Optional[Callable[[str], None]] = None) -> Optional[str]:
+        """Generate text using the /api/generate endpoint.
+        
+        If on_token is given the completion is streamed and on_token is
+        called with each token as it arrives; the full text is still returned.
+        """
+        if on_token is not None:
+            return self._collect_stream(
+                self.generate_text_stream(prompt, model, temperature, max_tokens),
+                on_token, "Text generation"
+            )
+        
         data = {
             "prompt": prompt,
             "model": model or self.config.default_chat_model,
@@ -190,9 +708,33 @@ class APIClient:
         logger.error(f"Text generation failed: {response.error}")
         return None
     
+    def generate_text_stream(self, prompt: str, model: Optional[str] = None,
+                             temperature: float = 0.7,
+                             max_tokens: int = 2000) -> Iterator[str]:
+        """Stream tokens from the /api/generate endpoint (NDJSON or SSE)."""
+        data = {
+            "prompt": prompt,
+            "model": model or self.config.default_chat_model,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True
+        }
+        return self.stream_json("/api/generate", data)
+    
     def chat(self, messages: list, model: Optional[str] = None,
-             temperature: float = 0.7, max_tokens: int = 2000) -> Optional[str]:
-        """Chat using OpenAI-compatible endpoint."""
+             temperature: float = 0.7, max_tokens: int = 2000,
+             on_token: Optional[Callable[[str], None]] = None) -> Optional[str]:
+        """Chat using OpenAI-compatible endpoint.
+        
+        If on_token is given the completion is streamed and on_token is
+        called with each token as it arrives; the full text is still returned.
+        """
+        if on_token is not None:
+            return self._collect_stream(
+                self.chat_stream(messages, model, temperature, max_tokens),
+                on_token, "Chat"
+            )
+        
         data = {
             "model": model or self.config.default_chat_model,
             "messages": messages,
@@ -211,15 +753,213 @@ class APIClient:
         logger.error(f"Chat failed: {response.error}")
         return None
     
-    def generate_image(self, prompt: str, negative_prompt: str = "",
-                      width: int = 768, height: int = 512,
-                      steps: int = 20, cfg_scale: float = 7.0) -> Optional[bytes]:
-        """Generate image using Stable Diffusion WebUI."""
-        if not self.config.sd_webui_url:
-            logger.error("SD_WEBUI_URL not configured")
+    def chat_stream(self, messages: list, model: Optional[str] = None,
+                    temperature: float = 0.7,
+                    max_tokens: int = 2000) -> Iterator[str]:
+        """Stream tokens from the OpenAI-compatible chat endpoint (SSE)."""
+        data = {
+            "model": model or self.config.default_chat_model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True
+        }
+        return self.stream_json("/v1/chat/completions", data)
+    
+    def _collect_stream(self, tokens: Iterator[str],
+                        on_token: Callable[[str], None],
+                        label: str) -> Optional[str]:
+        """Feed streamed tokens to a callback and return the joined text."""
+        parts = []
+        for token in tokens:
+            parts.append(token)
+            try:
+                on_token(token)
+            except Exception as e:
+                logger.error(f"Token callback error: {e}")
+        
+        if not parts:
+            logger.error(f"{label} stream returned no tokens")
             return None
+        return "".join(parts)
+    
+    def download_to_file(self, endpoint: str, data: Dict[str, Any],
+                         dest_path: Union[str, Path],
+                         json_field: Optional[str] = None,
+                         base_url: Optional[str] = None,
+                         service: str = "api",
+                         on_chunk: Optional[Callable[[bytes], None]] = None,
+                         key: Optional[str] = None) -> APIResponse:
+        """POST JSON and stream the response body straight into a file.
         
-        data = {
+        Binary bodies are written as they arrive. JSON bodies have the base64
+        string under json_field decoded chunk by chunk. The data goes to a
+        temp file next to dest_path, which is renamed into place only once
+        complete, so peak memory is one chunk.
+        
+        Args:
+            on_chunk: Also receives the (decoded) data as it is written.
+                Only the first backend tried feeds it; after a failover it
+                gets nothing more, since the body would start over.
+            key: Identity of the request for coalescing and for
+                scheduler.boost() (defaults to a hash of the request and
+                dest_path)
+        
+        Returns:
+            APIResponse whose data is the final Path on success
+        """
+        dest_path = Path(dest_path)
+        
+        logger.debug(f"POST (download) {base_url or service}:{endpoint} -> {dest_path}")
+        if key is None:
+            key = payload_key('POST', base_url or service, endpoint, data, str(dest_path))
+        self.scheduler.boost(key)
+        
+        tried = []
+        
+        def send(url: str) -> APIResponse:
+            first = not tried
+            tried.append(url)
+            return self._download(url, data, dest_path, json_field, key,
+                                  on_chunk if first else None)
+        
+        return _inflight.do(key, lambda: self._route(endpoint, base_url, service, send))
+    
+    def _download(self, url: str, data: Dict[str, Any], dest_path: Path,
+                  json_field: Optional[str], key: str,
+                  on_chunk: Optional[Callable[[bytes], None]] = None) -> APIResponse:
+        """Stream one response body to disk through the circuit breaker."""
+        breaker = get_circuit_breaker(url, self.config)
+        if not breaker.allow_request():
+            return APIResponse(
+                status_code=503,
+                data=None,
+                error=f"Circuit open for {breaker.base_url}",
+                error_class="circuit_open"
+            )
+        
+        session = self.fail_fast_session if breaker.degraded else self.session
+        result = self._send_download(session, url, data, dest_path, json_field,
+                                     key, on_chunk)
+        breaker.record(result)
+        return result
+    
+    def _send_download(self, session: requests.Session, url: str,
+                       data: Dict[str, Any], dest_path: Path,
+                       json_field: Optional[str], key: str,
+                       on_chunk: Optional[Callable[[bytes], None]] = None) -> APIResponse:
+        """Make a streaming download and record its metrics."""
+        trace = _RequestTrace(queued=time.monotonic(), model=data.get('model'))
+        result = self._perform_download(session, url, data, dest_path,
+                                        json_field, key, trace, on_chunk)
+        self._record_outcome(url, result, trace, session)
+        return result
+    
+    def _perform_download(self, session: requests.Session, url: str,
+                          data: Dict[str, Any], dest_path: Path,
+                          json_field: Optional[str], key: str,
+                          trace: '_RequestTrace',
+                          on_chunk: Optional[Callable[[bytes], None]] = None) -> APIResponse:
+        """Make a streaming request and write its body with error handling."""
+        start = time.monotonic()
+        try:
+            with self.scheduler.slot(key=key):
+                timeout = self.timeouts.timeout(url, trace.model)
+                trace.read_timeout = timeout[1]
+                start = trace.granted = time.monotonic()
+                with session.post(url, json=data, stream=True,
+                                  timeout=timeout) as response:
+                    trace.response = response
+                    
+                    if not 200 <= response.status_code < 300:
+                        return APIResponse(
+                            status_code=response.status_code,
+                            data=None,
+                            error=f"HTTP {response.status_code}: {response.text[:200]}",
+                            elapsed=time.monotonic() - start
+                        )
+                    
+                    is_json = response.headers.get(
+                        'content-type', '').startswith('application/json')
+                    if is_json and not json_field:
+                        return APIResponse(
+                            status_code=500,
+                            data=None,
+                            error="Unexpected JSON response for binary download",
+                            elapsed=time.monotonic() - start,
+                            error_class="unexpected_json"
+                        )
+                    
+                    with atomic_write(dest_path, 'wb') as f:
+                        if on_chunk is not None:
+                            f = TeeWriter(f, on_chunk)
+                        decoder = Base64FieldDecoder(json_field, f) if is_json else None
+                        chunk_size = STREAM_CHUNK_SIZE if on_chunk else DOWNLOAD_CHUNK_SIZE
+                        for chunk in response.iter_content(chunk_size):
+                            trace.bytes_in += len(chunk)
+                            if decoder is not None:
+                                decoder.feed(chunk)
+                            else:
+                                f.write(chunk)
+                        
+                        if decoder is not None and not decoder.complete:
+                            raise ValueError(f"No '{json_field}' field in response")
+            
+            return APIResponse(
+                status_code=response.status_code,
+                data=dest_path,
+                elapsed=time.monotonic() - start
+            )
+        
+        except RequestCancelled as e:
+            return APIResponse(
+                status_code=499,
+                data=None,
+                error=f"Request cancelled: {str(e)}",
+                error_class="cancelled"
+            )
+        
+        except requests.exceptions.Timeout as e:
+            logger.error(f"Download timeout: {e}")
+            return APIResponse(
+                status_code=408,
+                data=None,
+                error=f"Request timeout: {str(e)}",
+                elapsed=time.monotonic() - start,
+                error_class="timeout"
+            )
+        
+        except requests.exceptions.ConnectionError as e:
+            logger.error(f"Connection error: {e}")
+            return APIResponse(
+                status_code=503,
+                data=None,
+                error=f"Connection error: {str(e)}",
+                error_class=_connection_error_class(e)
+            )
+        
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Request error: {e}")
+            return APIResponse(
+                status_code=500,
+                data=None,
+                error=f"Request error: {str(e)}",
+                error_class=type(e).__name__
+            )
+        
+        except (OSError, ValueError) as e:
+            logger.error(f"Download to {dest_path} failed: {e}")
+            return APIResponse(
+                status_code=500,
+                data=None,
+                error=f"Download failed: {str(e)}",
+                error_class="write"
+            )
+    
+    def _image_payload(self, prompt: str, negative_prompt: str, width: int,
+                       height: int, steps: int, cfg_scale: float) -> Dict[str, Any]:
+        """Build the txt2img request body."""
+        return {
             "prompt": prompt,
             "negative_prompt": negative_prompt,
             "width": width,
@@ -230,45 +970,162 @@ class APIClient:
             "batch_size": 1,
             "n_iter": 1
         }
+    
+    def generate_image(self, prompt: str, negative_prompt: str = "",
+                      width: int = 768, height: int = 512,
+                      steps: int = 20, cfg_scale: float = 7.0) -> Optional[bytes]:
+        """Generate image using Stable Diffusion WebUI."""
+        if not self.config.sd_webui_url:
+            logger.error("SD_WEBUI_URL not configured")
+            return None
+        
+        data = self._image_payload(prompt, negative_prompt, width, height,
+                                   steps, cfg_scale)
         
-        response = self.post_json("/sdapi/v1/txt2img", data, 
-                                 base_url=self.config.sd_webui_url)
+        response = self.post_json("/sdapi/v1/txt2img", data, service="sd")
         if response.success:
             result = response.json()
             images = result.get("images", [])
             if images:
-                import base64
                 return base64.b64decode(images[0])
         
         logger.error(f"Image generation failed: {response.error}")
         return None
     
-    def generate_speech(self, text: str, voice: Optional[str] = None,
-                       model: Optional[str] = None) -> Optional[bytes]:
-        """Generate speech using TTS endpoint."""
-        data = {
+    def request_image_to_file(self, prompt: str, dest_path: Union[str, Path],
+                              negative_prompt: str = "",
+                              width: int = 768, height: int = 512,
+                              steps: int = 20,
+                              cfg_scale: float = 7.0) -> APIResponse:
+        """Generate an image into dest_path, keeping the failure details.
+        
+        Returns:
+            APIResponse whose data is the written Path on success
+        """
+        if not self.config.sd_webui_url:
+            return APIResponse(
+                status_code=0,
+                data=None,
+                error="SD_WEBUI_URL not configured",
+                error_class="not_configured"
+            )
+        
+        data = self._image_payload(prompt, negative_prompt, width, height,
+                                   steps, cfg_scale)
+        
+        return self.download_to_file("/sdapi/v1/txt2img", data, dest_path,
+                                     json_field="images", service="sd")
+    
+    def generate_image_to_file(self, prompt: str, dest_path: Union[str, Path],
+                               negative_prompt: str = "",
+                               width: int = 768, height: int = 512,
+                               steps: int = 20,
+                               cfg_scale: float = 7.0) -> Optional[Path]:
+        """Generate an image and stream it straight into dest_path.
+        
+        Returns:
+            Path to the written image or None if failed
+        """
+        response = self.request_image_to_file(prompt, dest_path, negative_prompt,
+                                              width, height, steps, cfg_scale)
+        if response.success:
+            return response.data
+        
+        logger.error(f"Image generation failed: {response.error}")
+        return None
+    
+    def _speech_payload(self, text: str, voice: Optional[str],
+                        model: Optional[str], response_format: str) -> Dict[str, Any]:
+        """Build the TTS request body."""
+        return {
             "input": text,
             "voice": voice or self.config.tts_voice,
             "model": model or self.config.tts_model,
-            "response_format": "mp3"
+            "response_format": response_format
         }
+    
+    def generate_speech(self, text: str, voice: Optional[str] = None,
+                       model: Optional[str] = None,
+                       response_format: str = "mp3") -> Optional[bytes]:
+        """Generate speech using TTS endpoint."""
+        data = self._speech_payload(text, voice, model, response_format)
         
-        response = self.post_json("/v1/audio/speech", data)
+        response = self.post_json("/v1/audio/speech", data, service="tts")
         if response.success:
             if isinstance(response.data, bytes):
                 return response.data
             # If JSON response with base64 audio
             result = response.json()
             if "audio" in result:
-                import base64
                 return base64.b64decode(result["audio"])
         
         logger.error(f"Speech generation failed: {response.error}")
         return None
     
+    def request_speech_to_file(self, text: str, dest_path: Union[str, Path],
+                               voice: Optional[str] = None,
+                               model: Optional[str] = None,
+                               response_format: str = "mp3",
+                               on_chunk: Optional[Callable[[bytes], None]] = None,
+                               key: Optional[str] = None) -> APIResponse:
+        """Generate speech into dest_path, keeping the failure details.
+        
+        Args:
+            on_chunk: Receives the audio as it arrives, e.g. to start
+                playback before the download finishes
+            key: Request identity (see download_to_file)
+        
+        Returns:
+            APIResponse whose data is the written Path on success
+        """
+        data = self._speech_payload(text, voice, model, response_format)
+        
+        return self.download_to_file("/v1/audio/speech", data, dest_path,
+                                     json_field="audio", service="tts",
+                                     on_chunk=on_chunk, key=key)
+    
+    def generate_speech_to_file(self, text: str, dest_path: Union[str, Path],
+                                voice: Optional[str] = None,
+                                model: Optional[str] = None,
+                                response_format: str = "mp3") -> Optional[Path]:
+        """Generate speech and stream the audio straight into dest_path.
+        
+        Returns:
+            Path to the written audio file or None if failed
+        """
+        response = self.request_speech_to_file(text, dest_path, voice, model,
+                                               response_format)
+        if response.success:
+            return response.data
+        
+        logger.error(f"Speech generation failed: {response.error}")
+        return None
+    
+    def _backend_stats(self) -> dict:
+        """Breaker, balancer and scheduler state for stats dumps."""
+        return {
+            'breakers': get_breaker_stats(),
+            'backends': get_balancer_stats(),
+            'scheduler': self.scheduler.get_stats(),
+            'timeouts': self.timeouts.get_stats()
+        }
+    
+    def get_stats(self) -> dict:
+        """Get per-endpoint request metrics plus backend state.
+        
+        Returns:
+            Dictionary with 'endpoints' (latency percentiles, error classes,
+            retries and bytes per endpoint path), 'breakers', 'backends'
+            and 'scheduler'
+        """
+        stats = self.metrics.get_stats()
+        stats.update(self._backend_stats())
+        return stats
+    
     def close(self):
         """Close the session and free resources."""
         self.session.close()
+        self.fail_fast_session.close()
     
     def __enter__(self):
         """Context manager entry."""
@@ -0,0 +1,199 @@
+"""Asyncio client for AI backend communication.
+
+Mirrors the surface of APIClient (chat, generate_text, generate_image,
+generate_speech) as coroutines on a single background event loop. Results
+are handed back to the Ren'Py thread as concurrent.futures.Future objects.
+
+Every call goes through APIClient and the RequestScheduler, at the
+priority and group of the context that submitted it. While a call waits
+for its slot it is only a coroutine (see RequestScheduler.acquire_async);
+a thread is used just for the HTTP exchange once the slot is granted, so
+dozens of calls can be queued with no more threads than scheduler slots.
+"""
+
+import asyncio
+import logging
+import threading
+import contextvars
+import concurrent.futures
+from typing import Any, Callable, Coroutine, Optional
+
+from config import get_config
+from api import APIClient
+from scheduler import current_group, current_priority, request_priority
+
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundLoop:
+    """Runs an asyncio event loop on a single daemon thread."""
+    
+    def __init__(self, name: str = "ai-event-loop"):
+        """Initialize the loop without starting it."""
+        self.name = name
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._started = threading.Event()
+        self._lock = threading.Lock()
+    
+    def start(self) -> asyncio.AbstractEventLoop:
+        """Start the loop thread if it is not already running."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._started.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name=self.name, daemon=True
+                )
+                self._thread.start()
+                self._started.wait()
+        return self.loop
+    
+    def _run(self):
+        """Thread body: own the event loop until stop() is called."""
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._started.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+    
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        """Schedule a coroutine on the loop from any thread."""
+        loop = self.start()
+        return asyncio.run_coroutine_threadsafe(coro, loop)
+    
+    def stop(self, timeout: float = 5.0):
+        """Stop the loop and wait for the thread to exit."""
+        with self._lock:
+            if self.loop is not None and self._thread is not None:
+                self.loop.call_soon_threadsafe(self.loop.stop)
+                self._thread.join(timeout)
+            self._thread = None
+            self.loop = None
+
+
+class AsyncAPIClient:
+    """Asyncio client with the same generation surface as APIClient."""
+    
+    def __init__(self, config=None, client: Optional[APIClient] = None,
+                 background: Optional[BackgroundLoop] = None):
+        """Initialize async client.
+        
+        Args:
+            config: Configuration (defaults to get_config())
+            client: APIClient that makes the requests (created if omitted)
+            background: Event loop to run on (created if omitted)
+        """
+        self.config = config or get_config()
+        self._owns_client = client is None
+        self.client = client or APIClient(self.config)
+        self.scheduler = self.client.scheduler
+        self.background = background or BackgroundLoop()
+        
+        # Only calls holding a scheduler slot run here, so it never needs
+        # more threads than there are slots
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.scheduler.total_slots,
+            thread_name_prefix="ai-async"
+        )
+    
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        """Run a coroutine on the background loop and return its future.
+        
+        The coroutine's requests keep the caller's priority and group:
+        
+            with request_priority(Priority.PREFETCH, group="scene_2"):
+                future = client.submit(client.generate_speech("Hello"))
+            ...
+            if future.done():
+                audio = future.result()
+        """
+        priority, group = current_priority(), current_group()
+        
+        async def run():
+            with request_priority(priority, group):
+                return await coro
+        
+        return self.background.submit(run())
+    
+    async def _call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run an APIClient call once the scheduler grants it a slot.
+        
+        Raises:
+            RequestCancelled: If the call is cancelled while queued
+        """
+        waiter = await self.scheduler.acquire_async()
+        
+        def run():
+            try:
+                with self.scheduler.holding(waiter):
+                    return fn(*args, **kwargs)
+            finally:
+                self.scheduler.release(waiter)
+        
+        # The thread releases the slot, so a cancelled await cannot
+        # free it while the request is still on the wire
+        try:
+            future = asyncio.get_running_loop().run_in_executor(
+                self._executor, contextvars.copy_context().run, run
+            )
+        except BaseException:
+            self.scheduler.release(waiter)
+            raise
+        return await future
+    
+    async def generate_text(self, prompt: str, model: Optional[str] = None,
+                            temperature: float = 0.7,
+                            max_tokens: int = 2000) -> Optional[str]:
+        """Generate text using the /api/generate endpoint."""
+        return await self._call(self.client.generate_text, prompt, model,
+                                temperature, max_tokens)
+    
+    async def chat(self, messages: list, model: Optional[str] = None,
+                   temperature: float = 0.7, max_tokens: int = 2000) -> Optional[str]:
+        """Chat using OpenAI-compatible endpoint."""
+        return await self._call(self.client.chat, messages, model,
+                                temperature, max_tokens)
+    
+    async def generate_image(self, prompt: str, negative_prompt: str = "",
+                             width: int = 768, height: int = 512,
+                             steps: int = 20, cfg_scale: float = 7.0) -> Optional[bytes]:
+        """Generate image using Stable Diffusion WebUI."""
+        return await self._call(self.client.generate_image, prompt, negative_prompt,
+                                width, height, steps, cfg_scale)
+    
+    async def generate_speech(self, text: str, voice: Optional[str] = None,
+                              model: Optional[str] = None,
+                              response_format: str = "mp3") -> Optional[bytes]:
+        """Generate speech using TTS endpoint."""
+        return await self._call(self.client.generate_speech, text, voice,
+                                model, response_format)
+    
+    def close(self):
+        """Stop the background loop and free resources."""
+        self.background.stop()
+        self._executor.shutdown(wait=False)
+        if self._owns_client:
+            self.client.close()
+    
+    def __enter__(self):
+        """Context manager entry."""
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Context manager exit."""
+        self.close()
+
+
+# Global async client instance
+_async_client: Optional[AsyncAPIClient] = None
+
+
+def get_async_client() -> AsyncAPIClient:
+    """Get or create the global async client instance."""
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncAPIClient()
+    return _async_client
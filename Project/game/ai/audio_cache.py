@@ -1,20 +1,111 @@
-"""Audio caching system for TTS with content-based hashing."""
+"""Audio caching system for TTS with content-based hashing.
+
+Files are sharded by the first two hex digits of their key
+(cache_dir/xx/{key}.{format}), so no directory grows to tens of thousands
+of entries; the index keys them by that relative path. Caches written with
+the old flat layout are moved into shards once, on first open. Each file
+gets a lip-sync envelope sidecar ({key}.lip, see lipsync.py) when cached.
+"""
 
 import os
-import hashlib
+import time
 import logging
-from typing import Optional, Tuple
+import warnings
+import threading
+import contextvars
+from concurrent.futures import Future, CancelledError, ThreadPoolExecutor, TimeoutError
+from typing import BinaryIO, Callable, Hashable, List, Optional, Tuple, Union
 from pathlib import Path
 
 from config import get_config
 from api import APIClient
+from singleflight import SingleFlight, payload_key
+from scheduler import (Priority, RequestCancelled, RequestScheduler, current_group,
+                       current_priority, request_priority)
+from cache_index import CacheIndex
+from eviction import get_evictor
+from memcache import get_memory_cache, invalidator, PRESENT
+from fileutil import KeyLocks, replace_file, staging_path
+from cachekey import content_key, legacy_tts_key, needs_rekey
+from cleanup import CleanupJob, ENTRY_NAME, get_cleaner
+from negcache import NegativeCache
+from prefetch import PrefetchPool
+from tts_stream import TTSStream
+from chunking import split_for_tts
+from lipsync import LipEnvelope, analyze, read_envelope, sidecar_path, write_envelope
+from bundle import (BundleError, TTS_ROOT, copy_verified, export_bundle,
+                    import_bundle, get_bundles)
 
 
 logger = logging.getLogger(__name__)
 
 
+# Index meta setting recording that flat files were moved into shards
+LAYOUT_META = "tts_layout"
+LAYOUT_SHARDED = "sharded"
+
+# Flat files moved per index transaction
+SHARD_BATCH = 1000
+
+
+class _Generation:
+    """A line being generated, shared with the callers that join it.
+    
+    Joining callers raise the request to their priority, and get the audio
+    received so far and then the rest as it arrives.
+    """
+    
+    def __init__(self, priority: Priority):
+        self.priority = priority
+        self.request_key: Optional[str] = None
+        self._lock = threading.Lock()
+        self._received = bytearray()
+        self._listeners: List[Callable[[bytes], None]] = []
+    
+    @property
+    def received(self) -> int:
+        """Bytes of audio received so far."""
+        with self._lock:
+            return len(self._received)
+    
+    def start(self, request_key: str) -> Priority:
+        """Record the request about to be made.
+        
+        Returns:
+            Priority to make it at (raised by callers that joined early)
+        """
+        with self._lock:
+            self.request_key = request_key
+            return self.priority
+    
+    def join(self, priority: Priority, on_chunk: Optional[Callable[[bytes], None]],
+             scheduler: RequestScheduler):
+        """Add a caller at priority, feeding it the audio if on_chunk is given."""
+        with self._lock:
+            if on_chunk is not None:
+                if self._received:
+                    on_chunk(bytes(self._received))
+                self._listeners.append(on_chunk)
+            if priority >= self.priority:
+                return
+            self.priority = priority
+            request_key = self.request_key
+        
+        # A request still queued as a prefetch must not keep the player waiting
+        if request_key is not None:
+            scheduler.boost(request_key, priority)
+    
+    def feed(self, data: bytes):
+        """Pass audio as it arrives to every caller listening."""
+        with self._lock:
+            self._received += data
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(data)
+
+
 class AudioCache:
-    """Manages TTS audio caching with SHA256-based keys."""
+    """Manages TTS audio caching keyed by every generation parameter."""
     
     def __init__(self, cache_dir: Optional[str] = None):
         """Initialize audio cache manager.
@@ -41,50 +132,148 @@ class AudioCache:
         # Ensure cache directory exists
         self.cache_dir.mkdir(parents=True, exist_ok=True)
         
+        # Size, access and generation cost of every file, for eviction
+        self.index = CacheIndex(self.cache_dir)
+        self.index.import_legacy(flat_type='tts')
+        self._shard_flat_files()
+        
+        # Files under version 1 keys are re-keyed when first looked up
+        self.legacy_keys = needs_rekey(self.index)
+        self.evictor = get_evictor()
+        self.evictor.register(self.index)
+        
+        # Housekeeping (stale temp files, untracked files) in time slices;
+        # pre-generated audio does not expire
+        self.cleanup = CleanupJob(self.index, single_type='tts')
+        get_cleaner().register(self.cleanup)
+        
+        # Remembers which lines are on disk, so repeat lookups skip the stat
+        self.memory = get_memory_cache()
+        self.index.add_listener(invalidator(self.memory, self.cache_dir))
+        
+        # Read-only lower tier of shipped bundles
+        self.bundles = get_bundles()
+        
+        # Lines whose generation failed recently, with backoff
+        self.negative = NegativeCache(self.index)
+        
         # API client for TTS generation
         self.api_client = APIClient(self.config)
         
+        # Generates upcoming lines ahead of playback
+        self.prefetcher = PrefetchPool(self.config.prefetch_slots,
+                                       self.config.prefetch_queue_size,
+                                       name="tts-prefetch")
+        
+        # Synthesizes the sentence chunks of a line in parallel
+        self._chunk_pool = ThreadPoolExecutor(self.config.tts_chunk_workers,
+                                              thread_name_prefix="tts-chunk")
+        
+        # Files whose missing lip-sync envelope is being computed
+        self._lipsync_pending = set()
+        self._lipsync_lock = threading.Lock()
+        
+        # Coalesces concurrent generations of the same line
+        self._inflight = SingleFlight()
+        
+        # Serializes publishing of the same file across threads and processes
+        self.locks = KeyLocks(self.cache_dir / ".locks")
+        
         # Supported audio formats
         self.supported_formats = ['mp3', 'wav', 'ogg']
         self.default_format = 'mp3'
         
         logger.info(f"Audio cache initialized at: {self.cache_dir}")
     
-    def _generate_cache_key(self, text: str, voice: str) -> str:
-        """Generate cache key from text and voice.
+    def _tts_params(self, text: str, voice: str, format: str) -> dict:
+        """Every parameter that determines the generated audio."""
+        return {
+            "input": text,
+            "voice": voice,
+            "model": self.config.tts_model,
+            "response_format": format
+        }
+    
+    def _generate_cache_key(self, text: str, voice: str, format: str = None) -> str:
+        """Generate cache key from the TTS parameters.
         
         Args:
             text: Text content to speak
             voice: Voice ID/name
-            
+            format: Audio format
+        
         Returns:
-            SHA256 hash of voice + text
+            Versioned key over text, voice, model and format
         """
-        content = f"{voice}:{text}"
-        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+        return content_key(self._tts_params(text, voice, format or self.default_format))
     
     def _get_cache_path(self, cache_key: str, format: str = None) -> Path:
         """Get full path for cached audio file.
         
         Args:
-            cache_key: SHA256 cache key
+            cache_key: Cache key
             format: Audio format (mp3, wav, ogg)
-            
+        
         Returns:
             Path to cached file
         """
         format = format or self.default_format
-        return self.cache_dir / f"{cache_key}.{format}"
+        return self._path_for_name(f"{cache_key}.{format}")
+    
+    def _path_for_name(self, name: str) -> Path:
+        """Sharded path of an audio file name."""
+        return self.cache_dir / name[:2] / name
+    
+    def _shard_flat_files(self) -> int:
+        """Move audio files of the flat layout into their shard directories.
+        
+        Runs once per cache directory. Index entries are renamed with their
+        files, a batch per transaction, so an interrupted move resumes on
+        the next start. Failures recorded under flat keys are dropped.
+        
+        Returns:
+            Number of files moved
+        """
+        if self.index.get_meta(LAYOUT_META) == LAYOUT_SHARDED:
+            return 0
+        
+        with os.scandir(self.cache_dir) as it:
+            names = [entry.name for entry in it
+                     if entry.is_file(follow_symlinks=False) and ENTRY_NAME.match(entry.name)]
+        
+        moved = 0
+        for start in range(0, len(names), SHARD_BATCH):
+            moves = []
+            for name in names[start:start + SHARD_BATCH]:
+                target = self._path_for_name(name)
+                try:
+                    target.parent.mkdir(exist_ok=True)
+                    os.replace(self.cache_dir / name, target)
+                except OSError as e:
+                    logger.warning(f"Failed to move {name} into its shard: {e}")
+                    continue
+                moves.append((name, self.index.key_for(target)))
+            self.index.rename_many(moves)
+            moved += len(moves)
+        
+        self.index.remove_failures()
+        self.index.set_meta(LAYOUT_META, LAYOUT_SHARDED)
+        if moved:
+            logger.info(f"Moved {moved} TTS files into shard directories")
+        return moved
     
     def get_tts_cached(self, text: str, voice: Optional[str] = None,
-                      format: str = None) -> Optional[str]:
+                      format: str = None,
+                      on_chunk: Optional[Callable[[bytes], None]] = None) -> Optional[str]:
         """Get cached TTS audio or generate if missing.
         
         Args:
             text: Text to speak
             voice: Voice to use (defaults to config)
             format: Audio format
-            
+            on_chunk: Receives the audio as it downloads, also when this
+                call joins a generation of the line already in flight
+        
         Returns:
             Path to audio file or None if failed
         """
@@ -93,25 +282,304 @@ class AudioCache:
         format = format or self.default_format
         
         # Generate cache key
-        cache_key = self._generate_cache_key(text, voice)
+        cache_key = self._generate_cache_key(text, voice, format)
         cache_path = self._get_cache_path(cache_key, format)
+        entry_key = self.index.key_for(cache_path)
         
-        # Check if cached file exists
+        # Check if cached file exists (in memory first, then on disk)
+        memory_key = (self.cache_dir, entry_key)
+        if self.memory.get(memory_key) is not None:
+            self.index.touch(entry_key)
+            return str(cache_path)
+        
+        version = self.index.version
         if cache_path.exists():
             logger.debug(f"Cache hit for TTS: {cache_key[:8]}...")
+            self.index.touch(entry_key)
+            if self.index.version == version:
+                self.memory.put(memory_key, PRESENT)
             return str(cache_path)
         
-        # Generate new TTS audio
-        logger.info(f"Cache miss, generating TTS for: {text[:50]}...")
-        audio_data = self._generate_tts(text, voice)
+        if self.legacy_keys and self.rekey(text, voice, format):
+            return str(cache_path)
         
-        if audio_data:
-            # Cache the audio data
-            if self.cache_tts(audio_data, cache_key, format):
-                return str(cache_path)
+        if self.bundles and self._from_bundle(cache_path):
+            return str(cache_path)
+        
+        # Known-bad lines fail fast until their backoff expires
+        failure = self.negative.check(entry_key)
+        if failure is not None:
+            logger.debug(f"TTS for {cache_key[:8]}... failed recently ({failure.error_class})")
+            return None
+        
+        # Generate new TTS audio; concurrent callers for the same line
+        # share one request and one cache write
+        path, joined = self._generate_shared(text, voice, cache_key, format, on_chunk)
+        if path is None and joined is not None and current_priority() == Priority.INTERACTIVE:
+            # The generation joined (e.g. a prefetch) failed or was
+            # cancelled, but the player is waiting for this line
+            logger.debug(f"Joined TTS generation failed, retrying: {cache_key[:8]}...")
+            path, _ = self._generate_shared(text, voice, cache_key, format,
+                                            None if joined.received else on_chunk)
+        return path
+    
+    def _generate_shared(self, text: str, voice: str, cache_key: str, format: str,
+                         on_chunk: Optional[Callable[[bytes], None]]
+                         ) -> Tuple[Optional[str], Optional[_Generation]]:
+        """Generate a line, or join its generation already in flight.
+        
+        A caller joining raises the request to its own priority and still
+        receives the audio through on_chunk.
+        
+        Returns:
+            (path to the audio or None if failed, the generation joined or
+            None if this caller led it)
+        """
+        priority = current_priority()
+        generation = _Generation(priority)
+        if on_chunk is not None:
+            generation.join(priority, on_chunk, self.api_client.scheduler)
+        joined = []
+        
+        def join(leading: _Generation):
+            joined.append(leading)
+            leading.join(priority, on_chunk, self.api_client.scheduler)
+        
+        try:
+            path = self._inflight.do(
+                (cache_key, format),
+                lambda: self._generate_and_cache(text, voice, cache_key, format, generation),
+                shared=generation, on_join=join
+            )
+        except RequestCancelled:
+            path = None
+        return path, (joined[0] if joined else None)
+    
+    def split_text(self, text: str) -> List[str]:
+        """Parts a line is synthesized and cached as.
+        
+        Long lines are split into sentence and clause chunks (see
+        chunking.py); a line that stays whole keeps its own text, and so
+        its key.
+        """
+        if self.config.tts_chunking:
+            chunks = split_for_tts(text, self.config.tts_chunk_max_chars)
+            if len(chunks) > 1:
+                return chunks
+        return [text]
+    
+    def _parts(self, text: str, voice: str, format: str) -> List[Tuple[str, str, Path]]:
+        """(text, cache key, cache path) of each part of a line."""
+        parts = []
+        for part in self.split_text(text):
+            cache_key = self._generate_cache_key(part, voice, format)
+            parts.append((part, cache_key, self._get_cache_path(cache_key, format)))
+        return parts
+    
+    def _is_cached(self, cache_path: Path) -> bool:
+        """Quick check for a cached file (memory, then disk)."""
+        return (self.memory.get((self.cache_dir, self.index.key_for(cache_path))) is not None
+                or cache_path.exists())
+    
+    def _submit_part(self, text: str, voice: str, format: str) -> Future:
+        """Synthesize a part on the chunk workers, at the caller's priority."""
+        context = contextvars.copy_context()
+        return self._chunk_pool.submit(context.run, self.get_tts_cached, text, voice, format)
+    
+    def get_tts_parts(self, text: str, voice: Optional[str] = None,
+                      format: str = None) -> Optional[List[str]]:
+        """Get cached TTS audio of a line's parts, synthesizing them in parallel.
+        
+        Args:
+            text: Text to speak
+            voice: Voice to use (defaults to config)
+            format: Audio format
+        
+        Returns:
+            Paths to the audio of each part, in order, or None if any failed
+        """
+        voice = voice or self.config.tts_voice
+        format = format or self.default_format
+        parts = self.split_text(text)
+        if len(parts) == 1:
+            path = self.get_tts_cached(text, voice, format)
+            return [path] if path else None
+        
+        futures = [self._submit_part(part, voice, format) for part in parts]
+        paths = [future.result() for future in futures]
+        return paths if all(paths) else None
+    
+    def stream_tts(self, text: str, voice: Optional[str] = None,
+                   format: str = None) -> TTSStream:
+        """Get a line's audio, with playable items while it generates.
+        
+        Returns at once. Cached lines complete right away with their files.
+        Otherwise the first part streams segments as its audio arrives,
+        while the remaining sentence chunks are synthesized in parallel and
+        follow as files (see tts_stream.py). Everything is cached as usual.
+        
+        Args:
+            text: Text to speak
+            voice: Voice to use (defaults to config)
+            format: Audio format
+        
+        Returns:
+            TTSStream of the line
+        """
+        voice = voice or self.config.tts_voice
+        format = format or self.default_format
+        parts = self._parts(text, voice, format)
+        
+        if all(self._is_cached(path) for _, _, path in parts):
+            for _, _, path in parts:
+                self.index.touch(self.index.key_for(path))
+            return TTSStream.finished([path for _, _, path in parts])
+        
+        stream = TTSStream(format, self.config.tts_stream_first_seconds,
+                           self.config.tts_stream_segment_seconds)
+        futures = [self._submit_part(part, voice, format) for part, _, _ in parts[1:]]
+        
+        def run():
+            try:
+                path = self.get_tts_cached(parts[0][0], voice, format, on_chunk=stream.feed)
+                stream.end_part(path)
+                for future in futures:
+                    stream.end_part(future.result())
+                stream.finish()
+            except Exception as e:
+                logger.error(f"TTS stream error: {e}")
+                stream.finish(str(e))
+        
+        threading.Thread(target=run, name="tts-stream", daemon=True).start()
+        return stream
+    
+    def _generate_and_cache(self, text: str, voice: str, cache_key: str,
+                            format: str, generation: _Generation) -> Optional[str]:
+        """Generate TTS audio and write it to the cache.
+        
+        Returns:
+            Path to audio file or None if failed
+        """
+        cache_path = self._get_cache_path(cache_key, format)
+        
+        # Another caller may have finished since the cache check
+        if cache_path.exists():
+            return str(cache_path)
+        
+        logger.info(f"Cache miss, generating TTS for: {text[:50]}...")
+        if self._generate_tts_to_file(text, voice, cache_path, format, generation):
+            return str(cache_path)
         
         return None
     
+    def _from_bundle(self, cache_path: Path) -> bool:
+        """Copy a file from a mounted bundle into the cache.
+        
+        Returns:
+            True if a bundle held the file
+        """
+        for bundle in self.bundles:
+            # Bundles exported before sharding key files by name alone
+            entry = (bundle.get(TTS_ROOT, self.index.key_for(cache_path))
+                     or bundle.get(TTS_ROOT, cache_path.name))
+            if entry is None:
+                continue
+            try:
+                with bundle.open(entry) as src:
+                    self.import_entry(entry, src)
+            except (BundleError, OSError) as e:
+                logger.error(f"Failed to copy {cache_path.name} from bundle {bundle.path}: {e}")
+                continue
+            logger.debug(f"Bundle hit for TTS: {cache_path.name[:8]}...")
+            return True
+        return False
+    
+    def open_entry(self, key: str) -> BinaryIO:
+        """Stream a cached audio file.
+        
+        Raises:
+            FileNotFoundError: If the file is not cached
+        """
+        return open(self.index.path_for(key), 'rb')
+    
+    def import_entry(self, entry: dict, src: BinaryIO):
+        """Install an audio file from a bundle.
+        
+        Args:
+            entry: Bundle manifest entry
+            src: Stream of the file's data
+        
+        Raises:
+            BundleError: If the data fails verification
+        """
+        cache_path = self._path_for_name(Path(entry['key']).name)
+        entry_key = self.index.key_for(cache_path)
+        with staging_path(cache_path) as staged:
+            with open(staged, 'wb') as f:
+                copy_verified(src, f, entry)
+            with self.locks.hold(cache_path.name):
+                replace_file(staged, cache_path)
+                self.index.put(entry_key, 'tts', entry['size'],
+                               created=entry['created'], cost=entry['cost'])
+        self._write_lipsync(cache_path)
+        self.memory.put((self.cache_dir, entry_key), PRESENT)
+        self.evictor.notify()
+    
+    def export_bundle(self, dest: Union[str, Path], min_hits: int = 0,
+                      max_age_days: Optional[float] = None) -> dict:
+        """Export cached audio into a bundle (see bundle.export_bundle)."""
+        return export_bundle(dest, audio_cache=self, min_hits=min_hits,
+                             max_age_days=max_age_days)
+    
+    def import_bundle(self, path: Union[str, Path], overwrite: bool = False) -> dict:
+        """Install a bundle's audio files (see bundle.import_bundle)."""
+        return import_bundle(path, audio_cache=self, overwrite=overwrite)
+    
+    def rekey(self, text: str, voice: Optional[str] = None, format: str = None,
+              dry_run: bool = False) -> bool:
+        """Move a file stored under its version 1 key to its current key.
+        
+        Version 1 keys covered only voice and text, so the file is adopted
+        as output of the currently configured model.
+        
+        Args:
+            text: Text the file was generated from
+            voice: Voice it was generated with
+            format: Audio format
+            dry_run: Only check whether there is a file to move
+        
+        Returns:
+            True if a file was (or would be) re-keyed
+        """
+        voice = voice or self.config.tts_voice
+        format = format or self.default_format
+        legacy_path = self._get_cache_path(legacy_tts_key(text, voice), format)
+        cache_path = self._get_cache_path(self._generate_cache_key(text, voice, format), format)
+        
+        with self.locks.hold(cache_path.name):
+            if not legacy_path.exists():
+                return False
+            if dry_run:
+                return True
+            
+            # A newer file was generated already; the old one is redundant
+            if cache_path.exists():
+                self.index.delete_entries([self.index.key_for(legacy_path)])
+                legacy_path.unlink(missing_ok=True)
+                return False
+            
+            cache_path.parent.mkdir(exist_ok=True)
+            os.replace(legacy_path, cache_path)
+            renamed = self.index.rename(self.index.key_for(legacy_path),
+                                        self.index.key_for(cache_path))
+            if not renamed:
+                self._index_file(cache_path)
+        
+        if not renamed:
+            self._write_lipsync(cache_path)
+        logger.debug(f"Re-keyed TTS audio: {legacy_path.name} -> {cache_path.name}")
+        return True
+    
     def cache_tts(self, audio_data: bytes, cache_key: str, 
                   format: str = None) -> bool:
         """Save audio data to cache.
@@ -120,7 +588,7 @@ class AudioCache:
             audio_data: Raw audio bytes
             cache_key: Cache key for the file
             format: Audio format
-            
+        
         Returns:
             True if cached successfully
         """
@@ -128,93 +596,262 @@ class AudioCache:
             format = format or self.default_format
             cache_path = self._get_cache_path(cache_key, format)
             
-            # Write audio data to file
-            with open(cache_path, 'wb') as f:
-                f.write(audio_data)
+            # Write to a temp file and rename, so a player or another
+            # writer never sees a partial file
+            with staging_path(cache_path) as staged:
+                staged.write_bytes(audio_data)
+                self._publish(staged, cache_path)
             
             logger.info(f"Cached TTS audio: {cache_key[:8]}... ({len(audio_data)} bytes)")
             return True
-            
+        
         except Exception as e:
             logger.error(f"Failed to cache TTS audio: {e}")
             return False
     
-    def _generate_tts(self, text: str, voice: str) -> Optional[bytes]:
-        """Generate TTS audio using API.
+    def _generate_tts_to_file(self, text: str, voice: str, cache_path: Path,
+                              format: str, generation: _Generation) -> bool:
+        """Generate TTS audio into a temp file, then publish it to the cache.
         
         Args:
             text: Text to speak
             voice: Voice to use
-            
+            cache_path: Final cache file path
+            format: Audio format
+            generation: Shared state of the generation, which receives the
+                audio as it arrives and sets the request's priority
+        
         Returns:
-            Audio data bytes or None if failed
+            True if the audio was generated and cached
         """
         try:
-            audio_data = self.api_client.generate_speech(text, voice)
-            if audio_data:
-                logger.info(f"Generated TTS audio: {len(audio_data)} bytes")
-                return audio_data
+            start = time.monotonic()
+            # Generated without holding the lock, so other lines (and
+            # other processes) are never kept waiting on this request
+            with staging_path(cache_path) as staged:
+                request_key = payload_key('tts', str(staged))
+                priority = generation.start(request_key)
+                with request_priority(priority, current_group()):
+                    response = self.api_client.request_speech_to_file(
+                        text, staged, voice, model=self.config.tts_model,
+                        response_format=format, on_chunk=generation.feed,
+                        key=request_key
+                    )
+                if response.success:
+                    size = self._publish(staged, cache_path,
+                                         cost=time.monotonic() - start)
+            if response.success:
+                self.negative.clear(self.index.key_for(cache_path))
+                logger.info(f"Generated TTS audio: {size} bytes")
+                return True
             else:
-                logger.error("TTS generation returned no data")
-                return None
-                
+                logger.error(f"TTS generation failed: {response.error}")
+                self.negative.record(self.index.key_for(cache_path),
+                                     response.failure_class, response.error)
+                return False
+        
         except Exception as e:
             logger.error(f"TTS generation error: {e}")
+            self.negative.record(self.index.key_for(cache_path), type(e).__name__, str(e))
+            return False
+    
+    def _publish(self, staged: Path, cache_path: Path, cost: float = 0.0) -> int:
+        """Move a finished file into the cache and index it.
+        
+        If another writer published the file first, that copy is kept and
+        staged is left for its owner to remove.
+        
+        Returns:
+            File size in bytes
+        """
+        with self.locks.hold(cache_path.name):
+            if cache_path.exists():
+                return cache_path.stat().st_size
+            replace_file(staged, cache_path)
+            size = self._index_file(cache_path, cost)
+        self._write_lipsync(cache_path)
+        return size
+    
+    def _index_file(self, cache_path: Path, cost: float = 0.0) -> int:
+        """Record a newly written audio file in the index.
+        
+        Returns:
+            File size in bytes
+        """
+        size = cache_path.stat().st_size
+        entry_key = self.index.key_for(cache_path)
+        self.index.put(entry_key, 'tts', size, cost=cost)
+        self.memory.put((self.cache_dir, entry_key), PRESENT)
+        self.evictor.notify()
+        return size
+    
+    def _write_lipsync(self, cache_path: Path) -> Optional[LipEnvelope]:
+        """Compute and store the lip-sync envelope of a cached file.
+        
+        Returns:
+            The envelope, or None if disabled or the format has none
+        """
+        if not self.config.lipsync:
             return None
+        try:
+            envelope = analyze(cache_path, self.config.lipsync_fps)
+            if envelope is not None:
+                write_envelope(cache_path, envelope)
+            return envelope
+        except Exception as e:
+            logger.warning(f"Lip-sync analysis of {cache_path.name} failed: {e}")
+            return None
+    
+    def get_lipsync(self, path: Union[str, Path]) -> Optional[LipEnvelope]:
+        """Get the lip-sync envelope stored for a cached file.
+        
+        Only reads the sidecar, so it is safe on the render thread. Files
+        cached without one (before envelopes existed, or by another
+        version) get it computed on a chunk worker; until then this
+        returns None.
+        
+        Args:
+            path: Cached audio file
+        
+        Returns:
+            The envelope, or None if it is not available (yet)
+        """
+        envelope = read_envelope(path)
+        if envelope is not None or not self.config.lipsync:
+            return envelope
+        
+        path = Path(path)
+        with self._lipsync_lock:
+            if path in self._lipsync_pending or not path.exists():
+                return None
+            self._lipsync_pending.add(path)
+        
+        def compute():
+            try:
+                if path.exists():
+                    self._write_lipsync(path)
+            finally:
+                with self._lipsync_lock:
+                    self._lipsync_pending.discard(path)
+        
+        self._chunk_pool.submit(compute)
+        return None
     
-    def prefetch_tts(self, text: str, voice: Optional[str] = None) -> bool:
-        """Prefetch TTS audio without blocking.
+    def prefetch_tts(self, text: str, voice: Optional[str] = None,
+                     format: str = None, group: Optional[Hashable] = None) -> bool:
+        """Queue TTS generation on the prefetch workers without blocking.
+        
+        Each part of the line (see split_text) is queued on its own. A part
+        already queued or generating is not queued again; playing the line
+        meanwhile joins the running generation.
         
         Args:
             text: Text to prefetch
             voice: Voice to use
+            format: Audio format
+            group: Tag for cancel_prefetch(), e.g. the scene name
+        
+        Returns:
+            True if every part is already cached or queued
+        """
+        voice = voice or self.config.tts_voice
+        format = format or self.default_format
+        
+        ready = True
+        for part, cache_key, cache_path in self._parts(text, voice, format):
+            # Already cached
+            if cache_path.exists():
+                continue
+            if not self.config.enable_prefetch:
+                ready = False
+                continue
             
+            future = self.prefetcher.submit(
+                (cache_key, format),
+                lambda part=part: self.get_tts_cached(part, voice, format),
+                group
+            )
+            ready = ready and future is not None
+        return ready
+    
+    def get_prefetch(self, text: str, voice: Optional[str] = None,
+                     format: str = None) -> Optional[Future]:
+        """Get the Future of a queued or generating prefetch of a line.
+        
+        For a line split into chunks this is its first chunk, which is
+        what playback has to wait for.
+        
         Returns:
-            True if already cached or generation started
+            Future resolving to the audio path (or None if generation
+            failed), or None if the line is not being prefetched
         """
         voice = voice or self.config.tts_voice
-        cache_key = self._generate_cache_key(text, voice)
-        cache_path = self._get_cache_path(cache_key)
+        format = format or self.default_format
+        _, cache_key, _ = self._parts(text, voice, format)[0]
+        return self.prefetcher.future((cache_key, format))
+    
+    def wait_prefetch(self, text: str, voice: Optional[str] = None,
+                      format: str = None,
+                      timeout: Optional[float] = None) -> Optional[List[str]]:
+        """Wait for a line's prefetch to finish.
         
-        # Already cached
-        if cache_path.exists():
-            return True
+        Args:
+            text: Text of the line
+            voice: Voice to use
+            format: Audio format
+            timeout: Seconds to wait at most (None waits until done)
         
-        # In a real implementation, this would start async generation
-        # For now, we'll just note it for future implementation
-        logger.debug(f"Prefetch requested for: {text[:50]}...")
-        return True
+        Returns:
+            Paths to the audio of each part, or None if not all are ready
+        """
+        voice = voice or self.config.tts_voice
+        format = format or self.default_format
+        deadline = None if timeout is None else time.monotonic() + timeout
+        
+        paths = []
+        for _, cache_key, cache_path in self._parts(text, voice, format):
+            future = self.prefetcher.future((cache_key, format))
+            if future is not None:
+                remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+                try:
+                    future.result(remaining)
+                except (CancelledError, TimeoutError):
+                    return None
+            if not cache_path.exists():
+                return None
+            paths.append(str(cache_path))
+        return paths
+    
+    def cancel_prefetch(self, group: Optional[Hashable] = None) -> int:
+        """Cancel queued prefetches, e.g. when jumping scenes.
+        
+        Args:
+            group: Only cancel prefetches tagged with this group
+        
+        Returns:
+            Number of queued lines and requests cancelled (see
+            PrefetchPool.cancel)
+        """
+        return self.prefetcher.cancel(group)
     
     def get_cache_stats(self) -> dict:
         """Get cache statistics.
         
+        File count and size are the index's running totals, so this is
+        cheap enough to call while drawing a screen.
+        
         Returns:
             Dict with cache stats
         """
-        try:
-            # Count cached files
-            cached_files = list(self.cache_dir.glob("*.mp3")) + \
-                          list(self.cache_dir.glob("*.wav")) + \
-                          list(self.cache_dir.glob("*.ogg"))
-            
-            # Calculate total size
-            total_size = sum(f.stat().st_size for f in cached_files)
-            
-            return {
-                "cache_dir": str(self.cache_dir),
-                "total_files": len(cached_files),
-                "total_size": total_size,
-                "total_size_mb": round(total_size / (1024 * 1024), 2)
-            }
-            
-        except Exception as e:
-            logger.error(f"Failed to get cache stats: {e}")
-            return {
-                "cache_dir": str(self.cache_dir),
-                "total_files": 0,
-                "total_size": 0,
-                "total_size_mb": 0
-            }
+        stats = self.index.stats().get('tts', {'files': 0, 'size': 0})
+        return {
+            "cache_dir": str(self.cache_dir),
+            "total_files": stats['files'],
+            "total_size": stats['size'],
+            "total_size_mb": round(stats['size'] / (1024 * 1024), 2),
+            "negative": self.negative.get_stats(),
+            "prefetch": self.prefetcher.get_stats()
+        }
     
     def clear_cache(self) -> int:
         """Clear all cached audio files.
@@ -223,34 +860,34 @@ class AudioCache:
             Number of files removed
         """
         try:
-            files_removed = 0
-            for format in self.supported_formats:
-                for file in self.cache_dir.glob(f"*.{format}"):
-                    file.unlink()
-                    files_removed += 1
-            
+            # Deleted through the index (and so the totals), no directory walk
+            keys = self.index.keys('tts')
+            for key in keys:
+                sidecar_path(self.index.path_for(key)).unlink(missing_ok=True)
+            files_removed = len(self.index.delete_entries(keys))
+            self.negative.clear_all()
             logger.info(f"Cleared {files_removed} cached audio files")
             return files_removed
-            
+        
         except Exception as e:
             logger.error(f"Failed to clear cache: {e}")
             return 0
     
-    def verify_cache(self, text: str, voice: Optional[str] = None) -> bool:
+    def verify_cache(self, text: str, voice: Optional[str] = None,
+                     format: str = None) -> bool:
         """Check if TTS audio is cached without generating.
         
         Args:
             text: Text to check
             voice: Voice to check
-            
+            format: Audio format
+        
         Returns:
-            True if cached, False otherwise
+            True if every part of the line is cached, False otherwise
         """
         voice = voice or self.config.tts_voice
-        cache_key = self._generate_cache_key(text, voice)
-        cache_path = self._get_cache_path(cache_key)
-        
-        return cache_path.exists()
+        format = format or self.default_format
+        return all(self._is_cached(path) for _, _, path in self._parts(text, voice, format))
 
 
 # Global audio cache instance
@@ -273,29 +910,88 @@ def get_audio_cache() -> AudioCache:
 def get_or_generate_tts(text: str, voice: Optional[str] = None) -> Optional[str]:
     """Get cached TTS or generate new.
     
+    Deprecated: use get_tts_parts(), which returns every part of a line
+    that is split into sentence chunks.
+    
     Args:
         text: Text to speak
         voice: Voice to use
-        
+    
     Returns:
-        Path to audio file or None
+        Path to audio file, or None if failed or the line has several parts
+    """
+    warnings.warn("get_or_generate_tts() is deprecated, use get_tts_parts()",
+                  DeprecationWarning, stacklevel=2)
+    paths = get_tts_parts(text, voice)
+    if paths is not None and len(paths) > 1:
+        logger.warning(f"Line has {len(paths)} parts, use get_tts_parts(): {text[:50]}...")
+        return None
+    return paths[0] if paths else None
+
+
+def get_tts_parts(text: str, voice: Optional[str] = None) -> Optional[List[str]]:
+    """Get cached TTS of a line's sentence chunks, or generate them in parallel.
+    
+    Args:
+        text: Text to speak
+        voice: Voice to use
+    
+    Returns:
+        Paths to the audio of each part, in order, or None
+    """
+    cache = get_audio_cache()
+    return cache.get_tts_parts(text, voice)
+
+
+def stream_tts(text: str, voice: Optional[str] = None) -> TTSStream:
+    """Get TTS audio as playable segments while it generates.
+    
+    Args:
+        text: Text to speak
+        voice: Voice to use
+    
+    Returns:
+        TTSStream of the line
     """
     cache = get_audio_cache()
-    return cache.get_tts_cached(text, voice)
+    return cache.stream_tts(text, voice)
 
 
-def prefetch_tts(text: str, voice: Optional[str] = None) -> bool:
+def prefetch_tts(text: str, voice: Optional[str] = None,
+                 group: Optional[Hashable] = None) -> bool:
     """Prefetch TTS audio for later use.
     
     Args:
         text: Text to prefetch
         voice: Voice to use
-        
+        group: Tag for cancel_tts_prefetch()
+    
+    Returns:
+        True if cached or prefetch queued
+    """
+    cache = get_audio_cache()
+    return cache.prefetch_tts(text, voice, group=group)
+
+
+def wait_for_tts(text: str, voice: Optional[str] = None,
+                 timeout: Optional[float] = None) -> Optional[List[str]]:
+    """Wait for a prefetched line to be ready.
+    
+    Returns:
+        Paths to the audio of the line's parts, or None if not ready
+    """
+    cache = get_audio_cache()
+    return cache.wait_prefetch(text, voice, timeout=timeout)
+
+
+def cancel_tts_prefetch(group: Optional[Hashable] = None) -> int:
+    """Cancel queued TTS prefetches.
+    
     Returns:
-        True if cached or prefetch started
+        Number of queued lines and requests cancelled
     """
     cache = get_audio_cache()
-    return cache.prefetch_tts(text, voice)
+    return cache.cancel_prefetch(group)
 
 
 def clear_tts_cache() -> int:
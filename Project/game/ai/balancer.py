@@ -0,0 +1,254 @@
+"""Load balancing across several backends for the same service.
+
+Each service ('api', 'tts', 'sd') has a BackendPool built from the URL list
+in the config. APIClient asks the pool for a backend per request; the pool
+picks one by policy, skips nodes that fail health checks or whose circuit
+breaker is open, and lets operators drain nodes for maintenance.
+
+Policies:
+    least_outstanding: fewest requests in flight, ties broken by latency
+    latency_weighted: smooth weighted round-robin, weight ~ 1 / latency
+    round_robin: plain rotation
+"""
+
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Iterable
+
+import requests
+
+from config import get_config
+
+
+logger = logging.getLogger(__name__)
+
+
+POLICIES = ("least_outstanding", "latency_weighted", "round_robin")
+
+
+class Backend:
+    """One backend node and its live load and health figures."""
+    
+    def __init__(self, url: str):
+        """Initialize a healthy, idle backend."""
+        self.url = url
+        self.outstanding = 0
+        self.avg_latency = 0.0
+        self.healthy = True
+        self.draining = False
+        self.health_failures = 0
+        self.requests = 0
+        self.errors = 0
+        
+        # Running weight for smooth weighted round-robin
+        self.current_weight = 0.0
+    
+    @property
+    def weight(self) -> float:
+        """Relative share of traffic under latency_weighted."""
+        return 1.0 / max(self.avg_latency, 0.05)
+    
+    def get_stats(self) -> dict:
+        """Get load and health figures."""
+        return {
+            'outstanding': self.outstanding,
+            'avg_latency': round(self.avg_latency, 3),
+            'healthy': self.healthy,
+            'draining': self.draining,
+            'requests': self.requests,
+            'errors': self.errors
+        }
+
+
+class BackendPool:
+    """Routes requests for one service across its backends."""
+    
+    def __init__(self, service: str, urls: List[str], config=None,
+                 policy: Optional[str] = None):
+        """Initialize pool.
+        
+        Args:
+            service: Service name ('api', 'tts', 'sd')
+            urls: Base URLs of the backends
+            config: Configuration (defaults to global)
+            policy: Routing policy (defaults to config.lb_policy)
+        """
+        self.service = service
+        self.config = config or get_config()
+        self.policy = policy or self.config.lb_policy
+        if self.policy not in POLICIES:
+            raise ValueError(f"Unknown load balancing policy: {self.policy}")
+        
+        self.backends = [Backend(url) for url in urls]
+        self._lock = threading.Lock()
+        self._rr_index = 0
+        self._health_thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        
+        if len(self.backends) > 1 and self.config.health_check_interval > 0:
+            self.start_health_checks()
+    
+    def _available(self, exclude: Iterable[Backend]) -> List[Backend]:
+        """Backends that may take traffic (lock held)."""
+        from api import get_circuit_breaker
+        
+        exclude = set(exclude)
+        candidates = [b for b in self.backends
+                      if not b.draining and b not in exclude]
+        usable = [b for b in candidates
+                  if b.healthy and get_circuit_breaker(b.url, self.config).allow_request()]
+        
+        # Never leave the caller with nothing: the breaker will fail fast
+        return usable or candidates
+    
+    def choose(self, exclude: Iterable[Backend] = ()) -> Optional[Backend]:
+        """Pick a backend by policy, or None if every node is excluded."""
+        with self._lock:
+            candidates = self._available(exclude)
+            if not candidates:
+                return None
+            
+            if self.policy == "least_outstanding":
+                return min(candidates, key=lambda b: (b.outstanding, b.avg_latency))
+            
+            if self.policy == "latency_weighted":
+                total = sum(b.weight for b in candidates)
+                for b in candidates:
+                    b.current_weight += b.weight
+                chosen = max(candidates, key=lambda b: b.current_weight)
+                chosen.current_weight -= total
+                return chosen
+            
+            self._rr_index = (self._rr_index + 1) % len(candidates)
+            return candidates[self._rr_index]
+    
+    @contextmanager
+    def acquire(self, exclude: Iterable[Backend] = ()):
+        """Choose a backend and count the request as outstanding on it."""
+        backend = self.choose(exclude)
+        if backend is None:
+            yield None
+            return
+        
+        with self._lock:
+            backend.outstanding += 1
+        try:
+            yield backend
+        finally:
+            with self._lock:
+                backend.outstanding -= 1
+    
+    def record(self, backend: Backend, elapsed: float, ok: bool):
+        """Record the outcome of a request routed to backend."""
+        with self._lock:
+            backend.requests += 1
+            if not ok:
+                backend.errors += 1
+            if elapsed:
+                backend.avg_latency = (elapsed if not backend.avg_latency
+                                       else 0.8 * backend.avg_latency + 0.2 * elapsed)
+    
+    def drain(self, url: str, draining: bool = True) -> bool:
+        """Stop (or resume) routing new requests to a backend."""
+        for backend in self.backends:
+            if backend.url == url:
+                backend.draining = draining
+                logger.info(f"{'Draining' if draining else 'Undraining'} "
+                            f"{self.service} backend {url}")
+                return True
+        return False
+    
+    def start_health_checks(self):
+        """Start the periodic health check thread."""
+        if self._health_thread is not None and self._health_thread.is_alive():
+            return
+        self._stop.clear()
+        self._health_thread = threading.Thread(
+            target=self._health_loop,
+            name=f"health-{self.service}",
+            daemon=True
+        )
+        self._health_thread.start()
+    
+    def stop_health_checks(self):
+        """Stop the health check thread."""
+        self._stop.set()
+    
+    def _health_loop(self):
+        """Probe every backend each interval until stopped."""
+        while not self._stop.wait(self.config.health_check_interval):
+            for backend in self.backends:
+                self.check_health(backend)
+    
+    def check_health(self, backend: Backend) -> bool:
+        """Probe one backend; two failures in a row mark it unhealthy."""
+        url = f"{backend.url}{self.config.breaker_probe_path}"
+        try:
+            start = time.monotonic()
+            response = requests.get(
+                url,
+                headers={'Authorization': f'Bearer {self.config.api_key}'},
+                timeout=(self.config.connect_timeout, self.config.connect_timeout)
+            )
+            response.close()
+            ok = response.status_code not in (502, 503, 504)
+            elapsed = time.monotonic() - start
+        except requests.exceptions.RequestException as e:
+            logger.debug(f"Health check of {url} failed: {e}")
+            ok = False
+            elapsed = 0.0
+        
+        with self._lock:
+            if ok:
+                if not backend.healthy:
+                    logger.info(f"{self.service} backend {backend.url} is healthy again")
+                backend.healthy = True
+                backend.health_failures = 0
+                if not backend.avg_latency:
+                    backend.avg_latency = elapsed
+            else:
+                backend.health_failures += 1
+                if backend.healthy and backend.health_failures >= 2:
+                    logger.warning(f"{self.service} backend {backend.url} is unhealthy")
+                    backend.healthy = False
+        return ok
+    
+    def get_stats(self) -> Dict[str, dict]:
+        """Get per-backend stats."""
+        with self._lock:
+            return {b.url: b.get_stats() for b in self.backends}
+
+
+# Global pools, one per service
+_pools: Dict[str, BackendPool] = {}
+_pools_lock = threading.Lock()
+
+
+def service_urls(service: str, config) -> List[str]:
+    """Configured backend URLs for a service."""
+    if service == "tts":
+        return config.tts_base_urls or service_urls("api", config)
+    if service == "sd":
+        if config.sd_webui_urls:
+            return config.sd_webui_urls
+        return [config.sd_webui_url] if config.sd_webui_url else []
+    return config.api_base_urls or [config.api_base_url]
+
+
+def get_backend_pool(service: str, config=None) -> BackendPool:
+    """Get or create the backend pool for a service."""
+    with _pools_lock:
+        pool = _pools.get(service)
+        if pool is None:
+            config = config or get_config()
+            pool = BackendPool(service, service_urls(service, config), config)
+            _pools[service] = pool
+        return pool
+
+
+def get_balancer_stats() -> Dict[str, Dict[str, dict]]:
+    """Get per-backend stats for every service."""
+    with _pools_lock:
+        return {service: pool.get_stats() for service, pool in _pools.items()}
@@ -0,0 +1,332 @@
+"""Cache bundles for shipping pre-generated assets.
+
+A bundle is a single zip archive holding a filtered set of cache entries
+from a CacheManager ("cache/<key>") and an AudioCache ("tts/<key>"), plus
+manifest.json listing each entry's type, size, SHA-256, creation time,
+generation cost and hit count. Members are stored uncompressed: audio and
+images are compressed already and text entries carry their own codec (see
+codec.py), so members can be streamed and read at any offset cheaply.
+
+Importing streams every member straight into its final cache location
+through the cache's atomic writer, hashing as it copies; an entry whose hash
+does not match is discarded without touching the cache.
+
+Bundles listed in config.cache_bundles are also mounted read-only as a
+lower tier: lookups that miss the cache are served from the bundle, and
+entries needed as files (TTS audio, image paths) are copied into the cache
+on first use.
+
+Command line:
+
+    python bundle.py export OUT.zip [--types image,tts] [--min-hits N] [--max-age-days D]
+    python bundle.py import BUNDLE.zip
+    python bundle.py list BUNDLE.zip
+    python bundle.py verify BUNDLE.zip
+"""
+
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+import threading
+import zipfile
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
+
+from config import get_config
+from fileutil import atomic_write
+
+
+logger = logging.getLogger(__name__)
+
+
+BUNDLE_VERSION = 1
+MANIFEST = "manifest.json"
+
+# Roots of the two cache kinds inside a bundle
+CACHE_ROOT = "cache"
+TTS_ROOT = "tts"
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class BundleError(ValueError):
+    """A bundle is malformed or an entry failed verification."""
+
+
+def copy_verified(src: BinaryIO, dst: BinaryIO, entry: dict) -> int:
+    """Copy an entry's data and check its size and SHA-256.
+    
+    Raises:
+        BundleError: If the data does not match the manifest
+    
+    Returns:
+        Bytes copied
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = src.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        hasher.update(chunk)
+        dst.write(chunk)
+        size += len(chunk)
+    if size != entry['size'] or hasher.hexdigest() != entry['sha256']:
+        raise BundleError(f"Bundle entry {entry['key']} failed verification")
+    return size
+
+
+class Bundle:
+    """Read-only view of a bundle archive."""
+    
+    def __init__(self, path: Union[str, Path]):
+        """Open a bundle and read its manifest.
+        
+        Raises:
+            BundleError: If the file is not a bundle
+        """
+        self.path = Path(path)
+        try:
+            self._zip = zipfile.ZipFile(self.path, 'r')
+            manifest = json.loads(self._zip.read(MANIFEST))
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+            raise BundleError(f"Not a cache bundle: {self.path} ({e})")
+        
+        if manifest.get('version') != BUNDLE_VERSION:
+            raise BundleError(f"Unsupported bundle version: {manifest.get('version')}")
+        self.manifest = manifest
+        self._entries: Dict[Tuple[str, str], dict] = {
+            (entry['root'], entry['key']): entry for entry in manifest['entries']
+        }
+    
+    def __contains__(self, item: Tuple[str, str]) -> bool:
+        return item in self._entries
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def entries(self, root: Optional[str] = None) -> List[dict]:
+        """Manifest entries, optionally under one root."""
+        return [e for e in self.manifest['entries'] if root is None or e['root'] == root]
+    
+    def get(self, root: str, key: str) -> Optional[dict]:
+        """Manifest entry for a cache key, or None."""
+        return self._entries.get((root, key))
+    
+    def open(self, entry: dict) -> BinaryIO:
+        """Stream an entry's data."""
+        return self._zip.open(f"{entry['root']}/{entry['key']}")
+    
+    def read(self, entry: dict) -> bytes:
+        """Read and verify an entry's data.
+        
+        Raises:
+            BundleError: If the data does not match the manifest
+        """
+        data = self._zip.read(f"{entry['root']}/{entry['key']}")
+        if len(data) != entry['size'] or hashlib.sha256(data).hexdigest() != entry['sha256']:
+            raise BundleError(f"Bundle entry {entry['key']} failed verification")
+        return data
+    
+    def verify(self) -> List[str]:
+        """Check every entry against the manifest.
+        
+        Returns:
+            Keys of entries that failed verification
+        """
+        class _Discard:
+            def write(self, data):
+                pass
+        
+        failed = []
+        for entry in self.manifest['entries']:
+            try:
+                with self.open(entry) as src:
+                    copy_verified(src, _Discard(), entry)
+            except (BundleError, KeyError, zipfile.BadZipFile):
+                failed.append(entry['key'])
+        return failed
+    
+    def close(self):
+        """Close the archive."""
+        self._zip.close()
+
+
+def export_bundle(dest: Union[str, Path], cache_manager=None, audio_cache=None,
+                  types: Optional[List[str]] = None, min_hits: int = 0,
+                  max_age_days: Optional[float] = None) -> dict:
+    """Write the matching entries of the given caches into one bundle.
+    
+    Args:
+        dest: Bundle file to write
+        cache_manager: CacheManager to export from (None skips it)
+        audio_cache: AudioCache to export from (None skips it)
+        types: Only these cache types ('image', 'text', 'tts', ...)
+        min_hits: Only entries hit at least this often
+        max_age_days: Only entries created within this many days
+    
+    Returns:
+        Number of entries and bytes exported
+    """
+    created_after = None if max_age_days is None else time.time() - max_age_days * 86400
+    sources = [(CACHE_ROOT, cache_manager), (TTS_ROOT, audio_cache)]
+    manifest_entries = []
+    total_bytes = 0
+    
+    with atomic_write(dest, 'wb') as f:
+        with zipfile.ZipFile(f, 'w', zipfile.ZIP_STORED, allowZip64=True) as zf:
+            for root, cache in sources:
+                if cache is None:
+                    continue
+                for entry in cache.index.select(min_hits=min_hits, created_after=created_after):
+                    if types and entry['cache_type'] not in types:
+                        continue
+                    try:
+                        src = cache.open_entry(entry['key'])
+                    except FileNotFoundError:
+                        continue
+                    
+                    # Hash while copying, so every entry is read once
+                    hasher = hashlib.sha256()
+                    size = 0
+                    with src, zf.open(f"{root}/{entry['key']}", 'w', force_zip64=True) as out:
+                        while True:
+                            chunk = src.read(CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            hasher.update(chunk)
+                            out.write(chunk)
+                            size += len(chunk)
+                    
+                    manifest_entries.append({
+                        'root': root,
+                        'key': entry['key'],
+                        'type': entry['cache_type'],
+                        'size': size,
+                        'sha256': hasher.hexdigest(),
+                        'created': entry['created'],
+                        'cost': entry['cost'],
+                        'hits': entry['hits']
+                    })
+                    total_bytes += size
+            
+            zf.writestr(MANIFEST, json.dumps({
+                'version': BUNDLE_VERSION,
+                'created': time.time(),
+                'entries': manifest_entries
+            }))
+    
+    logger.info(f"Exported {len(manifest_entries)} cache entries ({total_bytes} bytes) to {dest}")
+    return {'entries': len(manifest_entries), 'bytes': total_bytes}
+
+
+def import_bundle(path: Union[str, Path], cache_manager=None, audio_cache=None,
+                  overwrite: bool = False) -> dict:
+    """Install a bundle's entries into the given caches.
+    
+    Args:
+        path: Bundle file
+        cache_manager: CacheManager receiving "cache" entries (None skips them)
+        audio_cache: AudioCache receiving "tts" entries (None skips them)
+        overwrite: Replace entries the cache already holds
+    
+    Returns:
+        Counts of imported, existing (skipped) and failed entries
+    """
+    counts = {'imported': 0, 'existing': 0, 'failed': 0}
+    targets = {CACHE_ROOT: cache_manager, TTS_ROOT: audio_cache}
+    
+    bundle = Bundle(path)
+    try:
+        for entry in bundle.entries():
+            cache = targets.get(entry['root'])
+            if cache is None:
+                continue
+            if not overwrite and cache.index.contains(entry['key']):
+                counts['existing'] += 1
+                continue
+            try:
+                with bundle.open(entry) as src:
+                    cache.import_entry(entry, src)
+                counts['imported'] += 1
+            except (BundleError, OSError, zipfile.BadZipFile) as e:
+                logger.error(f"Failed to import {entry['key']}: {e}")
+                counts['failed'] += 1
+    finally:
+        bundle.close()
+    
+    logger.info(f"Imported bundle {path}: {counts}")
+    return counts
+
+
+# Bundles mounted as the read-only lower tier
+_bundles: Optional[List[Bundle]] = None
+_bundles_lock = threading.Lock()
+
+
+def get_bundles(config=None) -> List[Bundle]:
+    """Get the bundles listed in config.cache_bundles, opening them once."""
+    global _bundles
+    with _bundles_lock:
+        if _bundles is None:
+            config = config or get_config()
+            _bundles = []
+            for path in config.cache_bundles:
+                try:
+                    _bundles.append(Bundle(path))
+                    logger.info(f"Mounted cache bundle: {path}")
+                except BundleError as e:
+                    logger.error(f"Skipping cache bundle: {e}")
+        return _bundles
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Export, import, list or verify bundles from the command line."""
+    parser = argparse.ArgumentParser(description="Export and import cache bundles")
+    parser.add_argument('command', choices=('export', 'import', 'list', 'verify'))
+    parser.add_argument('bundle', type=Path)
+    parser.add_argument('--types', help="Comma-separated cache types to export")
+    parser.add_argument('--min-hits', type=int, default=0)
+    parser.add_argument('--max-age-days', type=float)
+    parser.add_argument('--overwrite', action='store_true', help="Replace existing entries on import")
+    parser.add_argument('--cache-dir', type=Path, help="CacheManager directory")
+    parser.add_argument('--tts-dir', type=Path, help="AudioCache directory")
+    args = parser.parse_args(argv)
+    
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    
+    if args.command in ('list', 'verify'):
+        bundle = Bundle(args.bundle)
+        if args.command == 'list':
+            for entry in bundle.entries():
+                print(f"{entry['root']}/{entry['key']}\t{entry['type']}\t{entry['size']}\t{entry['hits']}")
+            print(f"{len(bundle)} entries")
+            return 0
+        failed = bundle.verify()
+        for key in failed:
+            print(f"FAILED {key}")
+        print(f"{len(bundle) - len(failed)} of {len(bundle)} entries verified")
+        return 1 if failed else 0
+    
+    # Imported here: both caches import this module
+    from cache import CacheManager
+    from audio_cache import AudioCache
+    
+    cache_manager = CacheManager(args.cache_dir) if args.cache_dir else CacheManager()
+    audio_cache = AudioCache(str(args.tts_dir)) if args.tts_dir else AudioCache()
+    
+    if args.command == 'export':
+        types = [t.strip() for t in args.types.split(',')] if args.types else None
+        result = export_bundle(args.bundle, cache_manager, audio_cache, types,
+                               args.min_hits, args.max_age_days)
+    else:
+        result = import_bundle(args.bundle, cache_manager, audio_cache, args.overwrite)
+    print(json.dumps(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
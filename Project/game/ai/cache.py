@@ -1,47 +1,96 @@
 """Content-based caching utilities for AI-generated assets."""
 
+import io
 import os
-import json
-import hashlib
+import time
 import shutil
 import logging
 from pathlib import Path
-from datetime import datetime, timedelta
-from typing import Optional, Union, Any
+from typing import Optional, Union, Any, BinaryIO, Callable, List
 
 from config import get_config
+from api import APIResponse
+from cache_index import CacheIndex
+from eviction import get_evictor
+from memcache import get_memory_cache, invalidator, PRESENT
+from packstore import PackStore
+from fileutil import atomic_write, KeyLocks, replace_file, staging_path
+from codec import encode, decode, get_codec
+from cachekey import content_key, legacy_content_key, needs_rekey
+from cleanup import CleanupJob, get_cleaner
+from negcache import NegativeCache, NegativeEntry
+from bundle import (BundleError, CACHE_ROOT, copy_verified, export_bundle,
+                    import_bundle, get_bundles)
 
 
 logger = logging.getLogger(__name__)
 
 
+# Subdirectory of the cache root holding pack segments
+PACK_DIR = "packs"
+
+# Subdirectory of the cache root holding the per-key lock files
+LOCK_DIR = ".locks"
+
+# Returned by _get_packed for entries stored as loose files
+_LOOSE = object()
+
+
 class CacheManager:
     """Manages content-based caching for generated assets."""
     
     def __init__(self, cache_dir: Optional[Path] = None):
         """Initialize cache manager."""
-        config = get_config()
+        config = self.config = get_config()
         self.cache_dir = cache_dir or config.cache_dir
         self.max_age_days = config.max_cache_age_days
         
         # Ensure cache directory exists
         self.cache_dir.mkdir(parents=True, exist_ok=True)
+        
+        # Entry metadata; imports pre-index .meta files on first run
+        self.index = CacheIndex(self.cache_dir)
+        self.index.import_legacy()
+        
+        # Entries under version 1 keys are re-keyed when first looked up
+        self.legacy_keys = needs_rekey(self.index)
+        
+        # Keeps the cache within the configured byte budgets
+        self.evictor = get_evictor()
+        self.evictor.register(self.index)
+        
+        # Age expiry and housekeeping in resumable time slices
+        self.cleanup = CleanupJob(self.index, self.max_age_days)
+        get_cleaner().register(self.cleanup)
+        
+        # In-memory L1, invalidated whenever the index changes an entry
+        self.memory = get_memory_cache()
+        self.index.add_listener(invalidator(self.memory, self.cache_dir))
+        
+        # Compression per cache type; fail early on unknown codecs
+        self.compression = dict(config.cache_compression)
+        for codec in self.compression.values():
+            get_codec(codec)
+        
+        # Serializes publishing of the same entry across threads and processes
+        self.locks = KeyLocks(self.cache_dir / LOCK_DIR)
+        
+        # Small entries go to append-only pack segments when enabled; an
+        # existing pack directory stays readable after disabling it
+        self.packs = None
+        if config.pack_small_entries or (self.cache_dir / PACK_DIR).is_dir():
+            self.packs = PackStore(self.cache_dir / PACK_DIR, self.index, config)
+            self.packs.start_compaction()
+        
+        # Read-only lower tier of shipped bundles
+        self.bundles = get_bundles()
+        
+        # Generations that failed recently, with backoff
+        self.negative = NegativeCache(self.index)
     
     def _get_hash(self, content: Union[str, bytes, dict]) -> str:
-        """Generate SHA256 hash for content."""
-        hasher = hashlib.sha256()
-        
-        if isinstance(content, str):
-            hasher.update(content.encode('utf-8'))
-        elif isinstance(content, bytes):
-            hasher.update(content)
-        elif isinstance(content, dict):
-            # Sort keys for consistent hashing
-            hasher.update(json.dumps(content, sort_keys=True).encode('utf-8'))
-        else:
-            raise TypeError(f"Unsupported content type: {type(content)}")
-        
-        return hasher.hexdigest()
+        """Generate the versioned cache key for content (see cachekey.py)."""
+        return content_key(content)
     
     def _get_cache_path(self, cache_type: str, content_hash: str, 
                        extension: str = "") -> Path:
@@ -49,10 +98,8 @@ class CacheManager:
         
         Structure: cache_dir/type/hash[:2]/hash.ext
         """
-        # Create subdirectory structure
-        type_dir = self.cache_dir / cache_type
-        hash_dir = type_dir / content_hash[:2]
-        hash_dir.mkdir(parents=True, exist_ok=True)
+        # Directories are created when an entry is saved
+        hash_dir = self.cache_dir / cache_type / content_hash[:2]
         
         # Build filename
         filename = content_hash
@@ -68,47 +115,272 @@ class CacheManager:
         """Check if cached version exists."""
         content_hash = self._get_hash(content)
         cache_path = self._get_cache_path(cache_type, content_hash, extension)
-        return cache_path.exists()
+        key = self.index.key_for(cache_path)
+        if self.memory.get((self.cache_dir, key)) is not None:
+            return True
+        if self.index.contains(key):
+            return True
+        if self.legacy_keys and self.rekey(cache_type, content, extension):
+            return True
+        return any(bundle.get(CACHE_ROOT, key) for bundle in self.bundles)
     
     def get_cached(self, cache_type: str, content: Union[str, bytes, dict],
                   extension: str = "", as_path: bool = False) -> Optional[Union[bytes, str, Path]]:
         """Get cached content if it exists.
         
+        Recently used entries are served from memory without touching disk.
+        
         Args:
             cache_type: Type of cache (e.g., 'image', 'audio', 'text')
             content: Content to hash for cache key
             extension: File extension for cache file
-            as_path: If True, return Path object instead of content
+            as_path: If True, return Path object instead of content (the file
+                holds the stored bytes, compressed for types with a codec)
         
         Returns:
             Cached content as bytes/string, or Path if as_path=True, or None if not cached
         """
         content_hash = self._get_hash(content)
         cache_path = self._get_cache_path(cache_type, content_hash, extension)
+        key = self.index.key_for(cache_path)
         
-        if not cache_path.exists():
-            logger.debug(f"Cache miss: {cache_path}")
-            return None
+        remembered = self.memory.get((self.cache_dir, key))
+        if remembered is not None and as_path:
+            # Data in memory may come from a pack segment, with no file to return
+            location = self.index.location(key)
+            if location is None or location[0] is not None:
+                remembered = None
+        if remembered is not None and (as_path or remembered is not PRESENT):
+            self.index.touch(key)
+            return cache_path if as_path else remembered
         
-        logger.debug(f"Cache hit: {cache_path}")
+        # Entries removed while we read must not be remembered
+        version = self.index.version
+        if remembered is None:
+            packed = self._get_packed(cache_type, key, cache_path, as_path, version)
+            if packed is None and self.legacy_keys and self.rekey(cache_type, content, extension):
+                version = self.index.version
+                packed = self._get_packed(cache_type, key, cache_path, as_path, version)
+            if packed is None and self.bundles:
+                return self._get_from_bundle(cache_type, key, cache_path, as_path, version)
+            if packed is not _LOOSE:
+                return packed
         
         if as_path:
+            if not cache_path.exists():
+                return self._drop_missing(key, cache_path)
+            logger.debug(f"Cache hit: {cache_path}")
+            self.index.touch(key)
+            self._remember(key, PRESENT, version)
             return cache_path
         
-        # Read and return content
+        # Read and return content; entries stored before compression was
+        # enabled have no codec tag and decode as they are
         try:
+            with open(cache_path, 'rb') as f:
+                data = decode(f.read())
             if cache_type in ['text', 'json']:
-                with open(cache_path, 'r', encoding='utf-8') as f:
-                    return f.read()
-            else:
-                with open(cache_path, 'rb') as f:
-                    return f.read()
+                data = data.decode('utf-8')
+        except FileNotFoundError:
+            return self._drop_missing(key, cache_path)
         except Exception as e:
             logger.error(f"Error reading cache file {cache_path}: {e}")
             return None
+        
+        logger.debug(f"Cache hit: {cache_path}")
+        self.index.touch(key)
+        self._remember(key, data, version)
+        return data
+    
+    def _get_packed(self, cache_type: str, key: str, cache_path: Path,
+                    as_path: bool, version: int) -> Any:
+        """Look an entry up and read it if it lives in a pack segment.
+        
+        Returns:
+            The data (or Path), None on a miss, or _LOOSE for loose files
+        """
+        # One retry covers a compaction moving the entry after the lookup
+        for _ in range(2):
+            location = self.index.location(key)
+            if location is None:
+                logger.debug(f"Cache miss: {cache_path}")
+                return None
+            
+            segment, offset, size = location
+            if segment is None:
+                return _LOOSE
+            
+            try:
+                data = self.packs.read(segment, offset, size)
+            except FileNotFoundError:
+                continue
+            
+            self.index.touch(key)
+            if as_path:
+                return self._unpack(key, cache_path, data, segment, offset)
+            data = decode(data)
+            if cache_type in ['text', 'json']:
+                data = data.decode('utf-8')
+            self._remember(key, data, version)
+            return data
+        
+        return None
+    
+    def _get_from_bundle(self, cache_type: str, key: str, cache_path: Path,
+                         as_path: bool, version: int) -> Optional[Union[bytes, str, Path]]:
+        """Serve a miss from the mounted bundles.
+        
+        Data is read from the bundle in place; entries needed as a file are
+        copied into the cache first.
+        """
+        for bundle in self.bundles:
+            entry = bundle.get(CACHE_ROOT, key)
+            if entry is None:
+                continue
+            try:
+                if as_path:
+                    with bundle.open(entry) as src:
+                        self.import_entry(entry, src, pack=False)
+                    return cache_path
+                data = decode(bundle.read(entry))
+            except (BundleError, OSError) as e:
+                logger.error(f"Failed to read {key} from bundle {bundle.path}: {e}")
+                continue
+            
+            logger.debug(f"Bundle hit: {key} ({bundle.path.name})")
+            if cache_type in ['text', 'json']:
+                data = data.decode('utf-8')
+            self._remember(key, data, version)
+            return data
+        
+        logger.debug(f"Cache miss: {cache_path}")
+        return None
+    
+    def open_entry(self, key: str) -> BinaryIO:
+        """Stream an entry's stored (possibly compressed) bytes.
+        
+        Raises:
+            FileNotFoundError: If the entry is not cached
+        """
+        location = self.index.location(key)
+        if location is None:
+            raise FileNotFoundError(key)
+        segment, offset, size = location
+        if segment is not None:
+            return io.BytesIO(self.packs.read(segment, offset, size))
+        return open(self.index.path_for(key), 'rb')
+    
+    def import_entry(self, entry: dict, src: BinaryIO, pack: bool = True):
+        """Install an entry's stored bytes from a bundle.
+        
+        Args:
+            entry: Bundle manifest entry
+            src: Stream of the entry's data
+            pack: Allow packing small entries (False keeps a loose file)
+        
+        Raises:
+            BundleError: If the data fails verification
+        """
+        key = entry['key']
+        cache_path = self.index.path_for(key)
+        
+        if (pack and self.config.pack_small_entries and self.packs is not None
+                and entry['size'] <= self.config.pack_max_entry_bytes):
+            buffer = io.BytesIO()
+            copy_verified(src, buffer, entry)
+            self._save_packed(entry['type'], cache_path, buffer.getvalue(),
+                              entry['cost'], entry['created'])
+            return
+        
+        with staging_path(cache_path) as staged:
+            with open(staged, 'wb') as f:
+                copy_verified(src, f, entry)
+            with self.locks.hold(key):
+                replace_file(staged, cache_path)
+                self.index.put(key, entry['type'], entry['size'],
+                               created=entry['created'], cost=entry['cost'])
+        self.evictor.notify()
+    
+    def export_bundle(self, dest: Union[str, Path], types: Optional[List[str]] = None,
+                      min_hits: int = 0, max_age_days: Optional[float] = None) -> dict:
+        """Export matching entries into a bundle (see bundle.export_bundle)."""
+        return export_bundle(dest, cache_manager=self, types=types,
+                             min_hits=min_hits, max_age_days=max_age_days)
+    
+    def import_bundle(self, path: Union[str, Path], overwrite: bool = False) -> dict:
+        """Install a bundle's cache entries (see bundle.import_bundle)."""
+        return import_bundle(path, cache_manager=self, overwrite=overwrite)
+    
+    def rekey(self, cache_type: str, content: Union[str, bytes, dict],
+              extension: str = "", dry_run: bool = False) -> bool:
+        """Move an entry stored under its version 1 key to its current key.
+        
+        Args:
+            cache_type: Type of cache (e.g., 'image', 'audio', 'text')
+            content: Content the entry was generated from
+            extension: File extension for cache file
+            dry_run: Only check whether there is an entry to move
+        
+        Returns:
+            True if an entry was (or would be) re-keyed
+        """
+        legacy_path = self._get_cache_path(cache_type, legacy_content_key(content), extension)
+        cache_path = self._get_cache_path(cache_type, self._get_hash(content), extension)
+        old_key = self.index.key_for(legacy_path)
+        new_key = self.index.key_for(cache_path)
+        
+        with self.locks.hold(new_key):
+            location = self.index.location(old_key)
+            if location is None:
+                return False
+            if dry_run:
+                return True
+            
+            # A newer entry was generated already; the old one is redundant
+            if self.index.contains(new_key):
+                self.index.delete_entries([old_key])
+                return False
+            
+            if location[0] is None:
+                try:
+                    cache_path.parent.mkdir(parents=True, exist_ok=True)
+                    os.replace(legacy_path, cache_path)
+                except FileNotFoundError:
+                    self._drop_missing(old_key, legacy_path)
+                    return False
+                try:
+                    legacy_path.parent.rmdir()
+                except OSError:
+                    pass
+            
+            self.index.rename(old_key, new_key)
+        
+        logger.debug(f"Re-keyed cache entry: {old_key} -> {new_key}")
+        return True
+    
+    def _unpack(self, key: str, cache_path: Path, data: bytes,
+                segment: int, offset: int) -> Path:
+        """Move a packed entry out to a loose file for path-based callers."""
+        with atomic_write(cache_path, 'wb') as f:
+            f.write(data)
+        self.index.relocate([(key, segment, offset, None, None)])
+        logger.debug(f"Unpacked cache entry: {cache_path}")
+        return cache_path
+    
+    def _remember(self, key: str, value: Any, version: int):
+        """Keep an entry in memory unless the index changed since version."""
+        if self.index.version == version:
+            self.memory.put((self.cache_dir, key), value)
+    
+    def _drop_missing(self, key: str, cache_path: Path) -> None:
+        """Forget an indexed entry whose file was deleted behind our back."""
+        logger.warning(f"Cached file missing, removing from index: {cache_path}")
+        self.index.remove([key])
+        return None
     
     def save_to_cache(self, cache_type: str, content: Union[str, bytes, dict],
-                     data: Union[str, bytes], extension: str = "") -> Path:
+                     data: Union[str, bytes], extension: str = "",
+                     cost: float = 0.0) -> Path:
         """Save data to cache.
         
         Args:
@@ -116,130 +388,162 @@ class CacheManager:
             content: Content to hash for cache key
             data: Data to save
             extension: File extension for cache file
+            cost: Seconds it took to generate data (for cost-aware eviction)
         
         Returns:
-            Path to cached file
+            Path to cached file (for packed entries, the path get_cached
+            unpacks them to when asked for a path)
         """
         content_hash = self._get_hash(content)
         cache_path = self._get_cache_path(cache_type, content_hash, extension)
+        key = self.index.key_for(cache_path)
+        
+        encoded = data.encode('utf-8') if isinstance(data, str) else data
+        encoded = encode(encoded, self.compression.get(cache_type))
+        if (self.config.pack_small_entries and self.packs is not None
+                and len(encoded) <= self.config.pack_max_entry_bytes):
+            return self._save_packed(cache_type, cache_path, encoded, cost)
         
         try:
-            if isinstance(data, str):
-                with open(cache_path, 'w', encoding='utf-8') as f:
-                    f.write(data)
-            else:
-                with open(cache_path, 'wb') as f:
-                    f.write(data)
+            # Written to a temp file and renamed, so readers and other
+            # writers of the same entry never see a partial file
+            with staging_path(cache_path) as staged:
+                staged.write_bytes(encoded)
+                with self.locks.hold(key):
+                    replace_file(staged, cache_path)
+                    self.index.put(key, cache_type, len(encoded), cost=cost)
             
             logger.debug(f"Saved to cache: {cache_path}")
-            
-            # Also save metadata
-            self._save_metadata(cache_path, {
-                'cache_type': cache_type,
-                'content_hash': content_hash,
-                'created': datetime.now().isoformat(),
-                'size': len(data)
-            })
+            self.evictor.notify()
             
             return cache_path
-            
+        
         except Exception as e:
             logger.error(f"Error saving to cache {cache_path}: {e}")
             raise
     
-    def _save_metadata(self, cache_path: Path, metadata: dict):
-        """Save metadata for cached file."""
-        meta_path = cache_path.with_suffix(cache_path.suffix + '.meta')
-        try:
-            with open(meta_path, 'w') as f:
-                json.dump(metadata, f, indent=2)
-        except Exception as e:
-            logger.warning(f"Failed to save metadata: {e}")
+    def _save_packed(self, cache_type: str, cache_path: Path, data: bytes,
+                     cost: float, created: Optional[float] = None) -> Path:
+        """Append a small entry to the active pack segment.
+        
+        The segment itself is shared by every key and process, so PackStore
+        serializes the append; the key's lock only covers publishing it.
+        """
+        key = self.index.key_for(cache_path)
+        segment, offset = self.packs.append(key, data)
+        with self.locks.hold(key):
+            self.index.put(key, cache_type, len(data), created=created, cost=cost,
+                           segment=segment, offset=offset)
+            
+            # Drop a loose copy left by an earlier save or unpack
+            try:
+                cache_path.unlink()
+            except FileNotFoundError:
+                pass
+        
+        logger.debug(f"Packed to cache: {key} (segment {segment})")
+        self.evictor.notify()
+        return cache_path
     
-    def _load_metadata(self, cache_path: Path) -> Optional[dict]:
-        """Load metadata for cached file."""
-        meta_path = cache_path.with_suffix(cache_path.suffix + '.meta')
-        if not meta_path.exists():
-            return None
+    def save_file_to_cache(self, cache_type: str, content: Union[str, bytes, dict],
+                           write_fn: Callable[[Path], Any],
+                           extension: str = "") -> Optional[Path]:
+        """Let write_fn stream data straight into the cache file.
         
-        try:
-            with open(meta_path, 'r') as f:
-                return json.load(f)
-        except Exception as e:
-            logger.warning(f"Failed to load metadata: {e}")
+        Used for large generated assets so they never sit in memory, e.g.
+        save_file_to_cache('image', params,
+                           lambda p: client.request_image_to_file(prompt, p), 'png')
+        
+        Failures are negative-cached: until their backoff expires, further
+        calls for the same content return None without calling write_fn.
+        
+        Args:
+            cache_type: Type of cache (e.g., 'image', 'audio', 'text')
+            content: Content to hash for cache key
+            write_fn: Writes the file at the (temporary) path it is given and
+                returns that Path or None, or an APIResponse so failures keep
+                their error class
+            extension: File extension for cache file
+        
+        Returns:
+            Path to cached file, or None if write_fn failed
+        """
+        content_hash = self._get_hash(content)
+        cache_path = self._get_cache_path(cache_type, content_hash, extension)
+        
+        key = self.index.key_for(cache_path)
+        failure = self.negative.check(key)
+        if failure is not None:
+            logger.debug(f"Skipping {key}: failed recently ({failure.error_class})")
             return None
+        
+        # The download runs without holding the lock, so it never keeps
+        # other entries (or other processes) waiting; only moving the
+        # finished file into place and indexing it is serialized
+        with staging_path(cache_path) as staged:
+            start = time.monotonic()
+            written = write_fn(staged)
+            if isinstance(written, APIResponse):
+                if not written.success:
+                    self.negative.record(key, written.failure_class, written.error)
+                    return None
+            elif not written:
+                self.negative.record(key, "unknown")
+                return None
+            cost = time.monotonic() - start
+            with self.locks.hold(key):
+                replace_file(staged, cache_path)
+                self.index.put(key, cache_type, cache_path.stat().st_size, cost=cost)
+        self.negative.clear(key)
+        
+        logger.debug(f"Streamed to cache: {cache_path}")
+        self.evictor.notify()
+        return cache_path
+    
+    def get_failure(self, cache_type: str, content: Union[str, bytes, dict],
+                    extension: str = "") -> Optional[NegativeEntry]:
+        """Get the recent failure blocking an entry's generation, if any."""
+        cache_path = self._get_cache_path(cache_type, self._get_hash(content), extension)
+        return self.negative.check(self.index.key_for(cache_path))
+    
+    def record_failure(self, cache_type: str, content: Union[str, bytes, dict],
+                       error_class: Optional[str], error: Optional[str] = None,
+                       extension: str = "") -> Optional[NegativeEntry]:
+        """Negative-cache a failed generation of an entry.
+        
+        For callers that generate data themselves before save_to_cache();
+        they check get_failure() first. Saving the entry clears the failure.
+        """
+        cache_path = self._get_cache_path(cache_type, self._get_hash(content), extension)
+        return self.negative.record(self.index.key_for(cache_path), error_class, error)
     
-    def cleanup_old_entries(self, dry_run: bool = False) -> int:
+    def cleanup_old_entries(self, dry_run: bool = False,
+                            time_budget: Optional[float] = None) -> int:
         """Remove cache entries older than max_age_days.
         
+        Also removes temp files left by interrupted writes and indexes
+        entry files the index lost track of (see cleanup.py).
+        
         Args:
             dry_run: If True, only report what would be deleted
+            time_budget: Seconds to spend; an unfinished pass resumes on the
+                next call (None finishes the pass)
         
         Returns:
             Number of files deleted/would be deleted
         """
-        cutoff_date = datetime.now() - timedelta(days=self.max_age_days)
-        deleted_count = 0
-        
-        for cache_type_dir in self.cache_dir.iterdir():
-            if not cache_type_dir.is_dir():
-                continue
-            
-            for hash_dir in cache_type_dir.iterdir():
-                if not hash_dir.is_dir():
-                    continue
-                
-                for cache_file in hash_dir.iterdir():
-                    if cache_file.suffix == '.meta':
-                        continue
-                    
-                    # Check file age
-                    try:
-                        # Try to load metadata first
-                        metadata = self._load_metadata(cache_file)
-                        if metadata and 'created' in metadata:
-                            created = datetime.fromisoformat(metadata['created'])
-                        else:
-                            # Fall back to file modification time
-                            created = datetime.fromtimestamp(cache_file.stat().st_mtime)
-                        
-                        if created < cutoff_date:
-                            if dry_run:
-                                logger.info(f"Would delete: {cache_file}")
-                            else:
-                                cache_file.unlink()
-                                # Also delete metadata
-                                meta_file = cache_file.with_suffix(cache_file.suffix + '.meta')
-                                if meta_file.exists():
-                                    meta_file.unlink()
-                                logger.info(f"Deleted old cache: {cache_file}")
-                            deleted_count += 1
-                            
-                    except Exception as e:
-                        logger.error(f"Error processing cache file {cache_file}: {e}")
-        
-        # Clean up empty directories
-        if not dry_run:
-            self._cleanup_empty_dirs()
+        if dry_run:
+            cutoff = time.time() - self.max_age_days * 86400
+            entries = self.index.created_before(cutoff, limit=-1)
+            for entry in entries:
+                logger.info(f"Would delete: {self.index.path_for(entry['key'])}")
+            return len(entries)
         
+        deleted_count = self.cleanup.run(time_budget)
+        if deleted_count:
+            logger.info(f"Deleted {deleted_count} old cache entries")
         return deleted_count
     
-    def _cleanup_empty_dirs(self):
-        """Remove empty cache directories."""
-        for cache_type_dir in self.cache_dir.iterdir():
-            if not cache_type_dir.is_dir():
-                continue
-            
-            for hash_dir in cache_type_dir.iterdir():
-                if hash_dir.is_dir() and not any(hash_dir.iterdir()):
-                    hash_dir.rmdir()
-                    logger.debug(f"Removed empty directory: {hash_dir}")
-            
-            # Remove type directory if empty
-            if not any(cache_type_dir.iterdir()):
-                cache_type_dir.rmdir()
-                logger.debug(f"Removed empty directory: {cache_type_dir}")
-    
     def get_cache_stats(self) -> dict:
         """Get statistics about cache usage."""
         stats = {
@@ -248,31 +552,16 @@ class CacheManager:
             'by_type': {}
         }
         
-        for cache_type_dir in self.cache_dir.iterdir():
-            if not cache_type_dir.is_dir():
-                continue
-            
-            type_name = cache_type_dir.name
-            type_stats = {
-                'files': 0,
-                'size': 0
-            }
-            
-            for hash_dir in cache_type_dir.iterdir():
-                if not hash_dir.is_dir():
-                    continue
-                
-                for cache_file in hash_dir.iterdir():
-                    if cache_file.suffix == '.meta':
-                        continue
-                    
-                    type_stats['files'] += 1
-                    type_stats['size'] += cache_file.stat().st_size
-            
+        for type_name, type_stats in self.index.stats().items():
             stats['by_type'][type_name] = type_stats
             stats['total_files'] += type_stats['files']
             stats['total_size'] += type_stats['size']
         
+        if self.packs is not None:
+            stats['packs'] = self.packs.get_stats()
+        stats['cleanup'] = self.cleanup.get_stats()
+        stats['negative'] = self.negative.get_stats()
+        
         return stats
     
     def clear_cache(self, cache_type: Optional[str] = None) -> int:
@@ -284,20 +573,21 @@ class CacheManager:
         Returns:
             Number of files deleted
         """
-        deleted_count = 0
-        
         if cache_type:
             cache_dir = self.cache_dir / cache_type
             if cache_dir.exists():
                 shutil.rmtree(cache_dir)
-                deleted_count = sum(1 for _ in cache_dir.rglob('*') if _.is_file())
-                logger.info(f"Cleared {cache_type} cache: {deleted_count} files")
+            deleted_count = self.index.clear(cache_type)
+            self.negative.clear_all(cache_type + '/')
+            logger.info(f"Cleared {cache_type} cache: {deleted_count} files")
         else:
             for cache_type_dir in self.cache_dir.iterdir():
-                if cache_type_dir.is_dir():
-                    count = sum(1 for _ in cache_type_dir.rglob('*') if _.is_file())
+                if cache_type_dir.is_dir() and cache_type_dir.name not in (PACK_DIR, LOCK_DIR):
                     shutil.rmtree(cache_type_dir)
-                    deleted_count += count
+            deleted_count = self.index.clear()
+            self.negative.clear_all()
+            if self.packs is not None:
+                self.packs.reset()
             logger.info(f"Cleared all cache: {deleted_count} files")
         
         return deleted_count
@@ -329,6 +619,7 @@ def get_cached(cache_type: str, content: Union[str, bytes, dict],
 
 
 def save_to_cache(cache_type: str, content: Union[str, bytes, dict],
-                 data: Union[str, bytes], extension: str = "") -> Path:
+                 data: Union[str, bytes], extension: str = "",
+                 cost: float = 0.0) -> Path:
     """Save data to cache."""
-    return get_cache_manager().save_to_cache(cache_type, content, data, extension)
\ No newline at end of file
+    return get_cache_manager().save_to_cache(cache_type, content, data, extension, cost)
\ No newline at end of file
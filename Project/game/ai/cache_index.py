@@ -0,0 +1,595 @@
+"""SQLite index of cache entries.
+
+One row per cached file replaces the per-file .meta JSON, so existence
+checks, stats and age-based cleanup are indexed queries instead of walks
+over every type and hash directory. The database lives in the cache
+directory and runs in WAL mode; a single connection is shared across
+threads behind a lock.
+
+Hit counts and access times are buffered in memory and written in batches,
+so a cache hit does not cost a database write. Triggers keep running file,
+size and hit totals per cache type in a small table, so stats are a read of
+a few rows however many entries there are.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+INDEX_FILENAME = "index.sqlite3"
+
+# Buffered hits are flushed after this many, or this many seconds
+TOUCH_FLUSH_COUNT = 64
+TOUCH_FLUSH_INTERVAL = 5.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    cache_type TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    cost REAL NOT NULL DEFAULT 0,
+    segment INTEGER,
+    offset INTEGER
+);
+CREATE INDEX IF NOT EXISTS entries_type ON entries (cache_type);
+CREATE INDEX IF NOT EXISTS entries_created ON entries (created);
+CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+-- No conflict clauses in triggers: the firing statement's (OR REPLACE) would apply
+CREATE TABLE IF NOT EXISTS totals (
+    cache_type TEXT PRIMARY KEY,
+    files INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    hits INTEGER NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+    INSERT INTO totals SELECT NEW.cache_type, 0, 0, 0
+        WHERE NOT EXISTS (SELECT 1 FROM totals WHERE cache_type = NEW.cache_type);
+    UPDATE totals SET files = files + 1, size = size + NEW.size, hits = hits + NEW.hits
+        WHERE cache_type = NEW.cache_type;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+    UPDATE totals SET files = files - 1, size = size - OLD.size, hits = hits - OLD.hits
+        WHERE cache_type = OLD.cache_type;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF cache_type, size, hits ON entries BEGIN
+    UPDATE totals SET files = files - 1, size = size - OLD.size, hits = hits - OLD.hits
+        WHERE cache_type = OLD.cache_type;
+    INSERT INTO totals SELECT NEW.cache_type, 0, 0, 0
+        WHERE NOT EXISTS (SELECT 1 FROM totals WHERE cache_type = NEW.cache_type);
+    UPDATE totals SET files = files + 1, size = size + NEW.size, hits = hits + NEW.hits
+        WHERE cache_type = NEW.cache_type;
+END;
+CREATE TABLE IF NOT EXISTS failures (
+    key TEXT PRIMARY KEY,
+    error_class TEXT NOT NULL,
+    failures INTEGER NOT NULL,
+    retry_after REAL NOT NULL,
+    error TEXT
+);
+"""
+
+
+class CacheIndex:
+    """Metadata for every file in a cache directory, keyed by relative path."""
+    
+    def __init__(self, cache_dir: Path, filename: str = INDEX_FILENAME):
+        """Open (or create) the index in cache_dir.
+        
+        Args:
+            cache_dir: Cache root; entry keys are paths relative to it
+            filename: Database file name inside cache_dir
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.cache_dir / filename
+        
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # INSERT OR REPLACE only fires the delete trigger for the replaced row with this on
+        self._conn.execute("PRAGMA recursive_triggers=ON")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        
+        # key -> (hits since last flush, last access time)
+        self._touches: Dict[str, Tuple[int, float]] = {}
+        self._last_flush = time.monotonic()
+        
+        # Told about replaced and removed entries; version counts changes so
+        # readers can tell whether an entry changed while they read it
+        self._listeners: List[Callable[[Optional[List[str]]], None]] = []
+        self.version = 0
+    
+    def _migrate(self):
+        """Add columns introduced after the first schema version.
+        
+        Runs as one write transaction, so processes opening the index at
+        the same time migrate it once.
+        """
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(entries)")}
+            if 'cost' not in columns:
+                self._conn.execute("ALTER TABLE entries ADD COLUMN cost REAL NOT NULL DEFAULT 0")
+            if 'segment' not in columns:
+                self._conn.execute("ALTER TABLE entries ADD COLUMN segment INTEGER")
+                self._conn.execute("ALTER TABLE entries ADD COLUMN offset INTEGER")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_segment "
+                               "ON entries (segment) WHERE segment IS NOT NULL")
+            
+            # Indexes created before the totals table get them counted once
+            if not self._conn.execute("SELECT 1 FROM meta WHERE name = 'totals'").fetchone():
+                self._conn.execute("DELETE FROM totals")
+                self._conn.execute(
+                    "INSERT INTO totals SELECT cache_type, COUNT(*), SUM(size), SUM(hits) "
+                    "FROM entries GROUP BY cache_type"
+                )
+                self._conn.execute("INSERT INTO meta (name, value) VALUES ('totals', '1')")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+    
+    def key_for(self, path: Path) -> str:
+        """Index key (POSIX path relative to the cache root) for a file."""
+        return Path(path).relative_to(self.cache_dir).as_posix()
+    
+    def path_for(self, key: str) -> Path:
+        """Absolute path of an entry."""
+        return self.cache_dir / key
+    
+    def add_listener(self, callback: Callable[[Optional[List[str]]], None]):
+        """Call callback(keys) after entries are replaced or removed.
+        
+        keys is None when every entry (of some type) was cleared.
+        """
+        self._listeners.append(callback)
+    
+    def _changed(self, keys: Optional[List[str]]):
+        """Bump the version and notify listeners."""
+        self.version += 1
+        for callback in self._listeners:
+            callback(keys)
+    
+    def put(self, key: str, cache_type: str, size: int,
+            created: Optional[float] = None, cost: float = 0.0,
+            segment: Optional[int] = None, offset: Optional[int] = None):
+        """Add or replace an entry.
+        
+        Args:
+            key: Entry key (see key_for)
+            cache_type: Cache type ('image', 'tts', ...)
+            size: File size in bytes
+            created: Creation time (defaults to now)
+            cost: Seconds it took to generate, for cost-aware eviction
+            segment: Pack segment holding the data (None for a loose file)
+            offset: Offset of the data in the segment
+        """
+        created = created or time.time()
+        with self._lock:
+            self._touches.pop(key, None)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries "
+                "(key, cache_type, size, created, last_access, hits, cost, segment, offset) "
+                "VALUES (?, ?, ?, ?, ?, 0, ?, ?, ?)",
+                (key, cache_type, size, created, created, cost, segment, offset)
+            )
+        self._changed([key])
+    
+    def location(self, key: str) -> Optional[Tuple[Optional[int], Optional[int], int]]:
+        """(segment, offset, size) of an entry, or None if not indexed.
+        
+        segment and offset are None for entries stored as loose files.
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT segment, offset, size FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+    
+    def relocate(self, moves: List[Tuple[str, Optional[int], Optional[int],
+                                         Optional[int], Optional[int]]]) -> int:
+        """Move entries between pack segments or out to loose files.
+        
+        Each move is (key, old_segment, old_offset, new_segment, new_offset);
+        entries rewritten since old_segment/old_offset was read are skipped.
+        
+        Returns:
+            Number of entries moved
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            moved = 0
+            for key, old_segment, old_offset, segment, offset in moves:
+                moved += self._conn.execute(
+                    "UPDATE entries SET segment = ?, offset = ? "
+                    "WHERE key = ? AND segment IS ? AND offset IS ?",
+                    (segment, offset, key, old_segment, old_offset)
+                ).rowcount
+            self._conn.execute("COMMIT")
+        return moved
+    
+    def packed_in(self, segment: int) -> List[Tuple[str, int, int]]:
+        """(key, offset, size) of every live entry in a pack segment."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT key, offset, size FROM entries WHERE segment = ? ORDER BY offset",
+                (segment,)
+            ).fetchall()
+    
+    def segment_usage(self) -> Dict[int, Tuple[int, int, int]]:
+        """(live entries, data bytes, key bytes) per pack segment."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT segment, COUNT(*), SUM(size), SUM(LENGTH(CAST(key AS BLOB))) "
+                "FROM entries WHERE segment IS NOT NULL GROUP BY segment"
+            ).fetchall()
+        return {row[0]: tuple(row[1:]) for row in rows}
+    
+    def contains(self, key: str) -> bool:
+        """Check whether an entry exists."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+        return row is not None
+    
+    def get(self, key: str) -> Optional[dict]:
+        """Get an entry's metadata, or None."""
+        self.flush()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT key, cache_type, size, created, last_access, hits, cost "
+                "FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+        return self._row_dict(row) if row else None
+    
+    def touch(self, key: str):
+        """Record a hit; written to the database in batches."""
+        now = time.time()
+        with self._lock:
+            hits, _ = self._touches.get(key, (0, now))
+            self._touches[key] = (hits + 1, now)
+            due = (len(self._touches) >= TOUCH_FLUSH_COUNT or
+                   time.monotonic() - self._last_flush >= TOUCH_FLUSH_INTERVAL)
+        if due:
+            self.flush()
+    
+    def flush(self):
+        """Write buffered hits to the database."""
+        with self._lock:
+            if not self._touches:
+                return
+            touches = [(hits, accessed, key)
+                       for key, (hits, accessed) in self._touches.items()]
+            self._touches.clear()
+            self._last_flush = time.monotonic()
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "UPDATE entries SET hits = hits + ?, "
+                "last_access = MAX(last_access, ?) WHERE key = ?",
+                touches
+            )
+            self._conn.execute("COMMIT")
+    
+    def remove(self, keys: List[str]):
+        """Remove entries."""
+        with self._lock:
+            for key in keys:
+                self._touches.pop(key, None)
+            self._conn.execute("BEGIN")
+            self._conn.executemany("DELETE FROM entries WHERE key = ?",
+                                   [(key,) for key in keys])
+            self._conn.execute("COMMIT")
+        self._changed(keys)
+    
+    def rename(self, old_key: str, new_key: str) -> bool:
+        """Move an entry to a new key, keeping its stats.
+        
+        Returns:
+            False if old_key is not indexed or new_key already is
+        """
+        self.flush()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE OR IGNORE entries SET key = ? WHERE key = ?", (new_key, old_key)
+            )
+            renamed = cursor.rowcount > 0
+        if renamed:
+            self._changed([old_key, new_key])
+        return renamed
+    
+    def rename_many(self, moves: List[Tuple[str, str]]) -> int:
+        """Move entries to new keys in one transaction (see rename).
+        
+        Returns:
+            Number of entries moved
+        """
+        self.flush()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            renamed = 0
+            for old_key, new_key in moves:
+                renamed += self._conn.execute(
+                    "UPDATE OR IGNORE entries SET key = ? WHERE key = ?", (new_key, old_key)
+                ).rowcount
+            self._conn.execute("COMMIT")
+        if renamed:
+            self._changed([key for move in moves for key in move])
+        return renamed
+    
+    def keys(self, cache_type: Optional[str] = None) -> List[str]:
+        """Every entry key, optionally of one type."""
+        with self._lock:
+            if cache_type is None:
+                rows = self._conn.execute("SELECT key FROM entries").fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT key FROM entries WHERE cache_type = ?", (cache_type,)
+                ).fetchall()
+        return [row[0] for row in rows]
+    
+    def select(self, cache_type: Optional[str] = None, min_hits: int = 0,
+               created_after: Optional[float] = None) -> List[dict]:
+        """Entries matching every given filter, oldest first.
+        
+        Args:
+            cache_type: Only entries of this type
+            min_hits: Only entries hit at least this often
+            created_after: Only entries created after this time (epoch seconds)
+        """
+        self.flush()
+        clauses = ["hits >= ?"]
+        params: list = [min_hits]
+        if cache_type:
+            clauses.append("cache_type = ?")
+            params.append(cache_type)
+        if created_after is not None:
+            clauses.append("created > ?")
+            params.append(created_after)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, cache_type, size, created, last_access, hits, cost "
+                f"FROM entries WHERE {' AND '.join(clauses)} ORDER BY created",
+                params
+            ).fetchall()
+        return [self._row_dict(row) for row in rows]
+    
+    def created_before(self, cutoff: float, limit: int = 1000) -> List[dict]:
+        """Entries created before cutoff (epoch seconds), oldest first.
+        
+        A limit of -1 returns every match.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, cache_type, size, created, last_access, hits, cost "
+                "FROM entries WHERE created < ? ORDER BY created LIMIT ?",
+                (cutoff, limit)
+            ).fetchall()
+        return [self._row_dict(row) for row in rows]
+    
+    def least_recent(self, limit: int, cache_type: Optional[str] = None) -> List[dict]:
+        """Least recently used entries (of one type), oldest access first."""
+        self.flush()
+        query = ("SELECT key, cache_type, size, created, last_access, hits, cost "
+                 "FROM entries ")
+        params: tuple = (limit,)
+        if cache_type:
+            query += "WHERE cache_type = ? "
+            params = (cache_type, limit)
+        with self._lock:
+            rows = self._conn.execute(
+                query + "ORDER BY last_access LIMIT ?", params
+            ).fetchall()
+        return [self._row_dict(row) for row in rows]
+    
+    def delete_entries(self, keys: List[str]) -> List[str]:
+        """Delete entry files and rows, removing hash directories left empty.
+        
+        Packed entries only lose their row. Files that cannot be deleted (e.g. open on Windows) keep their rows.
+        
+        Returns:
+            Keys of the entries deleted
+        """
+        with self._lock:
+            packed = {key for key in keys if self._conn.execute(
+                "SELECT 1 FROM entries WHERE key = ? AND segment IS NOT NULL", (key,)
+            ).fetchone()}
+        
+        # Packed data becomes dead space, reclaimed by segment compaction
+        deleted = [key for key in keys if key in packed]
+        for key in keys:
+            if key in packed:
+                continue
+            path = self.path_for(key)
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Failed to delete cache file {path}: {e}")
+                continue
+            deleted.append(key)
+            
+            if path.parent != self.cache_dir:
+                try:
+                    os.rmdir(path.parent)
+                except OSError:
+                    pass
+        
+        if deleted:
+            self.remove(deleted)
+        return deleted
+    
+    def clear(self, cache_type: Optional[str] = None) -> int:
+        """Remove all entries (of one type), returning how many."""
+        with self._lock:
+            if cache_type:
+                for key in [k for k in self._touches if k.startswith(f"{cache_type}/")]:
+                    del self._touches[key]
+                cursor = self._conn.execute(
+                    "DELETE FROM entries WHERE cache_type = ?", (cache_type,))
+            else:
+                self._touches.clear()
+                cursor = self._conn.execute("DELETE FROM entries")
+        self._changed(None)
+        return cursor.rowcount
+    
+    def stats(self) -> Dict[str, dict]:
+        """File count, total size and hits per cache type (running totals)."""
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT cache_type, files, size, hits FROM totals WHERE files > 0"
+            ).fetchall()
+        return {
+            cache_type: {'files': files, 'size': size, 'hits': hits}
+            for cache_type, files, size, hits in rows
+        }
+    
+    def get_meta(self, name: str) -> Optional[str]:
+        """Read an index-level setting."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM meta WHERE name = ?", (name,)
+            ).fetchone()
+        return row[0] if row else None
+    
+    def set_meta(self, name: str, value: str):
+        """Store an index-level setting."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+                (name, value)
+            )
+    
+    def put_failure(self, key: str, error_class: str, failures: int,
+                    retry_after: float, error: Optional[str] = None):
+        """Record a failed generation for the negative cache."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO failures (key, error_class, failures, retry_after, error) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, error_class, failures, retry_after, error)
+            )
+    
+    def load_failures(self) -> List[Tuple[str, str, int, float, Optional[str]]]:
+        """Every recorded failure as (key, error_class, failures, retry_after, error)."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT key, error_class, failures, retry_after, error FROM failures"
+            ).fetchall()
+    
+    def remove_failures(self, keys: Optional[List[str]] = None):
+        """Forget recorded failures (all of them if keys is None)."""
+        with self._lock:
+            if keys is None:
+                self._conn.execute("DELETE FROM failures")
+            else:
+                self._conn.executemany("DELETE FROM failures WHERE key = ?",
+                                       [(key,) for key in keys])
+    
+    def import_legacy(self, flat_type: Optional[str] = None) -> int:
+        """One-time import of files cached before the index existed.
+        
+        Walks the type/hash directories once, indexes every cached file
+        (taking type and creation time from its .meta if present, else
+        from the directory and mtime) and deletes the .meta files. With
+        flat_type, files directly in the cache root are indexed as that
+        type instead (the flat TTS layout).
+        
+        Returns:
+            Number of entries imported
+        """
+        if self.get_meta('legacy_imported'):
+            return 0
+        
+        if flat_type:
+            candidates = [(p, flat_type) for p in self.cache_dir.iterdir()]
+        else:
+            candidates = [(p, type_dir.name)
+                          for type_dir in self.cache_dir.iterdir() if type_dir.is_dir()
+                          for p in type_dir.glob('*/*')]
+        
+        rows = []
+        meta_files = []
+        for cache_file, cache_type in candidates:
+            if (not cache_file.is_file() or cache_file.name.startswith('.')
+                    or cache_file.name.startswith(self.db_path.name)):
+                continue
+            if cache_file.suffix == '.meta':
+                meta_files.append(cache_file)
+                continue
+            
+            stat = cache_file.stat()
+            created = stat.st_mtime
+            meta_path = cache_file.with_suffix(cache_file.suffix + '.meta')
+            try:
+                with open(meta_path, 'r') as f:
+                    metadata = json.load(f)
+                created = datetime.fromisoformat(metadata['created']).timestamp()
+            except (OSError, ValueError, KeyError):
+                pass
+            rows.append((self.key_for(cache_file), cache_type,
+                         stat.st_size, created, created))
+        
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO entries "
+                "(key, cache_type, size, created, last_access, hits) "
+                "VALUES (?, ?, ?, ?, ?, 0)",
+                rows
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (name, value) VALUES ('legacy_imported', ?)",
+                (str(time.time()),)
+            )
+            self._conn.execute("COMMIT")
+        
+        for meta_file in meta_files:
+            try:
+                meta_file.unlink()
+            except OSError as e:
+                logger.warning(f"Failed to remove {meta_file}: {e}")
+        
+        if rows:
+            logger.info(f"Imported {len(rows)} legacy cache entries into {self.db_path}")
+        return len(rows)
+    
+    def close(self):
+        """Flush buffered hits and close the database."""
+        self.flush()
+        with self._lock:
+            self._conn.close()
+    
+    @staticmethod
+    def _row_dict(row) -> dict:
+        key, cache_type, size, created, last_access, hits, cost = row
+        return {
+            'key': key,
+            'cache_type': cache_type,
+            'size': size,
+            'created': created,
+            'last_access': last_access,
+            'hits': hits,
+            'cost': cost
+        }
@@ -0,0 +1,240 @@
+"""Versioned cache keys.
+
+Keys are BLAKE2b digests (160 bit, 40 hex characters) of the canonical
+form of everything that determines an entry: the prompt or text and every
+generation parameter (model, voice, format, sampler, steps, ...). The key
+scheme version is folded into the hash personalization, so bumping
+KEY_VERSION gives every entry a new key instead of serving output from an
+older scheme. Dict payloads are canonicalized as compact sorted-key JSON,
+and their digests memoized, because the same payload is usually hashed for
+the lookup and again for the save.
+
+Version 1 keys (SHA-256 of sorted JSON, 64 hex characters; TTS keys over
+"voice:text" only) are re-keyed by the caches on first lookup. Running this
+module migrates a whole cache from a manifest of the payloads it was
+generated from, since old keys cannot be reversed:
+
+    python cachekey.py status [--cache-dir DIR] [--tts-dir DIR]
+    python cachekey.py migrate MANIFEST.jsonl [--cache-dir DIR] [--tts-dir DIR] [--dry-run]
+
+Each manifest line is one of:
+
+    {"tts": "Hello there.", "voice": "af_bella", "format": "mp3"}
+    {"type": "image", "content": {...sd params...}, "extension": "png"}
+"""
+
+import re
+import sys
+import json
+import hashlib
+import logging
+import argparse
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional, Union
+
+
+logger = logging.getLogger(__name__)
+
+
+KEY_VERSION = 2
+DIGEST_SIZE = 20
+
+# Canonicalized dict payloads whose digests are remembered
+MEMO_SIZE = 4096
+
+# Index meta setting recording that no version 1 keys are left
+KEY_VERSION_META = "key_version"
+
+_PERSON = f"cyoa-cache-v{KEY_VERSION}".encode('ascii')
+_LEGACY_NAME = re.compile(r'^[0-9a-f]{64}$')
+
+_memo: "OrderedDict[Hashable, str]" = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def _freeze(value: Any) -> Hashable:
+    """Hashable stand-in for a JSON-like value.
+    
+    Scalars carry their type, so 1, 1.0 and True (equal in Python, but
+    different JSON) do not share a digest.
+    """
+    if isinstance(value, dict):
+        return (dict, tuple(sorted((k, _freeze(v)) for k, v in value.items())))
+    if isinstance(value, (list, tuple)):
+        return (list, tuple(_freeze(v) for v in value))
+    return (type(value), value)
+
+
+def canonical(content: Union[str, bytes, dict]) -> bytes:
+    """Bytes that identify content: UTF-8 text, raw bytes or sorted JSON."""
+    if isinstance(content, str):
+        return content.encode('utf-8')
+    if isinstance(content, bytes):
+        return content
+    if isinstance(content, dict):
+        return json.dumps(content, sort_keys=True, separators=(',', ':'),
+                          ensure_ascii=False).encode('utf-8')
+    raise TypeError(f"Unsupported content type: {type(content)}")
+
+
+def content_key(content: Union[str, bytes, dict]) -> str:
+    """Current-version key for content."""
+    if not isinstance(content, dict):
+        return hashlib.blake2b(canonical(content), digest_size=DIGEST_SIZE,
+                               person=_PERSON).hexdigest()
+    
+    try:
+        frozen = _freeze(content)
+        with _memo_lock:
+            key = _memo.get(frozen)
+            if key is not None:
+                _memo.move_to_end(frozen)
+                return key
+    except TypeError:
+        # Unhashable values (e.g. sets); json.dumps decides below
+        frozen = None
+    
+    key = hashlib.blake2b(canonical(content), digest_size=DIGEST_SIZE,
+                          person=_PERSON).hexdigest()
+    if frozen is not None:
+        with _memo_lock:
+            _memo[frozen] = key
+            if len(_memo) > MEMO_SIZE:
+                _memo.popitem(last=False)
+    return key
+
+
+def legacy_content_key(content: Union[str, bytes, dict]) -> str:
+    """Version 1 CacheManager key (SHA-256 of the content)."""
+    if isinstance(content, dict):
+        return hashlib.sha256(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+    return hashlib.sha256(canonical(content)).hexdigest()
+
+
+def legacy_tts_key(text: str, voice: str) -> str:
+    """Version 1 AudioCache key, which covered only voice and text."""
+    return hashlib.sha256(f"{voice}:{text}".encode('utf-8')).hexdigest()
+
+
+def is_legacy_key(key: str) -> bool:
+    """True if an index key names a file stored under a version 1 key."""
+    name = key.rsplit('/', 1)[-1].split('.', 1)[0]
+    return bool(_LEGACY_NAME.match(name))
+
+
+def legacy_count(index) -> int:
+    """Number of entries in a CacheIndex still stored under version 1 keys."""
+    return sum(1 for key in index.keys() if is_legacy_key(key))
+
+
+def mark_current(index) -> bool:
+    """Record in the index that no version 1 keys are left, if so.
+    
+    Caches skip the version 1 fallback lookup on misses once this is set.
+    
+    Returns:
+        True if the index holds current keys only
+    """
+    if legacy_count(index):
+        return False
+    index.set_meta(KEY_VERSION_META, str(KEY_VERSION))
+    return True
+
+
+def needs_rekey(index) -> bool:
+    """True unless the index was marked as holding current keys only.
+    
+    A new, empty index is marked right away.
+    """
+    if index.get_meta(KEY_VERSION_META) == str(KEY_VERSION):
+        return False
+    if not index.stats():
+        index.set_meta(KEY_VERSION_META, str(KEY_VERSION))
+        return False
+    return True
+
+
+def migrate(manifest: Path, cache_manager=None, audio_cache=None,
+            dry_run: bool = False) -> dict:
+    """Re-key the entries listed in a manifest.
+    
+    Args:
+        manifest: JSON lines file of payloads (see module docstring)
+        cache_manager: CacheManager for typed entries (None skips them)
+        audio_cache: AudioCache for TTS lines (None skips them)
+        dry_run: Only count entries that would be re-keyed
+    
+    Returns:
+        Counts of re-keyed, missing (no version 1 entry), skipped and
+        invalid manifest lines
+    """
+    counts = {'rekeyed': 0, 'missing': 0, 'skipped': 0, 'invalid': 0}
+    
+    with open(manifest, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+                if 'tts' in item:
+                    if audio_cache is None:
+                        counts['skipped'] += 1
+                        continue
+                    done = audio_cache.rekey(item['tts'], item.get('voice'),
+                                             item.get('format'), dry_run=dry_run)
+                else:
+                    if cache_manager is None:
+                        counts['skipped'] += 1
+                        continue
+                    done = cache_manager.rekey(item['type'], item['content'],
+                                               item.get('extension', ''), dry_run=dry_run)
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning(f"Manifest line {line_number} invalid: {e}")
+                counts['invalid'] += 1
+                continue
+            counts['rekeyed' if done else 'missing'] += 1
+    
+    if not dry_run:
+        for cache in (cache_manager, audio_cache):
+            if cache is not None and mark_current(cache.index):
+                cache.legacy_keys = False
+    return counts
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Report or migrate version 1 keys from the command line."""
+    parser = argparse.ArgumentParser(description="Migrate cache entries to the current key scheme")
+    parser.add_argument('command', choices=('status', 'migrate'))
+    parser.add_argument('manifest', nargs='?', type=Path,
+                        help="JSON lines payload manifest (migrate only)")
+    parser.add_argument('--cache-dir', type=Path, help="CacheManager directory")
+    parser.add_argument('--tts-dir', type=Path, help="AudioCache directory")
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args(argv)
+    
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    
+    # Imported here: both caches import this module
+    from cache import CacheManager
+    from audio_cache import AudioCache
+    
+    cache_manager = CacheManager(args.cache_dir) if args.cache_dir else CacheManager()
+    audio_cache = AudioCache(str(args.tts_dir)) if args.tts_dir else AudioCache()
+    
+    if args.command == 'migrate':
+        if args.manifest is None:
+            parser.error("migrate needs a manifest")
+        counts = migrate(args.manifest, cache_manager, audio_cache, args.dry_run)
+        print(json.dumps(counts))
+    
+    for name, cache in (('cache', cache_manager), ('tts', audio_cache)):
+        cache.index.flush()
+        print(f"{name}: {legacy_count(cache.index)} of {len(cache.index.keys())} "
+              f"entries under version 1 keys ({cache.index.cache_dir})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
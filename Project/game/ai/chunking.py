@@ -0,0 +1,96 @@
+"""Splitting dialogue into sentence and clause chunks for TTS.
+
+Each chunk is synthesized and cached on its own, so the first sentence of a
+long line plays after the latency of a short request while the rest is
+synthesized in parallel, and short phrases that recur across lines
+("Thank you.", "Wait!") are generated once.
+
+Lines are cut after sentence-ending punctuation (keeping closing quotes and
+brackets with their sentence) unless the next word is lowercase. Sentences
+longer than max_chars are cut at clause punctuation, then between words,
+and the pieces are packed back together up to max_chars. A last chunk
+shorter than min_chars takes pieces from the end of the one before, as far
+as max_chars allows, so a sentence does not end in a lone word.
+"""
+
+import re
+import textwrap
+from typing import List
+
+
+# Sentence end: punctuation, optional closing quotes/brackets, whitespace
+SENTENCE_END = re.compile(r'[.!?…]+["\'”’)\]]*\s+')
+
+# Clause end: comma, semicolon, colon or dash, then whitespace
+CLAUSE_END = re.compile(r'[,;:–—]\s+|\s+[–—]\s+')
+
+# Words whose trailing period does not end a sentence
+ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "prof", "st", "sr", "jr", "vs",
+                 "e.g", "i.e", "no", "mt", "capt", "lt", "sgt"}
+
+
+def _split_after(pattern: re.Pattern, text: str, sentences: bool = False) -> List[str]:
+    """Cut text after every match of pattern.
+    
+    For sentences, matches after an abbreviation or before a lowercase
+    word ('"Wait!" she said') are not cuts.
+    """
+    parts = []
+    start = 0
+    for match in pattern.finditer(text):
+        if sentences:
+            word = text[start:match.start()].rsplit(None, 1)[-1:]
+            if word and word[0].lower().rstrip('.') in ABBREVIATIONS:
+                continue
+            if text[match.end():match.end() + 1].islower():
+                continue
+        parts.append(text[start:match.end()].strip())
+        start = match.end()
+    parts.append(text[start:].strip())
+    return [part for part in parts if part]
+
+
+def _pack(pieces: List[str], max_chars: int, min_chars: int) -> List[str]:
+    """Join consecutive pieces up to max_chars, topping up a tiny last chunk."""
+    words = []
+    for piece in pieces:
+        if len(piece) > max_chars:
+            words.extend(textwrap.wrap(piece, max_chars, break_long_words=False))
+        else:
+            words.append(piece)
+    
+    chunks: List[List[str]] = []
+    for piece in words:
+        if chunks and len(' '.join(chunks[-1] + [piece])) <= max_chars:
+            chunks[-1].append(piece)
+        else:
+            chunks.append([piece])
+    
+    # A tiny last chunk takes pieces from the one before, as far as they fit
+    while (len(chunks) > 1 and len(chunks[-2]) > 1
+           and len(' '.join(chunks[-1])) < min_chars
+           and len(' '.join(chunks[-2][-1:] + chunks[-1])) <= max_chars):
+        chunks[-1].insert(0, chunks[-2].pop())
+    return [' '.join(chunk) for chunk in chunks]
+
+
+def split_for_tts(text: str, max_chars: int = 200, min_chars: int = 12) -> List[str]:
+    """Split a line into chunks to synthesize separately.
+    
+    Args:
+        text: Dialogue line
+        max_chars: Longest chunk (a single longer word is kept whole)
+        min_chars: A shorter last chunk of a sentence takes pieces from
+            the chunk before
+    
+    Returns:
+        Chunks in reading order, whitespace normalized ([] for blank text)
+    """
+    text = ' '.join(text.split())
+    chunks = []
+    for sentence in _split_after(SENTENCE_END, text + ' ', sentences=True):
+        if len(sentence) <= max_chars:
+            chunks.append(sentence)
+        else:
+            chunks.extend(_pack(_split_after(CLAUSE_END, sentence), max_chars, min_chars))
+    return chunks
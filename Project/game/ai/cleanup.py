@@ -0,0 +1,381 @@
+"""Incremental, time-sliced cache cleanup.
+
+A CleanupJob works through one cache directory in two phases:
+
+    expire: delete entries older than the maximum age, a batch at a time,
+            oldest first (through the CacheIndex, no directory walk)
+    sweep:  walk the directory tree with os.scandir, one directory at a
+            time, deleting temp files left by interrupted writes and
+            sidecars whose entry is gone, indexing entry files the index
+            lost track of, and removing empty directories
+
+Work is done in slices of a few milliseconds. The position in the sweep is
+kept in the index's meta table, so a pass resumes where the last slice, or
+the last game session, stopped.
+
+The global CacheCleaner runs registered jobs on an idle daemon thread every
+cleanup_interval seconds. It keeps the thread's CPU time under
+cleanup_cpu_budget by sleeping between slices, so cleanup of a large cache
+never causes frame hitches on the Ren'Py thread.
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from config import get_config
+from cache_index import CacheIndex
+from lipsync import LIP_SUFFIX
+
+
+logger = logging.getLogger(__name__)
+
+
+# Index meta setting holding the position of an unfinished pass
+CURSOR_META = "cleanup_cursor"
+
+# Most entries expired per index query; batches shrink to fit the slice
+EXPIRE_BATCH = 200
+
+# Temp files (".name.part") older than this were left by a crashed write
+STALE_TEMP_AGE = 3600.0
+
+# Unindexed files (and empty directories) younger than this may be mid-save
+ORPHAN_GRACE = 300.0
+
+# Directories that do not hold cache entries
+SKIP_DIRS = {".locks", "packs"}
+
+# Only files named like cache entries are indexed when found untracked
+ENTRY_NAME = re.compile(r'^[0-9a-f]{40,64}\.\w+$')
+
+# Files stored next to an entry (same name, this suffix); never entries
+SIDECAR_SUFFIXES = (LIP_SUFFIX,)
+
+
+class CleanupJob:
+    """Resumable cleanup pass over one cache directory."""
+    
+    def __init__(self, index: CacheIndex, max_age_days: Optional[float] = None,
+                 single_type: Optional[str] = None):
+        """Initialize job.
+        
+        Args:
+            index: Index of the cache directory to clean
+            max_age_days: Expire entries older than this (None keeps them)
+            single_type: Cache type of every entry in a one-type cache whose
+                entries live in xx/ subdirectories (AudioCache); otherwise
+                entries live in type/xx/ subdirectories
+        """
+        self.index = index
+        self.root = index.cache_dir
+        self.max_age_days = max_age_days
+        self.single_type = single_type
+        
+        self._lock = threading.Lock()
+        self._phase, self._cursor = self._load_cursor()
+        
+        # Measured seconds per deleted entry, for sizing batches
+        self._delete_seconds = 0.001
+        
+        self.expired = 0
+        self.temp_removed = 0
+        self.sidecars_removed = 0
+        self.adopted = 0
+        self.passes = 0
+    
+    def _load_cursor(self) -> Tuple[str, Tuple[str, ...]]:
+        """Phase and last swept directory of an unfinished pass."""
+        try:
+            state = json.loads(self.index.get_meta(CURSOR_META) or 'null')
+            if state:
+                return state['phase'], tuple(state['dir'])
+        except (ValueError, KeyError, TypeError):
+            pass
+        return 'expire', ()
+    
+    def _save_cursor(self):
+        self.index.set_meta(CURSOR_META, json.dumps(
+            {'phase': self._phase, 'dir': list(self._cursor)}))
+    
+    def run_slice(self, seconds: float = 0.02) -> Tuple[int, bool]:
+        """Work for about the given wall time.
+        
+        Returns:
+            (entries expired, True if the pass finished)
+        """
+        with self._lock:
+            deadline = time.monotonic() + seconds
+            expired = 0
+            
+            if self._phase == 'expire':
+                expired, finished = self._expire(deadline)
+                if finished:
+                    self._phase, self._cursor = 'sweep', ()
+            
+            if self._phase == 'sweep' and time.monotonic() < deadline:
+                if self._sweep(deadline):
+                    self._phase, self._cursor = 'expire', ()
+                    self.passes += 1
+                    self.index.set_meta(CURSOR_META, 'null')
+                    return expired, True
+            
+            self._save_cursor()
+            return expired, False
+    
+    def run(self, max_seconds: Optional[float] = None, slice_seconds: float = 0.02) -> int:
+        """Work until the pass finishes or max_seconds have passed.
+        
+        Returns:
+            Entries expired
+        """
+        deadline = None if max_seconds is None else time.monotonic() + max_seconds
+        total = 0
+        while deadline is None or time.monotonic() < deadline:
+            count, finished = self.run_slice(slice_seconds)
+            total += count
+            if finished:
+                break
+        return total
+    
+    def _expire(self, deadline: float) -> Tuple[int, bool]:
+        """Delete batches of entries past the maximum age."""
+        if self.max_age_days is None:
+            return 0, True
+        
+        cutoff = time.time() - self.max_age_days * 86400
+        removed = 0
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                return removed, False
+            batch = int((deadline - now) / self._delete_seconds)
+            entries = self.index.created_before(cutoff, limit=min(max(batch, 1), EXPIRE_BATCH))
+            if not entries:
+                return removed, True
+            
+            deleted = self.index.delete_entries([entry['key'] for entry in entries])
+            if not deleted:
+                # Files that cannot be deleted right now; retry next pass
+                return removed, True
+            per_entry = (time.monotonic() - now) / len(entries)
+            self._delete_seconds = 0.8 * self._delete_seconds + 0.2 * per_entry
+            removed += len(deleted)
+            self.expired += len(deleted)
+    
+    def _directories(self, rel: Tuple[str, ...] = ()):
+        """Directories below root in sorted pre-order, as relative parts.
+        
+        Directories at or before the cursor are skipped, but descended into
+        while the cursor lies below them.
+        """
+        if not self._cursor or rel > self._cursor:
+            yield rel
+        elif self._cursor[:len(rel)] != rel:
+            return
+        
+        try:
+            with os.scandir(self.root.joinpath(*rel)) as it:
+                names = sorted(e.name for e in it
+                               if e.is_dir(follow_symlinks=False) and e.name not in SKIP_DIRS)
+        except OSError:
+            return
+        
+        # A one-type cache has entries one level down and nothing below
+        if self.single_type and rel:
+            return
+        for name in names:
+            yield from self._directories(rel + (name,))
+    
+    def _sweep(self, deadline: float) -> bool:
+        """Process directories until the deadline; True when the walk ends."""
+        for rel in self._directories():
+            self._sweep_directory(rel)
+            self._cursor = rel
+            if time.monotonic() >= deadline:
+                return False
+        return True
+    
+    def _sweep_directory(self, rel: Tuple[str, ...]):
+        """Clean up one directory's files."""
+        directory = self.root.joinpath(*rel)
+        now = time.time()
+        
+        # Entry files sit at xx/ (one-type cache) or at type/xx/
+        if self.single_type:
+            cache_type = self.single_type if len(rel) == 1 else None
+        else:
+            cache_type = rel[0] if len(rel) == 2 else None
+        orphans = []
+        sidecars = []
+        stems = set()
+        empty = True
+        
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if not entry.is_file(follow_symlinks=False):
+                        empty = False
+                        continue
+                    name = entry.name
+                    if name.startswith(self.index.db_path.name):
+                        empty = False
+                        continue
+                    
+                    try:
+                        stat = entry.stat(follow_symlinks=False)
+                    except FileNotFoundError:
+                        continue
+                    
+                    if name.startswith('.') and name.endswith('.part'):
+                        if now - stat.st_mtime > STALE_TEMP_AGE:
+                            self._unlink(Path(entry.path))
+                            self.temp_removed += 1
+                            continue
+                    elif name.endswith(SIDECAR_SUFFIXES):
+                        if now - stat.st_mtime > ORPHAN_GRACE:
+                            sidecars.append(name)
+                    else:
+                        stems.add(name.split('.', 1)[0])
+                        if (cache_type and ENTRY_NAME.match(name)
+                                and now - stat.st_mtime > ORPHAN_GRACE):
+                            orphans.append((name, stat))
+                    empty = False
+        except OSError as e:
+            logger.debug(f"Cleanup could not scan {directory}: {e}")
+            return
+        
+        for name in sidecars:
+            if name.split('.', 1)[0] not in stems:
+                self._unlink(directory / name)
+                self.sidecars_removed += 1
+        
+        adopted = 0
+        for name, stat in orphans:
+            key = '/'.join(rel + (name,))
+            if self.index.contains(key):
+                continue
+            self.index.put(key, cache_type, stat.st_size, created=stat.st_mtime)
+            adopted += 1
+        if adopted:
+            logger.info(f"Indexed {adopted} untracked cache files in {directory}")
+            self.adopted += adopted
+        
+        # Skip directories a writer may have just created
+        if empty and rel:
+            try:
+                if now - directory.stat().st_mtime > ORPHAN_GRACE:
+                    directory.rmdir()
+            except OSError:
+                pass
+    
+    @staticmethod
+    def _unlink(path: Path):
+        try:
+            path.unlink()
+        except OSError as e:
+            logger.debug(f"Failed to remove {path}: {e}")
+    
+    def get_stats(self) -> dict:
+        """Get progress and counters."""
+        return {
+            'root': str(self.root),
+            'phase': self._phase,
+            'cursor': '/'.join(self._cursor),
+            'passes': self.passes,
+            'expired': self.expired,
+            'temp_removed': self.temp_removed,
+            'sidecars_removed': self.sidecars_removed,
+            'adopted': self.adopted
+        }
+
+
+class CacheCleaner:
+    """Runs cleanup jobs on an idle daemon thread within a CPU budget."""
+    
+    def __init__(self, config=None):
+        """Initialize cleaner.
+        
+        Args:
+            config: Configuration (defaults to global)
+        """
+        self.config = config or get_config()
+        self._jobs: List[CleanupJob] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.cpu_seconds = 0.0
+    
+    def register(self, job: CleanupJob):
+        """Add a job and start the thread if background cleanup is enabled."""
+        with self._lock:
+            if job not in self._jobs:
+                self._jobs.append(job)
+        if self.config.cleanup_interval > 0:
+            self.start()
+    
+    def start(self):
+        """Start the background cleanup thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="cache-cleanup", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """Stop the background cleanup thread after the current slice."""
+        self._stop.set()
+    
+    def _run(self):
+        """Run a full pass of every job each interval."""
+        while not self._stop.wait(self.config.cleanup_interval):
+            with self._lock:
+                jobs = list(self._jobs)
+            for job in jobs:
+                try:
+                    self._run_job(job)
+                except Exception as e:
+                    logger.error(f"Cache cleanup of {job.root} failed: {e}")
+                if self._stop.is_set():
+                    return
+    
+    def _run_job(self, job: CleanupJob):
+        """Run slices of a job, sleeping between them to stay in budget."""
+        budget = min(max(self.config.cleanup_cpu_budget, 0.001), 1.0)
+        while not self._stop.is_set():
+            cpu_start = time.thread_time()
+            _, finished = job.run_slice(self.config.cleanup_slice)
+            used = time.thread_time() - cpu_start
+            self.cpu_seconds += used
+            if finished:
+                return
+            # used / (used + pause) == budget
+            self._stop.wait(max(used * (1 - budget) / budget, 0.001))
+    
+    def get_stats(self) -> dict:
+        """Get per-job progress and CPU time used."""
+        with self._lock:
+            jobs = list(self._jobs)
+        return {
+            'interval': self.config.cleanup_interval,
+            'cpu_budget': self.config.cleanup_cpu_budget,
+            'cpu_seconds': round(self.cpu_seconds, 3),
+            'jobs': [job.get_stats() for job in jobs]
+        }
+
+
+# Global cleaner instance
+_cleaner: Optional[CacheCleaner] = None
+
+
+def get_cleaner(config=None) -> CacheCleaner:
+    """Get or create the global cache cleaner."""
+    global _cleaner
+    if _cleaner is None:
+        _cleaner = CacheCleaner(config)
+    return _cleaner
@@ -0,0 +1,278 @@
+"""Transparent compression for cache entries.
+
+LLM scene plans, dialog JSON and summaries compress several times over.
+CacheManager encodes the cache types listed in config.cache_compression
+(e.g. 'text=zlib,json=lzma') before writing them, and decodes every entry
+it reads. Encoded data starts with a one-byte codec tag followed by the
+compressed bytes. Tags are taken from 0xF8-0xFE, which never starts valid
+UTF-8 text (nor a PNG, JPEG, MP3, WAV or OGG file), so entries written
+before compression was enabled, or by a type without compression, still
+load as they are.
+
+Codecs are pluggable through register_codec(); zlib, bz2 and lzma come
+from the standard library, zstd is registered when the zstandard package
+is installed.
+
+Run as a script to benchmark disk footprint and read latency of each codec
+against plain files (loose files take at least one filesystem block, so
+small entries only shrink on disk when pack_small_entries is on):
+
+    python codec.py [--source CACHE_DIR] [--count 500] [--codecs zlib,lzma]
+"""
+
+import bz2
+import sys
+import json
+import lzma
+import time
+import zlib
+import random
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+logger = logging.getLogger(__name__)
+
+
+# Entries smaller than this are stored plain; the tag and stream headers
+# would eat most of the saving
+MIN_COMPRESS_BYTES = 128
+
+
+@dataclass
+class Codec:
+    """A named compression scheme and its one-byte tag."""
+    name: str
+    tag: int
+    compress: Callable[[bytes], bytes]
+    decompress: Callable[[bytes], bytes]
+
+
+_codecs: Dict[str, Codec] = {}
+_by_tag: Dict[int, Codec] = {}
+
+
+def register_codec(name: str, tag: int, compress: Callable[[bytes], bytes],
+                   decompress: Callable[[bytes], bytes]) -> Codec:
+    """Make a codec available to config.cache_compression.
+    
+    Args:
+        name: Name used in the configuration
+        tag: Header byte, 0xF8-0xFE and unique among codecs
+        compress: Compresses a whole entry
+        decompress: Inverse of compress
+    
+    Returns:
+        The registered codec
+    """
+    if not 0xF8 <= tag <= 0xFE:
+        raise ValueError(f"Codec tag must be in 0xF8-0xFE: {tag:#x}")
+    if tag in _by_tag and _by_tag[tag].name != name:
+        raise ValueError(f"Codec tag {tag:#x} already used by {_by_tag[tag].name}")
+    codec = Codec(name, tag, compress, decompress)
+    _codecs[name] = codec
+    _by_tag[tag] = codec
+    return codec
+
+
+register_codec('zlib', 0xF8, lambda d: zlib.compress(d, 6), zlib.decompress)
+register_codec('lzma', 0xF9, lambda d: lzma.compress(d, preset=6), lzma.decompress)
+register_codec('bz2', 0xFA, lambda d: bz2.compress(d, 9), bz2.decompress)
+if zstandard is not None:
+    register_codec('zstd', 0xFB,
+                   lambda d: zstandard.ZstdCompressor(level=10).compress(d),
+                   lambda d: zstandard.ZstdDecompressor().decompress(d))
+
+
+def get_codec(name: str) -> Codec:
+    """Look a codec up by name.
+    
+    Raises:
+        ValueError: If no codec of that name is registered
+    """
+    try:
+        return _codecs[name]
+    except KeyError:
+        raise ValueError(f"Unknown cache codec: {name} (available: {', '.join(_codecs)})")
+
+
+def available_codecs() -> List[str]:
+    """Names of the registered codecs."""
+    return list(_codecs)
+
+
+def encode(data: bytes, codec: Optional[str]) -> bytes:
+    """Compress data with the named codec and prefix its tag.
+    
+    Small or incompressible data is returned unchanged, so it stays plain
+    on disk.
+    
+    Args:
+        data: Entry data
+        codec: Codec name, or None to store plain
+    """
+    if not codec or len(data) < MIN_COMPRESS_BYTES:
+        return data
+    c = get_codec(codec)
+    encoded = bytes((c.tag,)) + c.compress(data)
+    return encoded if len(encoded) < len(data) else data
+
+
+def decode(data: bytes) -> bytes:
+    """Undo encode(); data without a codec tag is returned unchanged."""
+    if data:
+        c = _by_tag.get(data[0])
+        if c is not None:
+            return c.decompress(data[1:])
+    return data
+
+
+# Benchmark
+
+_WORDS = (
+    "the old lighthouse keeper watches storm harbor lantern whispers secret "
+    "map tide cellar letter captain ghost fog bell cliff journal stranger "
+    "promise betrayal midnight ferry island she he they remember forget "
+    "quietly suddenly carefully door window stairs rope key blood salt"
+).split()
+
+
+def _sample_entries(count: int, seed: int = 0) -> List[bytes]:
+    """Synthetic scene plans and dialog lines shaped like LLM responses."""
+    rng = random.Random(seed)
+    
+    def sentence(n):
+        return " ".join(rng.choice(_WORDS) for _ in range(n)).capitalize() + "."
+    
+    entries = []
+    for i in range(count):
+        if i % 2:
+            plan = {
+                "scene": f"scene_{i}",
+                "location": rng.choice(_WORDS),
+                "emotion": rng.choice(["happy", "sad", "angry", "neutral", "surprised"]),
+                "beats": [{"speaker": rng.choice(["ivy", "narrator", "player"]),
+                           "line": sentence(rng.randint(8, 24))}
+                          for _ in range(rng.randint(4, 16))],
+                "choices": [sentence(6) for _ in range(rng.randint(2, 4))]
+            }
+            entries.append(json.dumps(plan, indent=2).encode('utf-8'))
+        else:
+            entries.append(" ".join(sentence(rng.randint(8, 24))
+                                    for _ in range(rng.randint(3, 30))).encode('utf-8'))
+    return entries
+
+
+def _load_entries(source: Path, count: int) -> List[bytes]:
+    """Decoded text and json entries from an existing cache directory."""
+    entries = []
+    for cache_type in ('text', 'json'):
+        for path in sorted((source / cache_type).glob('*/*')):
+            if len(entries) >= count:
+                return entries
+            entries.append(decode(path.read_bytes()))
+    return entries
+
+
+def _disk_usage(path: Path) -> int:
+    """Allocated bytes (falls back to the file size where unavailable)."""
+    st = path.stat()
+    blocks = getattr(st, 'st_blocks', None)
+    return blocks * 512 if blocks is not None else st.st_size
+
+
+def benchmark(entries: List[bytes], codecs: List[Optional[str]],
+              rounds: int = 5) -> List[dict]:
+    """Write entries once per codec and time reading them back.
+    
+    Args:
+        entries: Plain entry data
+        codecs: Codec names; None stands for today's plain files
+        rounds: Read passes per codec (the fastest pass is reported)
+    
+    Returns:
+        One result dict per codec
+    """
+    results = []
+    for codec in codecs:
+        with tempfile.TemporaryDirectory(prefix="codec-bench-") as tmp:
+            paths = []
+            start = time.perf_counter()
+            for i, data in enumerate(entries):
+                path = Path(tmp) / f"{i:06d}"
+                path.write_bytes(encode(data, codec))
+                paths.append(path)
+            write_seconds = time.perf_counter() - start
+            
+            best = float('inf')
+            for _ in range(rounds):
+                start = time.perf_counter()
+                for path in paths:
+                    with open(path, 'rb') as f:
+                        decode(f.read()).decode('utf-8')
+                best = min(best, time.perf_counter() - start)
+            
+            results.append({
+                'codec': codec or 'plain',
+                'entries': len(entries),
+                'logical_bytes': sum(p.stat().st_size for p in paths),
+                'disk_bytes': sum(_disk_usage(p) for p in paths),
+                'write_ms': round(write_seconds * 1000, 1),
+                'read_us_per_entry': round(best / max(len(paths), 1) * 1e6, 1)
+            })
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Print a benchmark table of each codec against plain files."""
+    parser = argparse.ArgumentParser(description="Benchmark cache entry compression")
+    parser.add_argument('--source', type=Path,
+                        help="Cache directory to take text/json entries from "
+                             "(default: synthetic LLM responses)")
+    parser.add_argument('--count', type=int, default=500, help="Entries to use")
+    parser.add_argument('--codecs', default=','.join(available_codecs()),
+                        help="Comma-separated codecs to compare")
+    parser.add_argument('--rounds', type=int, default=5, help="Read passes per codec")
+    args = parser.parse_args(argv)
+    
+    if args.source:
+        entries = _load_entries(args.source, args.count)
+        if not entries:
+            print(f"No text or json entries under {args.source}", file=sys.stderr)
+            return 1
+    else:
+        entries = _sample_entries(args.count)
+    
+    codecs = [None] + [c.strip() for c in args.codecs.split(',') if c.strip()]
+    for codec in codecs[1:]:
+        get_codec(codec)
+    
+    results = benchmark(entries, codecs, args.rounds)
+    plain = results[0]
+    print(f"{'codec':<8}{'entries':>9}{'bytes':>12}{'ratio':>8}{'on disk':>12}{'ratio':>8}"
+          f"{'write ms':>10}{'read us':>9}")
+    for r in results:
+        ratio = plain['logical_bytes'] / max(r['logical_bytes'], 1)
+        disk_ratio = plain['disk_bytes'] / max(r['disk_bytes'], 1)
+        print(f"{r['codec']:<8}{r['entries']:>9}{r['logical_bytes']:>12}{ratio:>7.2f}x"
+              f"{r['disk_bytes']:>12}{disk_ratio:>7.2f}x"
+              f"{r['write_ms']:>10}{r['read_us_per_entry']:>9}")
+    
+    # Loose files are allocated in whole filesystem blocks
+    if plain['disk_bytes'] and results[-1]['disk_bytes'] >= plain['disk_bytes'] * 0.9:
+        print("Entries are smaller than a disk block; the on-disk saving needs "
+              "PACK_SMALL_ENTRIES=true")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
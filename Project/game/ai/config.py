@@ -4,8 +4,8 @@ Loads environment variables and provides configuration management.
 """
 
 import os
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict
 from pathlib import Path
 
 
@@ -25,21 +25,109 @@ class Config:
     # SD WebUI Configuration
     sd_webui_url: Optional[str] = None
     
+    # Backend lists for load balancing (default to the single URLs above)
+    api_base_urls: List[str] = field(default_factory=list)
+    tts_base_urls: List[str] = field(default_factory=list)
+    sd_webui_urls: List[str] = field(default_factory=list)
+    lb_policy: str = "least_outstanding"
+    health_check_interval: float = 10.0
+    
     # Timeout Configuration (in seconds)
     connect_timeout: float = 5.0
     read_timeout: float = 30.0
     
+    # Adaptive read timeouts: clamp(p99 * factor, floor, ceiling) per
+    # endpoint and model once min_samples calls have been observed
+    adaptive_timeouts: bool = True
+    timeout_factor: float = 3.0
+    timeout_floor: float = 3.0
+    timeout_ceiling: float = 120.0
+    timeout_window: int = 200
+    timeout_min_samples: int = 20
+    
     # Retry Configuration
     max_retries: int = 3
     retry_backoff: float = 1.0
     
+    # Circuit breaker Configuration
+    breaker_failure_threshold: int = 3
+    breaker_reset_timeout: float = 5.0
+    breaker_max_probe_interval: float = 60.0
+    breaker_slow_call_threshold: float = 0.0  # seconds, 0 disables
+    breaker_probe_path: str = "/health"
+    
+    # Scheduler Configuration (concurrent requests per priority class)
+    scheduler_slots: int = 10
+    prefetch_slots: int = 4
+    background_slots: int = 2
+    
+    # Metrics Configuration (empty path disables the periodic JSON dump)
+    metrics_dump_path: str = ""
+    metrics_dump_interval: float = 60.0
+    
     # Cache Configuration
     cache_dir: Path = Path("game/assets/cache")
     max_cache_age_days: int = 30
     
+    # Cache byte budgets (0 = unlimited); the total covers every cache
+    # directory, per-type budgets cover one type ('image', 'tts', ...)
+    max_cache_bytes: int = 0
+    cache_type_budgets: Dict[str, int] = field(default_factory=dict)
+    eviction_policy: str = "lru"  # lru or cost (keeps expensive-to-regenerate entries)
+    eviction_interval: float = 60.0
+    
+    # Background cleanup (age expiry, stale temp files) on an idle thread:
+    # seconds between passes (0 disables), share of one CPU it may use and
+    # length of each work slice
+    cleanup_interval: float = 0.0
+    cleanup_cpu_budget: float = 0.05
+    cleanup_slice: float = 0.02
+    
+    # In-memory L1 in front of the disk caches (0 disables)
+    memory_cache_bytes: int = 64 * 1024 * 1024
+    
+    # Pack small cache entries into append-only segment files
+    pack_small_entries: bool = False
+    pack_max_entry_bytes: int = 64 * 1024
+    pack_segment_bytes: int = 64 * 1024 * 1024
+    pack_compact_ratio: float = 0.5  # dead share that triggers compaction
+    pack_compact_interval: float = 300.0
+    
+    # Compression codec per cache type (see codec.py); other types are
+    # stored plain
+    cache_compression: Dict[str, str] = field(
+        default_factory=lambda: {'text': 'zlib', 'json': 'zlib'})
+    
+    # Negative cache: failed generations fail fast for
+    # base * 2^(failures - 1) seconds, capped at max
+    negative_cache: bool = True
+    negative_backoff_base: float = 5.0
+    negative_backoff_max: float = 3600.0
+    
+    # Bundles mounted read-only below the caches (see bundle.py)
+    cache_bundles: List[str] = field(default_factory=list)
+    
     # Performance Configuration
     enable_prefetch: bool = True
     prefetch_delay: float = 0.5
+    prefetch_queue_size: int = 64  # lines waiting for a prefetch worker
+    
+    # Progressive TTS playback: MP3 lines start playing from the first
+    # downloaded segment (see tts_stream.py)
+    tts_streaming: bool = True
+    tts_stream_first_seconds: float = 0.5
+    tts_stream_segment_seconds: float = 2.0
+    
+    # Long lines are synthesized and cached as sentence chunks in parallel
+    # (see chunking.py)
+    tts_chunking: bool = True
+    tts_chunk_max_chars: int = 200
+    tts_chunk_workers: int = 4
+    
+    # Mouth envelopes stored next to cached TTS audio, driving the Live2D
+    # mouth during playback (see lipsync.py)
+    lipsync: bool = True
+    lipsync_fps: int = 30
     
     def validate(self) -> None:
         """Validate configuration values."""
@@ -53,6 +141,16 @@ class Config:
         if self.sd_webui_url:
             self.sd_webui_url = self.sd_webui_url.rstrip('/')
         
+        # Backend lists fall back to the single URLs; the single URLs
+        # always name the first backend so existing callers keep working
+        self.api_base_urls = [u.rstrip('/') for u in self.api_base_urls] or [self.api_base_url]
+        self.tts_base_urls = [u.rstrip('/') for u in self.tts_base_urls] or self.api_base_urls
+        self.sd_webui_urls = [u.rstrip('/') for u in self.sd_webui_urls]
+        if not self.sd_webui_urls and self.sd_webui_url:
+            self.sd_webui_urls = [self.sd_webui_url]
+        if self.sd_webui_urls:
+            self.sd_webui_url = self.sd_webui_urls[0]
+        
         # Ensure cache directory exists
         self.cache_dir.mkdir(parents=True, exist_ok=True)
 
@@ -60,6 +158,48 @@ class Config:
 _config: Optional[Config] = None
 
 
+def parse_url_list(value: Optional[str]) -> List[str]:
+    """Split a comma-separated list of URLs."""
+    if not value:
+        return []
+    return [url.strip() for url in value.split(',') if url.strip()]
+
+
+def parse_size(value: Optional[str]) -> int:
+    """Parse a byte size such as '512MB', '2G' or '1048576'."""
+    if not value:
+        return 0
+    value = value.strip().upper().rstrip('B')
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(float(value or 0))
+
+
+def parse_size_map(value: Optional[str]) -> Dict[str, int]:
+    """Parse comma-separated 'name=size' pairs, e.g. 'image=2G,tts=500MB'."""
+    sizes = {}
+    for item in (value or '').split(','):
+        if not item.strip():
+            continue
+        name, _, size = item.partition('=')
+        sizes[name.strip()] = parse_size(size)
+    return sizes
+
+
+def parse_name_map(value: Optional[str]) -> Dict[str, str]:
+    """Parse comma-separated 'name=value' pairs, e.g. 'text=zlib,json=lzma'.
+    
+    Pairs whose value is empty or 'none' are left out.
+    """
+    names = {}
+    for item in (value or '').split(','):
+        name, _, choice = item.partition('=')
+        if name.strip() and choice.strip() and choice.strip().lower() != 'none':
+            names[name.strip()] = choice.strip()
+    return names
+
+
 def load_env() -> dict:
     """Load environment variables from .env file if it exists."""
     env_vars = {}
@@ -89,22 +229,74 @@ def get_config() -> Config:
     if _config is None:
         env = load_env()
         
+        # URL settings accept comma-separated lists of backends
+        api_urls = parse_url_list(env.get('API_BASE_URL'))
+        sd_urls = parse_url_list(env.get('SD_WEBUI_URL'))
+        
         # Create config from environment
         _config = Config(
-            api_base_url=env.get('API_BASE_URL', ''),
+            api_base_url=api_urls[0] if api_urls else '',
             api_key=env.get('API_KEY', ''),
             default_chat_model=env.get('DEFAULT_CHAT_MODEL', 'Dolphin-Mistral-24B-Venice-Edition'),
             tts_model=env.get('TTS_MODEL', 'kokoro'),
             tts_voice=env.get('TTS_VOICE', 'af_heart'),
-            sd_webui_url=env.get('SD_WEBUI_URL'),
+            sd_webui_url=sd_urls[0] if sd_urls else None,
+            api_base_urls=api_urls,
+            tts_base_urls=parse_url_list(env.get('TTS_BASE_URL')),
+            sd_webui_urls=sd_urls,
+            lb_policy=env.get('LB_POLICY', 'least_outstanding'),
+            health_check_interval=float(env.get('HEALTH_CHECK_INTERVAL', '10.0')),
             connect_timeout=float(env.get('CONNECT_TIMEOUT', '5.0')),
             read_timeout=float(env.get('READ_TIMEOUT', '30.0')),
+            adaptive_timeouts=env.get('ADAPTIVE_TIMEOUTS', 'true').lower() == 'true',
+            timeout_factor=float(env.get('TIMEOUT_FACTOR', '3.0')),
+            timeout_floor=float(env.get('TIMEOUT_FLOOR', '3.0')),
+            timeout_ceiling=float(env.get('TIMEOUT_CEILING', '120.0')),
+            timeout_window=int(env.get('TIMEOUT_WINDOW', '200')),
+            timeout_min_samples=int(env.get('TIMEOUT_MIN_SAMPLES', '20')),
             max_retries=int(env.get('MAX_RETRIES', '3')),
             retry_backoff=float(env.get('RETRY_BACKOFF', '1.0')),
+            breaker_failure_threshold=int(env.get('BREAKER_FAILURE_THRESHOLD', '3')),
+            breaker_reset_timeout=float(env.get('BREAKER_RESET_TIMEOUT', '5.0')),
+            breaker_max_probe_interval=float(env.get('BREAKER_MAX_PROBE_INTERVAL', '60.0')),
+            breaker_slow_call_threshold=float(env.get('BREAKER_SLOW_CALL_THRESHOLD', '0')),
+            breaker_probe_path=env.get('BREAKER_PROBE_PATH', '/health'),
+            scheduler_slots=int(env.get('SCHEDULER_SLOTS', '10')),
+            prefetch_slots=int(env.get('PREFETCH_SLOTS', '4')),
+            background_slots=int(env.get('BACKGROUND_SLOTS', '2')),
+            metrics_dump_path=env.get('METRICS_DUMP_PATH', ''),
+            metrics_dump_interval=float(env.get('METRICS_DUMP_INTERVAL', '60.0')),
             cache_dir=Path(env.get('CACHE_DIR', 'game/assets/cache')),
             max_cache_age_days=int(env.get('MAX_CACHE_AGE_DAYS', '30')),
+            max_cache_bytes=parse_size(env.get('MAX_CACHE_BYTES')),
+            cache_type_budgets=parse_size_map(env.get('CACHE_TYPE_BUDGETS')),
+            eviction_policy=env.get('EVICTION_POLICY', 'lru'),
+            eviction_interval=float(env.get('EVICTION_INTERVAL', '60.0')),
+            cleanup_interval=float(env.get('CLEANUP_INTERVAL', '0')),
+            cleanup_cpu_budget=float(env.get('CLEANUP_CPU_BUDGET', '0.05')),
+            cleanup_slice=float(env.get('CLEANUP_SLICE', '0.02')),
+            memory_cache_bytes=parse_size(env.get('MEMORY_CACHE_BYTES', '64MB')),
+            pack_small_entries=env.get('PACK_SMALL_ENTRIES', 'false').lower() == 'true',
+            pack_max_entry_bytes=parse_size(env.get('PACK_MAX_ENTRY_BYTES', '64KB')),
+            pack_segment_bytes=parse_size(env.get('PACK_SEGMENT_BYTES', '64MB')),
+            pack_compact_ratio=float(env.get('PACK_COMPACT_RATIO', '0.5')),
+            pack_compact_interval=float(env.get('PACK_COMPACT_INTERVAL', '300')),
+            negative_cache=env.get('NEGATIVE_CACHE', 'true').lower() == 'true',
+            negative_backoff_base=float(env.get('NEGATIVE_BACKOFF_BASE', '5')),
+            negative_backoff_max=float(env.get('NEGATIVE_BACKOFF_MAX', '3600')),
+            cache_bundles=parse_url_list(env.get('CACHE_BUNDLES')),
+            cache_compression=parse_name_map(env.get('CACHE_COMPRESSION', 'text=zlib,json=zlib')),
             enable_prefetch=env.get('ENABLE_PREFETCH', 'true').lower() == 'true',
-            prefetch_delay=float(env.get('PREFETCH_DELAY', '0.5'))
+            prefetch_delay=float(env.get('PREFETCH_DELAY', '0.5')),
+            prefetch_queue_size=int(env.get('PREFETCH_QUEUE_SIZE', '64')),
+            tts_streaming=env.get('TTS_STREAMING', 'true').lower() == 'true',
+            tts_stream_first_seconds=float(env.get('TTS_STREAM_FIRST_SECONDS', '0.5')),
+            tts_stream_segment_seconds=float(env.get('TTS_STREAM_SEGMENT_SECONDS', '2.0')),
+            tts_chunking=env.get('TTS_CHUNKING', 'true').lower() == 'true',
+            tts_chunk_max_chars=int(env.get('TTS_CHUNK_MAX_CHARS', '200')),
+            tts_chunk_workers=int(env.get('TTS_CHUNK_WORKERS', '4')),
+            lipsync=env.get('LIPSYNC', 'true').lower() == 'true',
+            lipsync_fps=int(env.get('LIPSYNC_FPS', '30'))
         )
         
         # Validate configuration
@@ -0,0 +1,214 @@
+"""Background eviction keeping the caches within their byte budgets.
+
+CacheManager and AudioCache register their CacheIndex with the global
+CacheEvictor. A daemon thread checks the totals every eviction_interval
+seconds, and shortly after writes, and deletes entries until every
+per-type budget and the overall max_cache_bytes budget is met again (with
+some headroom, so eviction does not run on every write).
+
+Victims are picked from the least recently used end of each index:
+
+    lru: oldest last access first
+    cost: among the least recently used, lowest (hits + 1) * cost / size
+          first, so slow-to-regenerate assets (SD renders) outlive cheap
+          ones of the same age
+"""
+
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from config import get_config
+from cache_index import CacheIndex
+
+
+logger = logging.getLogger(__name__)
+
+
+POLICIES = ("lru", "cost")
+
+# Evict down to this fraction of a budget once it is exceeded
+LOW_WATER = 0.9
+
+# Least recently used entries considered per index and round
+CANDIDATE_WINDOW = 64
+
+# Floor for the cost of entries whose generation time is unknown
+MIN_COST = 0.01
+
+# Delay after a write before checking budgets, to batch bursts of writes
+NOTIFY_DELAY = 1.0
+
+
+class CacheEvictor:
+    """Evicts entries from registered cache indexes to meet byte budgets."""
+    
+    def __init__(self, config=None):
+        """Initialize evictor.
+        
+        Args:
+            config: Configuration (defaults to global)
+        """
+        self.config = config or get_config()
+        if self.config.eviction_policy not in POLICIES:
+            raise ValueError(f"Unknown eviction policy: {self.config.eviction_policy}")
+        
+        self._indexes: List[CacheIndex] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        
+        self.evicted_files = 0
+        self.evicted_bytes = 0
+        self.runs = 0
+    
+    @property
+    def enabled(self) -> bool:
+        """True if any byte budget is configured."""
+        return bool(self.config.max_cache_bytes or self.config.cache_type_budgets)
+    
+    def register(self, index: CacheIndex):
+        """Put a cache index under the budgets and start the thread if needed."""
+        with self._lock:
+            if index not in self._indexes:
+                self._indexes.append(index)
+        if self.enabled:
+            self.start()
+            self.notify()
+    
+    def notify(self):
+        """Signal that entries were written, so budgets are checked soon."""
+        if self.enabled:
+            self._wake.set()
+    
+    def start(self):
+        """Start the background eviction thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="cache-evictor", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """Stop the background eviction thread."""
+        self._stop.set()
+        self._wake.set()
+    
+    def _run(self):
+        """Check budgets every interval, or shortly after a write."""
+        while not self._stop.is_set():
+            if self._wake.wait(self.config.eviction_interval):
+                self._wake.clear()
+                if self._stop.wait(NOTIFY_DELAY):
+                    break
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Cache eviction failed: {e}")
+    
+    def _usage(self) -> Dict[str, int]:
+        """Bytes used per cache type across every registered index."""
+        with self._lock:
+            indexes = list(self._indexes)
+        usage: Dict[str, int] = {}
+        for index in indexes:
+            for cache_type, stats in index.stats().items():
+                usage[cache_type] = usage.get(cache_type, 0) + stats['size']
+        return usage
+    
+    def run_once(self) -> Tuple[int, int]:
+        """Evict until every budget is met.
+        
+        Returns:
+            (files evicted, bytes freed)
+        """
+        self.runs += 1
+        files = freed = 0
+        
+        usage = self._usage()
+        for cache_type, budget in self.config.cache_type_budgets.items():
+            used = usage.get(cache_type, 0)
+            if budget and used > budget:
+                f, b = self._evict(used - int(budget * LOW_WATER), cache_type)
+                files += f
+                freed += b
+        
+        budget = self.config.max_cache_bytes
+        if budget:
+            used = sum(self._usage().values())
+            if used > budget:
+                f, b = self._evict(used - int(budget * LOW_WATER))
+                files += f
+                freed += b
+        
+        if files:
+            logger.info(f"Evicted {files} cache entries ({freed} bytes)")
+        return files, freed
+    
+    def _score(self, entry: dict):
+        """Sort key; entries with the lowest key are evicted first."""
+        if self.config.eviction_policy == "cost":
+            return (entry['hits'] + 1) * max(entry['cost'], MIN_COST) / max(entry['size'], 1)
+        return entry['last_access']
+    
+    def _evict(self, need: int, cache_type: Optional[str] = None) -> Tuple[int, int]:
+        """Delete the lowest-scoring entries until need bytes are freed."""
+        with self._lock:
+            indexes = list(self._indexes)
+        
+        files = freed = 0
+        while freed < need:
+            candidates = [
+                (index, entry)
+                for index in indexes
+                for entry in index.least_recent(CANDIDATE_WINDOW, cache_type)
+            ]
+            candidates.sort(key=lambda c: self._score(c[1]))
+            
+            # Pick just enough victims, then delete them per index
+            victims: Dict[CacheIndex, List[dict]] = {}
+            planned = freed
+            for index, entry in candidates:
+                if planned >= need:
+                    break
+                victims.setdefault(index, []).append(entry)
+                planned += entry['size']
+            
+            progress = False
+            for index, entries in victims.items():
+                sizes = {e['key']: e['size'] for e in entries}
+                for key in index.delete_entries(list(sizes)):
+                    files += 1
+                    freed += sizes[key]
+                    progress = True
+            if not progress:
+                break
+        
+        self.evicted_files += files
+        self.evicted_bytes += freed
+        return files, freed
+    
+    def get_stats(self) -> dict:
+        """Get usage against budgets and eviction counters."""
+        return {
+            'usage': self._usage(),
+            'max_cache_bytes': self.config.max_cache_bytes,
+            'type_budgets': dict(self.config.cache_type_budgets),
+            'policy': self.config.eviction_policy,
+            'evicted_files': self.evicted_files,
+            'evicted_bytes': self.evicted_bytes,
+            'runs': self.runs
+        }
+
+
+# Global evictor instance
+_evictor: Optional[CacheEvictor] = None
+
+
+def get_evictor(config=None) -> CacheEvictor:
+    """Get or create the global cache evictor."""
+    global _evictor
+    if _evictor is None:
+        _evictor = CacheEvictor(config)
+    return _evictor
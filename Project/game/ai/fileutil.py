@@ -0,0 +1,303 @@
+"""File helpers for writing cache entries safely and incrementally."""
+
+import os
+import time
+import base64
+import hashlib
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from typing import BinaryIO, Callable, Dict, Hashable, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+logger = logging.getLogger(__name__)
+
+
+# Attempts at replacing a file a reader holds open (Windows only)
+REPLACE_ATTEMPTS = 10
+
+
+@contextmanager
+def atomic_write(path: Union[str, Path], mode: str = 'wb', encoding: str = None):
+    """Write to a temp file next to path, then rename it into place.
+    
+    Readers never see a partially written file: the final path either does
+    not exist yet or holds the complete data. If the block raises, the temp
+    file is removed and path is left untouched.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_name = tempfile.mkstemp(
+        dir=path.parent, prefix=f".{path.name}.", suffix=".part"
+    )
+    
+    try:
+        with os.fdopen(fd, mode, encoding=encoding) as f:
+            yield f
+        replace_file(temp_name, path)
+    except BaseException:
+        try:
+            os.unlink(temp_name)
+        except OSError:
+            pass
+        raise
+
+
+@contextmanager
+def staging_path(path: Union[str, Path]):
+    """Reserve a temp path next to path for a writer that creates its own file.
+    
+    Lets a slow write (a download, a generation) run without holding the
+    entry's lock: the caller moves the finished file into place with
+    replace_file under the lock. Whatever is left at the temp path when
+    the block exits is removed.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_name = tempfile.mkstemp(
+        dir=path.parent, prefix=f".{path.name}.", suffix=".part"
+    )
+    os.close(fd)
+    
+    try:
+        yield Path(temp_name)
+    finally:
+        try:
+            os.unlink(temp_name)
+        except OSError:
+            pass
+
+
+def replace_file(source: Union[str, Path], target: Union[str, Path]):
+    """os.replace, retrying while Windows refuses to replace an open file."""
+    for attempt in range(REPLACE_ATTEMPTS):
+        try:
+            os.replace(source, target)
+            return
+        except PermissionError:
+            if os.name != 'nt' or attempt == REPLACE_ATTEMPTS - 1:
+                raise
+            time.sleep(0.05 * (attempt + 1))
+
+
+class KeyLocks:
+    """Exclusive per-key locks shared by threads and processes.
+    
+    Threads lock the key itself. Processes additionally lock a lock file of
+    the key's own in lock_dir (flock, or msvcrt on Windows), removed again
+    on release, so only holders of the same key ever contend.
+    
+    Hold a key only to check for an entry and publish it, not while it is
+    generated or downloaded; atomic_write already keeps partial files out
+    of sight.
+    
+    Usage:
+        with locks.hold(key):
+            ...  # is it cached yet? rename into place, update the index
+    """
+    
+    def __init__(self, lock_dir: Union[str, Path]):
+        """Initialize locks.
+        
+        Args:
+            lock_dir: Directory for the lock files (created on demand)
+        """
+        self.lock_dir = Path(lock_dir)
+        self._lock = threading.Lock()
+        # key -> [lock, holders and waiters]
+        self._keys: Dict[Hashable, list] = {}
+    
+    @contextmanager
+    def hold(self, key: Hashable):
+        """Hold the lock for key for the duration of the block."""
+        with self._lock:
+            entry = self._keys.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        
+        try:
+            with entry[0]:
+                with self._file_lock(key):
+                    yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._keys[key]
+    
+    def _lock_path(self, key: Hashable) -> Path:
+        """Lock file of key (keys may contain path separators, so it is hashed)."""
+        digest = hashlib.sha256(str(key).encode('utf-8')).hexdigest()[:32]
+        return self.lock_dir / f"{digest}.lock"
+    
+    @contextmanager
+    def _file_lock(self, key: Hashable):
+        """Hold the lock file of key, removing it on release."""
+        path = self._lock_path(key)
+        self.lock_dir.mkdir(parents=True, exist_ok=True)
+        while True:
+            fd = os.open(str(path), os.O_RDWR | os.O_CREAT)
+            try:
+                _lock_fd(fd)
+            except BaseException:
+                os.close(fd)
+                raise
+            # The previous holder may have removed the file while we waited,
+            # in which case a newcomer can lock a new one at the same path
+            try:
+                if os.fstat(fd).st_ino == os.stat(str(path)).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            _unlock_fd(fd)
+            os.close(fd)
+        
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                # Removed while still locked, so waiters notice and retry
+                try:
+                    os.unlink(str(path))
+                except OSError:
+                    pass
+                _unlock_fd(fd)
+                os.close(fd)
+            else:
+                _unlock_fd(fd)
+                os.close(fd)
+                # Windows cannot remove a file another process has open;
+                # the last one to close it does
+                try:
+                    os.unlink(str(path))
+                except OSError:
+                    pass
+
+
+def _lock_fd(fd: int):
+    """Lock an open lock file exclusively, waiting as long as it takes."""
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return
+    # LK_LOCK gives up after ten one-second attempts
+    while True:
+        try:
+            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            continue
+
+
+def _unlock_fd(fd: int):
+    """Release a lock taken by _lock_fd."""
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+class TeeWriter:
+    """Writes to a file and hands every write to a callback as well.
+    
+    Used to play or inspect a download while it is being cached.
+    """
+    
+    def __init__(self, out: BinaryIO, on_write: Callable[[bytes], None]):
+        self.out = out
+        self.on_write = on_write
+    
+    def write(self, data: bytes) -> int:
+        written = self.out.write(data)
+        self.on_write(bytes(data))
+        return written
+
+
+class Base64FieldDecoder:
+    """Incrementally decodes a base64 string field out of a JSON stream.
+    
+    Used to write large base64 payloads (SD images, JSON-wrapped TTS audio)
+    straight to disk chunk by chunk, without holding the whole response or
+    the decoded bytes in memory. Finds the first string value under the
+    given key, including the first element if the value is an array.
+    """
+    
+    _SEARCH, _PRELUDE, _VALUE, _DONE = range(4)
+    
+    def __init__(self, field: str, out: BinaryIO):
+        """Initialize decoder writing decoded bytes to out."""
+        self.out = out
+        self._marker = f'"{field}"'.encode('utf-8')
+        self._state = self._SEARCH
+        self._buf = b''
+        self._pending = b''
+        self.bytes_written = 0
+    
+    @property
+    def complete(self) -> bool:
+        """True once the whole field value has been decoded."""
+        return self._state == self._DONE
+    
+    def feed(self, chunk: bytes):
+        """Consume the next chunk of the JSON response body."""
+        if self._state == self._DONE:
+            return
+        self._buf += chunk
+        
+        if self._state == self._SEARCH:
+            idx = self._buf.find(self._marker)
+            if idx < 0:
+                # Keep enough bytes to match a marker split across chunks
+                self._buf = self._buf[-(len(self._marker) - 1):]
+                return
+            self._buf = self._buf[idx + len(self._marker):]
+            self._state = self._PRELUDE
+        
+        if self._state == self._PRELUDE:
+            for i, c in enumerate(self._buf):
+                if c in b' \t\r\n:[':
+                    continue
+                if c == ord('"'):
+                    self._buf = self._buf[i + 1:]
+                    self._state = self._VALUE
+                    break
+                # Key did not hold a string; look for the next occurrence
+                self._buf = self._buf[i:]
+                self._state = self._SEARCH
+                self.feed(b'')
+                return
+            else:
+                self._buf = b''
+                return
+        
+        if self._state == self._VALUE:
+            end = self._buf.find(b'"')
+            data = self._buf if end < 0 else self._buf[:end]
+            self._buf = b''
+            
+            # JSON may escape '/' as '\/'; base64 never contains '\'
+            self._pending += data.replace(b'\\', b'')
+            usable = len(self._pending) // 4 * 4
+            self._write(self._pending[:usable])
+            self._pending = self._pending[usable:]
+            
+            if end >= 0:
+                if self._pending:
+                    padding = b'=' * (-len(self._pending) % 4)
+                    self._write(self._pending + padding)
+                    self._pending = b''
+                self._state = self._DONE
+    
+    def _write(self, encoded: bytes):
+        """Decode and write a base64 block whose length is a multiple of 4."""
+        if encoded:
+            decoded = base64.b64decode(encoded)
+            self.out.write(decoded)
+            self.bytes_written += len(decoded)
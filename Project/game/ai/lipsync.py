@@ -0,0 +1,250 @@
+"""Lip-sync envelopes for cached TTS audio.
+
+When a TTS file is cached, its loudness is analysed once and stored next to
+it as a sidecar ({key}.lip): one byte of mouth opening (0-255) per frame
+at lipsync_fps. During playback the Live2D update function only indexes
+into that array by playback position (see audio_tts.rpy), so no audio is
+analysed on the render thread.
+
+MP3 is not decoded: the loudness of each granule is estimated from the
+global_gain field of its Layer III side info (the quantizer step, about
+1.5 dB per unit), which encoders raise and lower with the signal level;
+granules without big_values are treated as silent. WAV is measured as the
+RMS of each frame's samples. Other formats get no envelope.
+
+Levels are normalized to the clip's peak over DYNAMIC_RANGE_DB, and the
+mouth closes at most RELEASE_PER_SECOND so it does not flutter between
+syllables.
+"""
+
+import math
+import wave
+import struct
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+from fileutil import atomic_write
+from tts_stream import parse_frame_header
+
+try:
+    import audioop
+except ImportError:
+    audioop = None
+
+
+logger = logging.getLogger(__name__)
+
+
+LIP_SUFFIX = ".lip"
+
+# Sidecar header: magic and frames per second, then one byte per frame
+_HEADER = struct.Struct('<4sH')
+_MAGIC = b'LIP1'
+
+# Quietest level (below the clip's peak) that still opens the mouth
+DYNAMIC_RANGE_DB = 30.0
+
+# Quantizer step of one global_gain unit, 20 * log10(2 ** 0.25)
+GAIN_STEP_DB = 1.505
+
+# Fastest closing, in full openings per second
+RELEASE_PER_SECOND = 6.0
+
+
+@dataclass
+class LipEnvelope:
+    """Mouth opening per frame of a clip."""
+    fps: int
+    values: bytes
+    
+    @property
+    def duration(self) -> float:
+        return len(self.values) / self.fps
+    
+    def value_at(self, seconds: float) -> float:
+        """Mouth opening (0.0-1.0) at a playback position."""
+        index = int(seconds * self.fps)
+        if 0 <= index < len(self.values):
+            return self.values[index] / 255
+        return 0.0
+
+
+def sidecar_path(audio_path: Union[str, Path]) -> Path:
+    """Path of the envelope stored for an audio file."""
+    return Path(audio_path).with_suffix(LIP_SUFFIX)
+
+
+def _skip_id3(data: bytes) -> int:
+    """Offset of the first byte after a leading ID3v2 tag."""
+    if len(data) < 10 or data[:3] != b'ID3':
+        return 0
+    size = 10 + ((data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14
+                 | (data[8] & 0x7F) << 7 | (data[9] & 0x7F))
+    return size + 10 if data[5] & 0x10 else size
+
+
+def _granule_levels(frame: bytes) -> List[Optional[float]]:
+    """Estimated level (dB) of each granule of a Layer III frame; None if silent."""
+    mpeg1 = (frame[1] >> 3) & 3 == 3
+    mono = frame[3] >> 6 == 3
+    channels = 1 if mono else 2
+    # A clear protection bit means a 16-bit CRC follows the header
+    start = 4 if frame[1] & 1 else 6
+    size = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    if len(frame) < start + size:
+        return []
+    
+    bits = int.from_bytes(frame[start:start + size], 'big')
+    total = size * 8
+    
+    def field(pos: int, width: int) -> int:
+        return (bits >> (total - pos - width)) & ((1 << width) - 1)
+    
+    # main_data_begin, private bits and (MPEG-1) scfsi precede the granules
+    if mpeg1:
+        pos = 9 + (5 if mono else 3) + 4 * channels
+        granules, granule_bits = 2, 59
+    else:
+        pos = 8 + (1 if mono else 2)
+        granules, granule_bits = 1, 63
+    
+    levels = []
+    for _ in range(granules):
+        level = None
+        for _ in range(channels):
+            # part2_3_length (12 bits), big_values (9), global_gain (8)
+            if field(pos + 12, 9):
+                db = field(pos + 21, 8) * GAIN_STEP_DB
+                level = db if level is None else max(level, db)
+            pos += granule_bits
+        levels.append(level)
+    return levels
+
+
+def mp3_levels(data: bytes) -> Tuple[List[Optional[float]], float]:
+    """Estimated level of every granule of an MP3 stream.
+    
+    Returns:
+        (level in dB or None per granule, seconds per granule); no levels
+        if data holds no Layer III frames
+    """
+    levels: List[Optional[float]] = []
+    step = 0.0
+    pos = _skip_id3(data)
+    first = True
+    while len(data) - pos >= 4:
+        parsed = parse_frame_header(data[pos:pos + 4])
+        if parsed is None:
+            pos += 1
+            continue
+        length, duration = parsed
+        frame = data[pos:pos + length]
+        pos += length
+        if (frame[1] >> 1) & 3 != 1:
+            # Layer I or II: no side info to read
+            continue
+        # The Xing/Info frame carries no audio
+        if first:
+            first = False
+            if b'Xing' in frame[:64] or b'Info' in frame[:64]:
+                continue
+        granules = _granule_levels(frame)
+        if granules:
+            levels.extend(granules)
+            step = duration / len(granules)
+    return levels, step
+
+
+def wav_levels(path: Union[str, Path], fps: int) -> Tuple[List[Optional[float]], float]:
+    """RMS level of each 1/fps window of a PCM WAV file.
+    
+    Returns:
+        (level in dB or None per window, seconds per window); no levels
+        without audioop
+    """
+    if audioop is None:
+        return [], 0.0
+    levels: List[Optional[float]] = []
+    with wave.open(str(path), 'rb') as wav:
+        width = wav.getsampwidth()
+        channels = wav.getnchannels()
+        window = max(wav.getframerate() // fps, 1)
+        while True:
+            chunk = wav.readframes(window)
+            if not chunk:
+                break
+            if width == 1:
+                # 8-bit WAV is unsigned
+                chunk = audioop.bias(chunk, 1, -128)
+            if channels == 2:
+                chunk = audioop.tomono(chunk, width, 0.5, 0.5)
+            rms = audioop.rms(chunk, width)
+            levels.append(20 * math.log10(rms) if rms else None)
+        step = window / wav.getframerate()
+    return levels, step
+
+
+def build_envelope(levels: List[Optional[float]], step: float, fps: int) -> LipEnvelope:
+    """Turn levels at step-second intervals into a smoothed envelope at fps."""
+    frames = math.ceil(len(levels) * step * fps) if levels else 0
+    binned: List[Optional[float]] = [None] * frames
+    for i, level in enumerate(levels):
+        if level is None:
+            continue
+        index = min(int(i * step * fps), frames - 1)
+        if binned[index] is None or level > binned[index]:
+            binned[index] = level
+    
+    voiced = [level for level in binned if level is not None]
+    floor = max(voiced) - DYNAMIC_RANGE_DB if voiced else 0.0
+    release = RELEASE_PER_SECOND / fps
+    values = bytearray(frames)
+    current = 0.0
+    for i, level in enumerate(binned):
+        target = 0.0 if level is None else min(max((level - floor) / DYNAMIC_RANGE_DB, 0.0), 1.0)
+        current = target if target >= current else max(target, current - release)
+        values[i] = round(current * 255)
+    return LipEnvelope(fps, bytes(values))
+
+
+def analyze(audio_path: Union[str, Path], fps: int = 30) -> Optional[LipEnvelope]:
+    """Compute the envelope of an audio file.
+    
+    Returns:
+        The envelope, or None for formats that cannot be analysed
+    """
+    audio_path = Path(audio_path)
+    suffix = audio_path.suffix.lower()
+    if suffix == '.mp3':
+        levels, step = mp3_levels(audio_path.read_bytes())
+    elif suffix == '.wav':
+        levels, step = wav_levels(audio_path, fps)
+    else:
+        return None
+    if not levels:
+        return None
+    return build_envelope(levels, step, fps)
+
+
+def write_envelope(audio_path: Union[str, Path], envelope: LipEnvelope):
+    """Store an envelope as the sidecar of an audio file."""
+    with atomic_write(sidecar_path(audio_path), 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, envelope.fps))
+        f.write(envelope.values)
+
+
+def read_envelope(audio_path: Union[str, Path]) -> Optional[LipEnvelope]:
+    """Load the sidecar of an audio file, or None if it has none."""
+    try:
+        data = sidecar_path(audio_path).read_bytes()
+    except OSError:
+        return None
+    if len(data) < _HEADER.size:
+        return None
+    magic, fps = _HEADER.unpack_from(data)
+    if magic != _MAGIC or not fps:
+        logger.warning(f"Ignoring malformed lip-sync sidecar of {audio_path}")
+        return None
+    return LipEnvelope(fps, data[_HEADER.size:])
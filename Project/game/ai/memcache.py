@@ -0,0 +1,138 @@
+"""In-process L1 cache in front of the disk caches.
+
+Holds recently used cache entries (file contents, or just the fact that a
+file exists for path lookups) in an LRU bounded by a byte cap, so repeated
+lookups of the same asset cost no syscalls. Entries are keyed by
+(cache root, index key) and dropped whenever the CacheIndex reports the
+entry replaced, evicted or cleared.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from config import get_config
+
+
+logger = logging.getLogger(__name__)
+
+
+# Value for entries known to exist on disk whose data is not held in memory
+PRESENT = object()
+
+# Accounted size of a PRESENT entry (key, path and bookkeeping)
+PRESENT_SIZE = 256
+
+
+class MemoryCache:
+    """Thread-safe LRU of cache values bounded by total size in bytes."""
+    
+    def __init__(self, max_bytes: int, max_item_bytes: Optional[int] = None):
+        """Initialize cache.
+        
+        Args:
+            max_bytes: Total size cap (0 disables the cache)
+            max_item_bytes: Larger values are not cached (default max_bytes / 8,
+                so one big image cannot flush everything else)
+        """
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes if max_item_bytes is not None else max_bytes // 8
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get a value and mark it most recently used."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+    
+    def put(self, key: Hashable, value: Any, size: Optional[int] = None):
+        """Store a value, evicting least recently used entries to fit.
+        
+        Args:
+            key: Cache key
+            value: bytes, str or PRESENT
+            size: Accounted size (defaults to len(value))
+        """
+        if size is None:
+            size = PRESENT_SIZE if value is PRESENT else len(value)
+        if not self.max_bytes or size > self.max_item_bytes:
+            return
+        
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (value, size)
+            self.size += size
+            
+            while self.size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+    
+    def discard(self, key: Hashable):
+        """Drop one entry if present."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.size -= entry[1]
+    
+    def discard_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drop every entry whose key matches predicate."""
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                self.size -= self._entries.pop(key)[1]
+            return len(keys)
+    
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+    
+    def get_stats(self) -> dict:
+        """Get entry count, size and hit rate."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'size': self.size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+
+def invalidator(memory: MemoryCache, namespace: Hashable) -> Callable:
+    """CacheIndex listener dropping a namespace's changed entries from memory."""
+    def on_change(keys):
+        if keys is None:
+            memory.discard_where(lambda key: key[0] == namespace)
+        else:
+            for key in keys:
+                memory.discard((namespace, key))
+    return on_change
+
+
+# Global memory cache instance
+_memory_cache: Optional[MemoryCache] = None
+
+
+def get_memory_cache(config=None) -> MemoryCache:
+    """Get or create the global memory cache."""
+    global _memory_cache
+    if _memory_cache is None:
+        config = config or get_config()
+        _memory_cache = MemoryCache(config.memory_cache_bytes)
+    return _memory_cache
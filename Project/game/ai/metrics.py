@@ -0,0 +1,220 @@
+"""Per-endpoint request instrumentation for the AI backend clients.
+
+Every request made through APIClient is recorded here, keyed by endpoint
+path (/api/generate, /v1/chat/completions, /v1/audio/speech,
+/sdapi/v1/txt2img, ...). Latency is split into phases so backend,
+network and client-side slowness can be told apart:
+
+    queue_wait: waiting for a scheduler slot (client side)
+    ttfb: request sent until response headers parsed (network + backend)
+    transfer: reading and decoding the body (network + client side)
+    latency: all of the above
+"""
+
+import json
+import math
+import time
+import logging
+import threading
+from pathlib import Path
+from collections import Counter
+from urllib.parse import urlsplit
+from typing import Dict, Optional, Union
+
+from fileutil import atomic_write
+
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyHistogram:
+    """Fixed log-spaced histogram for latency percentiles in O(1) memory."""
+    
+    # Bucket upper bounds from 1ms to ~10 minutes, 20% apart
+    BOUNDS = [0.001 * 1.2 ** i for i in range(int(math.log(600000, 1.2)) + 2)]
+    
+    def __init__(self):
+        """Initialize an empty histogram."""
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+    
+    def add(self, seconds: float):
+        """Record one sample."""
+        index = 0
+        if seconds > self.BOUNDS[0]:
+            index = min(int(math.log(seconds / self.BOUNDS[0], 1.2)) + 1,
+                        len(self.BOUNDS))
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+    
+    def percentile(self, q: float) -> float:
+        """Estimate the q-th quantile (0 < q <= 1) from bucket bounds."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                if index >= len(self.BOUNDS):
+                    return self.max
+                return min(self.BOUNDS[index], self.max)
+        return self.max
+    
+    def summary(self) -> dict:
+        """Get p50/p95/p99, mean and max in seconds."""
+        return {
+            'p50': round(self.percentile(0.50), 4),
+            'p95': round(self.percentile(0.95), 4),
+            'p99': round(self.percentile(0.99), 4),
+            'mean': round(self.total / self.count, 4) if self.count else 0.0,
+            'max': round(self.max, 4)
+        }
+
+
+class EndpointStats:
+    """Counters and latency histograms for one endpoint."""
+    
+    def __init__(self):
+        """Initialize empty stats."""
+        self.requests = 0
+        self.retries = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.errors: Counter = Counter()
+        self.latency = LatencyHistogram()
+        self.queue_wait = LatencyHistogram()
+        self.ttfb = LatencyHistogram()
+        self.transfer = LatencyHistogram()
+    
+    def to_dict(self) -> dict:
+        """Convert to a JSON-serializable summary."""
+        return {
+            'requests': self.requests,
+            'errors': dict(self.errors),
+            'error_count': sum(self.errors.values()),
+            'retries': self.retries,
+            'bytes_out': self.bytes_out,
+            'bytes_in': self.bytes_in,
+            'latency': self.latency.summary(),
+            'queue_wait': self.queue_wait.summary(),
+            'ttfb': self.ttfb.summary(),
+            'transfer': self.transfer.summary()
+        }
+
+
+class MetricsRegistry:
+    """Thread-safe collection of per-endpoint stats."""
+    
+    def __init__(self):
+        """Initialize empty registry."""
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, EndpointStats] = {}
+        self._started = time.time()
+        self._dump_thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+    
+    def record(self, url: str, latency: float, error_class: Optional[str] = None,
+               queue_wait: float = 0.0, ttfb: Optional[float] = None,
+               bytes_out: int = 0, bytes_in: int = 0, retries: int = 0):
+        """Record one completed (or failed) request.
+        
+        Args:
+            url: Request URL; stats are keyed by its path
+            latency: Total time from slot grant to body read, in seconds
+            error_class: Failure class, or None on success
+            queue_wait: Time spent waiting for a scheduler slot
+            ttfb: Time until response headers, if a response arrived
+            bytes_out: Request body size
+            bytes_in: Response body size
+            retries: Retries performed by the transport
+        """
+        endpoint = urlsplit(url).path or url
+        
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = EndpointStats()
+            
+            stats.requests += 1
+            stats.retries += retries
+            stats.bytes_out += bytes_out
+            stats.bytes_in += bytes_in
+            if error_class:
+                stats.errors[error_class] += 1
+            
+            stats.latency.add(latency)
+            stats.queue_wait.add(queue_wait)
+            if ttfb is not None:
+                stats.ttfb.add(ttfb)
+                stats.transfer.add(max(latency - ttfb, 0.0))
+    
+    def get_stats(self, endpoint: Optional[str] = None) -> dict:
+        """Get a summary for one endpoint path, or all endpoints."""
+        with self._lock:
+            if endpoint is not None:
+                stats = self._endpoints.get(endpoint)
+                return stats.to_dict() if stats else {}
+            return {
+                'since': self._started,
+                'endpoints': {path: s.to_dict() for path, s in self._endpoints.items()}
+            }
+    
+    def reset(self):
+        """Drop all recorded stats."""
+        with self._lock:
+            self._endpoints.clear()
+            self._started = time.time()
+    
+    def dump_json(self, path: Union[str, Path], extra: Optional[dict] = None):
+        """Write the current stats (plus any extra sections) to a JSON file."""
+        data = self.get_stats()
+        data['timestamp'] = time.time()
+        if extra:
+            data.update(extra)
+        
+        with atomic_write(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+    
+    def start_periodic_dump(self, path: Union[str, Path], interval: float,
+                            extra_fn=None):
+        """Dump stats to path every interval seconds on a daemon thread.
+        
+        Args:
+            path: JSON file to (re)write
+            interval: Seconds between dumps
+            extra_fn: Optional callable returning extra sections to include
+        """
+        if self._dump_thread is not None and self._dump_thread.is_alive():
+            return
+        
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.dump_json(path, extra_fn() if extra_fn else None)
+                except Exception as e:
+                    logger.warning(f"Failed to dump metrics to {path}: {e}")
+        
+        self._stop.clear()
+        self._dump_thread = threading.Thread(target=run, name="metrics-dump", daemon=True)
+        self._dump_thread.start()
+    
+    def stop_periodic_dump(self):
+        """Stop the periodic dump thread."""
+        self._stop.set()
+
+
+# Global metrics registry
+_metrics: Optional[MetricsRegistry] = None
+
+
+def get_metrics() -> MetricsRegistry:
+    """Get or create the global metrics registry."""
+    global _metrics
+    if _metrics is None:
+        _metrics = MetricsRegistry()
+    return _metrics
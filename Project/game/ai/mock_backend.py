@@ -0,0 +1,439 @@
+"""Local stand-in for the AI backends, for offline testing and benchmarking.
+
+Implements the endpoints APIClient, AudioCache and CacheManager talk to:
+
+    POST /api/generate            Ollama-style text, NDJSON when streaming
+    POST /v1/chat/completions     OpenAI-style chat, SSE when streaming
+    POST /v1/audio/speech         TTS audio (silent MP3 frames or WAV)
+    POST /sdapi/v1/txt2img        SD WebUI image as base64 PNG
+    GET  /health                  Health probe
+    GET  /mock/stats              Request counters
+
+Latency, payload sizes, error rates and 429 bursts are configurable and
+random draws are seeded, so client-side performance work can be measured
+reproducibly on a plain machine without a GPU:
+
+    python mock_backend.py --port 8000 --latency tts=lognormal:1.5:0.4 \\
+        --error-rate 0.02 --burst-every 30 --burst-length 3
+
+Point API_BASE_URL, TTS_BASE_URL and SD_WEBUI_URL at it. It can also be
+started in-process with MockBackend(settings).start().
+"""
+
+import io
+import json
+import math
+import time
+import wave
+import zlib
+import base64
+import random
+import struct
+import logging
+import argparse
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+# Endpoint path -> latency model name
+ENDPOINTS = {
+    '/api/generate': 'generate',
+    '/v1/chat/completions': 'chat',
+    '/v1/audio/speech': 'tts',
+    '/sdapi/v1/txt2img': 'sd'
+}
+
+DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal", "exponential")
+
+WORDS = ("the", "a", "quiet", "city", "light", "she", "said", "rain", "door",
+         "and", "was", "of", "night", "you", "remember", "station", "train")
+
+# One silent MPEG-1 Layer III frame: 128 kbps, 44.1 kHz, no padding
+MP3_FRAME = b'\xff\xfb\x90\x00' + b'\x00' * 413
+MP3_FRAME_SECONDS = 1152 / 44100
+
+
+@dataclass
+class LatencyModel:
+    """Random delay in seconds drawn from a simple distribution."""
+    distribution: str = "fixed"
+    mean: float = 0.0
+    spread: float = 0.0
+    
+    @classmethod
+    def parse(cls, spec: str) -> 'LatencyModel':
+        """Parse 'distribution:mean[:spread]', e.g. 'lognormal:2.0:0.5'."""
+        parts = spec.split(':')
+        if parts[0] not in DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {parts[0]}")
+        return cls(
+            distribution=parts[0],
+            mean=float(parts[1]) if len(parts) > 1 else 0.0,
+            spread=float(parts[2]) if len(parts) > 2 else 0.0
+        )
+    
+    def sample(self, rng: random.Random) -> float:
+        """Draw one delay (never negative).
+        
+        For lognormal, spread is the sigma of the underlying normal and the
+        distribution is scaled so its median is mean.
+        """
+        if self.mean <= 0:
+            return 0.0
+        if self.distribution == "uniform":
+            value = rng.uniform(self.mean - self.spread, self.mean + self.spread)
+        elif self.distribution == "normal":
+            value = rng.gauss(self.mean, self.spread)
+        elif self.distribution == "lognormal":
+            value = rng.lognormvariate(math.log(self.mean), self.spread)
+        elif self.distribution == "exponential":
+            value = rng.expovariate(1.0 / self.mean)
+        else:
+            value = self.mean
+        return max(value, 0.0)
+
+
+@dataclass
+class MockSettings:
+    """Behaviour of the mock backend."""
+    
+    # Time to first byte per endpoint ('generate', 'chat', 'tts', 'sd')
+    latency: Dict[str, LatencyModel] = field(default_factory=lambda: {
+        'generate': LatencyModel("lognormal", 0.5, 0.3),
+        'chat': LatencyModel("lognormal", 0.5, 0.3),
+        'tts': LatencyModel("lognormal", 1.0, 0.3),
+        'sd': LatencyModel("lognormal", 5.0, 0.2)
+    })
+    
+    # Delay between streamed tokens
+    token_latency: LatencyModel = field(
+        default_factory=lambda: LatencyModel("fixed", 0.02))
+    
+    # Payload sizes
+    tokens_per_response: int = 60
+    seconds_per_char: float = 0.06  # Length of synthesized speech
+    noisy_images: bool = True  # Random pixels compress like real renders
+    
+    # Failures: plain 500s, and periodic windows where every call gets 429
+    error_rate: float = 0.0
+    burst_every: float = 0.0  # seconds between 429 bursts, 0 disables
+    burst_length: float = 0.0
+    
+    seed: Optional[int] = 0
+
+
+class MockBackend:
+    """Threaded HTTP server emulating the Ollama, OpenAI TTS and SD APIs."""
+    
+    def __init__(self, settings: Optional[MockSettings] = None,
+                 host: str = "127.0.0.1", port: int = 0):
+        """Initialize server (port 0 picks a free port).
+        
+        Args:
+            settings: Mock behaviour (defaults to MockSettings())
+            host: Interface to bind
+            port: Port to bind
+        """
+        self.settings = settings or MockSettings()
+        self._rng = random.Random(self.settings.seed)
+        self._rng_lock = threading.Lock()
+        self._started = time.monotonic()
+        self._thread: Optional[threading.Thread] = None
+        self.requests: Counter = Counter()
+        self.errors: Counter = Counter()
+        
+        self.server = ThreadingHTTPServer((host, port), _MockHandler)
+        self.server.daemon_threads = True
+        self.server.backend = self
+    
+    @property
+    def url(self) -> str:
+        """Base URL of the running server."""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def start(self) -> 'MockBackend':
+        """Serve on a daemon thread."""
+        self._thread = threading.Thread(
+            target=self.server.serve_forever,
+            name="mock-backend",
+            daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Mock backend listening on {self.url}")
+        return self
+    
+    def stop(self):
+        """Stop serving and close the socket."""
+        self.server.shutdown()
+        self.server.server_close()
+    
+    def __enter__(self):
+        """Context manager entry."""
+        return self.start()
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Context manager exit."""
+        self.stop()
+    
+    def delay(self, model: LatencyModel) -> float:
+        """Draw a delay from the shared seeded generator."""
+        with self._rng_lock:
+            return model.sample(self._rng)
+    
+    def chance(self, probability: float) -> bool:
+        """Return True with the given probability."""
+        if probability <= 0:
+            return False
+        with self._rng_lock:
+            return self._rng.random() < probability
+    
+    def in_burst(self) -> Optional[float]:
+        """Seconds left in the current 429 burst, or None outside one."""
+        s = self.settings
+        if s.burst_every <= 0 or s.burst_length <= 0:
+            return None
+        # Each period ends with a burst, so a fresh server starts healthy
+        remaining = s.burst_every - (time.monotonic() - self._started) % s.burst_every
+        if remaining <= s.burst_length:
+            return remaining
+        return None
+    
+    def words(self, count: int) -> list:
+        """Generate count tokens of filler text."""
+        with self._rng_lock:
+            return [(' ' if i else '') + self._rng.choice(WORDS) for i in range(count)]
+    
+    def image_png(self, width: int, height: int) -> bytes:
+        """Encode an RGB PNG of the given size."""
+        row_bytes = width * 3
+        if self.settings.noisy_images:
+            with self._rng_lock:
+                pixels = self._rng.randbytes(row_bytes * height)
+        else:
+            pixels = b'\x80' * (row_bytes * height)
+        rows = b''.join(b'\x00' + pixels[y * row_bytes:(y + 1) * row_bytes]
+                        for y in range(height))
+        
+        def chunk(kind: bytes, data: bytes) -> bytes:
+            body = kind + data
+            return struct.pack('>I', len(data)) + body + \
+                struct.pack('>I', zlib.crc32(body) & 0xffffffff)
+        
+        return (b'\x89PNG\r\n\x1a\n'
+                + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+                + chunk(b'IDAT', zlib.compress(rows, 6))
+                + chunk(b'IEND', b''))
+    
+    def speech(self, text: str, response_format: str) -> bytes:
+        """Synthesize silence as long as the text would take to speak."""
+        seconds = max(len(text) * self.settings.seconds_per_char, 0.2)
+        if response_format == "wav":
+            buf = io.BytesIO()
+            with wave.open(buf, 'wb') as w:
+                w.setnchannels(1)
+                w.setsampwidth(2)
+                w.setframerate(24000)
+                w.writeframes(b'\x00\x00' * int(seconds * 24000))
+            return buf.getvalue()
+        return MP3_FRAME * max(int(seconds / MP3_FRAME_SECONDS), 1)
+    
+    def get_stats(self) -> dict:
+        """Get request and injected error counts per endpoint."""
+        return {
+            'requests': dict(self.requests),
+            'errors': dict(self.errors),
+            'uptime': round(time.monotonic() - self._started, 1)
+        }
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    """Request handler; state lives on server.backend."""
+    
+    protocol_version = 'HTTP/1.1'
+    
+    @property
+    def backend(self) -> MockBackend:
+        return self.server.backend
+    
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+    
+    def _send(self, status: int, body: bytes, content_type: str,
+              headers: Optional[dict] = None):
+        """Send a complete response."""
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _send_json(self, data: dict, status: int = 200,
+                   headers: Optional[dict] = None):
+        self._send(status, json.dumps(data).encode('utf-8'),
+                   'application/json', headers)
+    
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json({'status': 'ok'})
+        elif self.path == '/mock/stats':
+            self._send_json(self.backend.get_stats())
+        else:
+            self._send_json({'error': 'not found'}, 404)
+    
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError:
+            self._send_json({'error': 'invalid JSON'}, 400)
+            return
+        
+        name = ENDPOINTS.get(self.path)
+        if name is None:
+            self._send_json({'error': 'not found'}, 404)
+            return
+        
+        backend = self.backend
+        backend.requests[name] += 1
+        
+        # Injected failures are cheap, like a real overloaded server
+        burst_left = backend.in_burst()
+        if burst_left is not None:
+            backend.errors[f'{name}_429'] += 1
+            self._send_json({'error': 'rate limited'}, 429,
+                            {'Retry-After': str(max(int(burst_left), 1))})
+            return
+        if backend.chance(backend.settings.error_rate):
+            backend.errors[f'{name}_500'] += 1
+            self._send_json({'error': 'injected failure'}, 500)
+            return
+        
+        latency = backend.settings.latency.get(name)
+        if latency is not None:
+            time.sleep(backend.delay(latency))
+        
+        getattr(self, f'_handle_{name}')(body)
+    
+    def _handle_generate(self, body: dict):
+        tokens = self.backend.words(self.backend.settings.tokens_per_response)
+        model = body.get('model', 'mock')
+        
+        if not body.get('stream'):
+            self._send_json({'model': model, 'response': ''.join(tokens), 'done': True})
+            return
+        
+        self._start_stream('application/x-ndjson')
+        for token in tokens:
+            self._stream_write(json.dumps(
+                {'model': model, 'response': token, 'done': False}) + '\n')
+        self._stream_write(json.dumps({'model': model, 'response': '', 'done': True}) + '\n')
+    
+    def _handle_chat(self, body: dict):
+        tokens = self.backend.words(self.backend.settings.tokens_per_response)
+        model = body.get('model', 'mock')
+        
+        if not body.get('stream'):
+            self._send_json({
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': ''.join(tokens)},
+                    'finish_reason': 'stop'
+                }]
+            })
+            return
+        
+        self._start_stream('text/event-stream')
+        for token in tokens:
+            chunk = {'model': model, 'choices': [{'index': 0, 'delta': {'content': token}}]}
+            self._stream_write(f"data: {json.dumps(chunk)}\n\n")
+        self._stream_write("data: [DONE]\n\n")
+    
+    def _handle_tts(self, body: dict):
+        response_format = body.get('response_format', 'mp3')
+        audio = self.backend.speech(body.get('input', ''), response_format)
+        content_type = 'audio/wav' if response_format == 'wav' else 'audio/mpeg'
+        self._send(200, audio, content_type)
+    
+    def _handle_sd(self, body: dict):
+        width = int(body.get('width', 512))
+        height = int(body.get('height', 512))
+        image = self.backend.image_png(width, height)
+        self._send_json({
+            'images': [base64.b64encode(image).decode('ascii')],
+            'parameters': body,
+            'info': json.dumps({'seed': body.get('seed', -1)})
+        })
+    
+    def _start_stream(self, content_type: str):
+        """Begin a body of unknown length, closed when the stream ends."""
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+    
+    def _stream_write(self, text: str):
+        """Write one streamed chunk after the inter-token delay."""
+        time.sleep(self.backend.delay(self.backend.settings.token_latency))
+        self.wfile.write(text.encode('utf-8'))
+        self.wfile.flush()
+
+
+def main(argv=None):
+    """Run the mock backend from the command line."""
+    parser = argparse.ArgumentParser(description="Mock AI backend for offline benchmarking")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', action='append', default=[], metavar='NAME=SPEC',
+                        help="Per-endpoint latency, e.g. sd=lognormal:8:0.3 "
+                             "(names: generate, chat, tts, sd)")
+    parser.add_argument('--token-latency', default='fixed:0.02', metavar='SPEC')
+    parser.add_argument('--tokens', type=int, default=60)
+    parser.add_argument('--seconds-per-char', type=float, default=0.06)
+    parser.add_argument('--flat-images', action='store_true',
+                        help="Solid-colour images (small payloads)")
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--burst-every', type=float, default=0.0)
+    parser.add_argument('--burst-length', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    
+    settings = MockSettings(
+        token_latency=LatencyModel.parse(args.token_latency),
+        tokens_per_response=args.tokens,
+        seconds_per_char=args.seconds_per_char,
+        noisy_images=not args.flat_images,
+        error_rate=args.error_rate,
+        burst_every=args.burst_every,
+        burst_length=args.burst_length,
+        seed=args.seed
+    )
+    for item in args.latency:
+        name, _, spec = item.partition('=')
+        if name not in settings.latency:
+            parser.error(f"Unknown endpoint name: {name}")
+        settings.latency[name] = LatencyModel.parse(spec)
+    
+    logging.basicConfig(level=logging.INFO)
+    backend = MockBackend(settings, args.host, args.port)
+    logger.info(f"Mock backend listening on {backend.url}")
+    try:
+        backend.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        backend.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
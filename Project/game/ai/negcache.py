@@ -0,0 +1,158 @@
+"""Negative cache for failed generations.
+
+When generating a TTS line or an image fails, the failure is recorded under
+the same key the asset would have been cached under, with its error class.
+Until the entry's backoff expires, lookups of that key fail immediately
+instead of waiting out another request and retry cycle against the backend.
+
+Each further failure doubles the backoff, up to negative_backoff_max.
+Failures that will repeat for the same request (HTTP 4xx such as a rejected
+prompt or content filter, or a JSON reply without the expected audio or
+image) start from a much longer backoff than transient ones (timeouts,
+connection errors, 5xx, 429). A success clears the entry.
+
+Entries live in memory for microsecond checks and are written through to a
+table in the cache's SQLite index, so known-bad requests stay known across
+sessions.
+"""
+
+import time
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from config import get_config
+from cache_index import CacheIndex
+
+
+logger = logging.getLogger(__name__)
+
+
+# Failures that say nothing about the request itself
+IGNORED_CLASSES = {"cancelled", "circuit_open", "write", "not_configured"}
+
+# Failure classes expected to repeat for the same request
+PERSISTENT_CLASSES = {"http_400", "http_403", "http_404", "http_413", "http_422",
+                      "unexpected_json", "ValueError"}
+
+# Backoff multiplier for persistent failures
+PERSISTENT_FACTOR = 60
+
+
+@dataclass
+class NegativeEntry:
+    """A recorded failure and when the request may be tried again."""
+    error_class: str
+    failures: int
+    retry_after: float
+    error: Optional[str] = None
+    
+    @property
+    def active(self) -> bool:
+        """True while the request should not be retried."""
+        return time.time() < self.retry_after
+
+
+class NegativeCache:
+    """Failed generations per cache key, with exponential backoff."""
+    
+    def __init__(self, index: CacheIndex, config=None):
+        """Load the failures recorded in index.
+        
+        Args:
+            index: Index of the cache the keys belong to
+            config: Configuration (defaults to global)
+        """
+        self.config = config or get_config()
+        self.index = index
+        self._lock = threading.Lock()
+        self._entries: Dict[str, NegativeEntry] = {
+            key: NegativeEntry(error_class, failures, retry_after, error)
+            for key, error_class, failures, retry_after, error in index.load_failures()
+        }
+        self.hits = 0
+    
+    @property
+    def enabled(self) -> bool:
+        return self.config.negative_cache
+    
+    def check(self, key: str) -> Optional[NegativeEntry]:
+        """Get the failure blocking key, or None if it may be generated."""
+        if not self.enabled:
+            return None
+        entry = self._entries.get(key)
+        if entry is None or not entry.active:
+            return None
+        self.hits += 1
+        return entry
+    
+    def record(self, key: str, error_class: Optional[str],
+               error: Optional[str] = None) -> Optional[NegativeEntry]:
+        """Record a failed generation and back off further.
+        
+        Args:
+            key: Cache key of the asset
+            error_class: APIResponse.failure_class (or exception name)
+            error: Error message, for logs and stats
+        
+        Returns:
+            The updated entry, or None if the failure is not cached
+        """
+        error_class = error_class or "unknown"
+        if not self.enabled or error_class in IGNORED_CLASSES:
+            return None
+        
+        base = self.config.negative_backoff_base
+        if error_class in PERSISTENT_CLASSES:
+            base *= PERSISTENT_FACTOR
+        
+        with self._lock:
+            previous = self._entries.get(key)
+            failures = previous.failures + 1 if previous else 1
+            delay = min(base * 2 ** (failures - 1), self.config.negative_backoff_max)
+            entry = NegativeEntry(error_class, failures, time.time() + delay, error)
+            self._entries[key] = entry
+        
+        self.index.put_failure(key, error_class, failures, entry.retry_after,
+                               error[:500] if error else None)
+        logger.info(f"Negative-cached {key[:16]}... ({error_class}, "
+                    f"failure {failures}, retry in {delay:.0f}s)")
+        return entry
+    
+    def clear(self, key: str):
+        """Forget a key's failures after it was generated."""
+        if key not in self._entries:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+        self.index.remove_failures([key])
+    
+    def clear_all(self, prefix: str = ""):
+        """Forget every failure (of keys starting with prefix)."""
+        with self._lock:
+            if not prefix:
+                self._entries.clear()
+            else:
+                keys = [key for key in self._entries if key.startswith(prefix)]
+                for key in keys:
+                    del self._entries[key]
+        if not prefix:
+            self.index.remove_failures()
+        elif keys:
+            self.index.remove_failures(keys)
+    
+    def get_stats(self) -> dict:
+        """Get entry counts per error class."""
+        with self._lock:
+            entries = list(self._entries.values())
+        by_class: Dict[str, int] = {}
+        for entry in entries:
+            if entry.active:
+                by_class[entry.error_class] = by_class.get(entry.error_class, 0) + 1
+        return {
+            'entries': len(entries),
+            'active': sum(by_class.values()),
+            'by_class': by_class,
+            'hits': self.hits
+        }
@@ -0,0 +1,268 @@
+"""Append-only pack files for small cache entries.
+
+Thousands of small LLM text and JSON responses cost one inode, one directory
+entry and an open/close per read when stored as loose files. PackStore
+appends them to segment files instead (packs/000001.pack, ...), keeps each
+entry's segment and offset in the CacheIndex, and serves reads from
+memory-mapped views of the segments.
+
+Deleted or replaced entries leave dead bytes behind. A background thread
+compacts sealed segments whose dead share passes a threshold by copying
+their live entries into the active segment and deleting the old file.
+
+Each record is a small header (magic, key length, data length), the key and
+the data, so segments stay self-describing.
+
+Several processes may share a pack directory. Appends, rotation and
+compaction hold a lock file in the directory; each append first follows
+any newer segment another process started and takes its offset from the
+segment's size on disk, not from its own file position.
+"""
+
+import os
+import mmap
+import struct
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from config import get_config
+from cache_index import CacheIndex
+from fileutil import KeyLocks
+
+
+logger = logging.getLogger(__name__)
+
+
+RECORD_MAGIC = b'CPK1'
+RECORD_HEADER = struct.Struct('>4sHI')
+
+# Key of the lock serializing segment writes across processes
+WRITE_LOCK = "segments"
+
+
+class PackStore:
+    """Segment files holding small cache entries, indexed by a CacheIndex."""
+    
+    def __init__(self, pack_dir: Path, index: CacheIndex, config=None):
+        """Open the pack directory.
+        
+        Args:
+            pack_dir: Directory holding the segment files
+            index: Index recording each packed entry's segment and offset
+            config: Configuration (defaults to global)
+        """
+        self.config = config or get_config()
+        self.pack_dir = Path(pack_dir)
+        self.pack_dir.mkdir(parents=True, exist_ok=True)
+        self.index = index
+        
+        self._lock = threading.RLock()
+        self._write_locks = KeyLocks(self.pack_dir / ".locks")
+        self._maps: Dict[int, mmap.mmap] = {}
+        self._files: Dict[int, object] = {}
+        
+        segments = self._segments()
+        self.active = segments[-1] if segments else 1
+        self._writer = open(self._segment_path(self.active), 'ab')
+        
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.compactions = 0
+    
+    def _segment_path(self, segment: int) -> Path:
+        return self.pack_dir / f"{segment:06d}.pack"
+    
+    def _segments(self) -> list:
+        """Numbers of the segment files on disk, ascending."""
+        return sorted(int(p.stem) for p in self.pack_dir.glob('*.pack') if p.stem.isdigit())
+    
+    def append(self, key: str, data: bytes) -> Tuple[int, int]:
+        """Append an entry to the active segment.
+        
+        Returns:
+            (segment, offset of the data)
+        """
+        with self._lock, self._write_locks.hold(WRITE_LOCK):
+            self._follow()
+            return self._append_locked(key, data)
+    
+    def _append_locked(self, key: str, data: bytes) -> Tuple[int, int]:
+        """Append an entry to the active segment (locks held)."""
+        encoded_key = key.encode('utf-8')
+        header = RECORD_HEADER.pack(RECORD_MAGIC, len(encoded_key), len(data))
+        
+        # Other processes append too, so our file position is no guide
+        self._writer.seek(0, os.SEEK_END)
+        end = os.fstat(self._writer.fileno()).st_size
+        if end + len(header) + len(encoded_key) + len(data) \
+                > self.config.pack_segment_bytes and end > 0:
+            self._rotate()
+            end = 0
+        
+        self._writer.write(header + encoded_key + data)
+        self._writer.flush()
+        return self.active, end + len(header) + len(encoded_key)
+    
+    def _follow(self):
+        """Switch to the newest segment, which another process may have
+        started, or reopen ours if it was deleted (locks held)."""
+        active = self.active
+        while self._segment_path(active + 1).exists():
+            active += 1
+        if active != self.active or not self._segment_path(active).exists():
+            self._writer.close()
+            self.active = active
+            self._writer = open(self._segment_path(self.active), 'ab')
+    
+    def _rotate(self):
+        """Seal the active segment and start the next one (locks held)."""
+        self._writer.close()
+        self.active += 1
+        self._writer = open(self._segment_path(self.active), 'ab')
+        logger.debug(f"Started pack segment {self.active}")
+    
+    def read(self, segment: int, offset: int, size: int) -> bytes:
+        """Read an entry's data through the segment's memory map.
+        
+        Raises:
+            FileNotFoundError: If the segment was compacted away
+        """
+        with self._lock:
+            view = self._maps.get(segment)
+            if view is None or offset + size > len(view):
+                view = self._map(segment)
+            return view[offset:offset + size]
+    
+    def _map(self, segment: int) -> mmap.mmap:
+        """(Re)map a segment read-only at its current length (lock held)."""
+        self._unmap(segment)
+        f = open(self._segment_path(segment), 'rb')
+        try:
+            view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty segment
+            f.close()
+            raise FileNotFoundError(f"Pack segment {segment} is empty")
+        self._files[segment] = f
+        self._maps[segment] = view
+        return view
+    
+    def _unmap(self, segment: int):
+        """Close a segment's map and file handle (lock held)."""
+        view = self._maps.pop(segment, None)
+        if view is not None:
+            view.close()
+        f = self._files.pop(segment, None)
+        if f is not None:
+            f.close()
+    
+    def compact(self, threshold: Optional[float] = None) -> int:
+        """Rewrite sealed segments whose dead share exceeds threshold.
+        
+        Args:
+            threshold: Dead byte fraction (defaults to config.pack_compact_ratio)
+        
+        Returns:
+            Number of segments compacted
+        """
+        threshold = self.config.pack_compact_ratio if threshold is None else threshold
+        usage = self.index.segment_usage()
+        compacted = 0
+        
+        for segment in self._segments():
+            if segment >= self.active:
+                continue
+            try:
+                total = self._segment_path(segment).stat().st_size
+            except FileNotFoundError:
+                # Compacted by another process
+                continue
+            count, data_bytes, key_bytes = usage.get(segment, (0, 0, 0))
+            live = count * RECORD_HEADER.size + key_bytes + data_bytes
+            if total and 1 - live / total < threshold:
+                continue
+            if self._compact_segment(segment):
+                compacted += 1
+        
+        self.compactions += compacted
+        return compacted
+    
+    def _compact_segment(self, segment: int) -> bool:
+        """Copy a segment's live entries to the active segment and delete it.
+        
+        Returns:
+            True if the segment was compacted (not already by another process)
+        """
+        with self._lock, self._write_locks.hold(WRITE_LOCK):
+            self._follow()
+            if segment >= self.active or not self._segment_path(segment).exists():
+                return False
+            
+            moves = []
+            for key, offset, size in self.index.packed_in(segment):
+                data = self.read(segment, offset, size)
+                new_segment, new_offset = self._append_locked(key, data)
+                moves.append((key, segment, offset, new_segment, new_offset))
+            self.index.relocate(moves)
+            
+            self._unmap(segment)
+            try:
+                self._segment_path(segment).unlink()
+            except OSError as e:
+                logger.warning(f"Failed to delete pack segment {segment}: {e}")
+                return False
+        logger.info(f"Compacted pack segment {segment} ({len(moves)} live entries)")
+        return True
+    
+    def start_compaction(self):
+        """Compact periodically on a daemon thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        
+        def run():
+            while not self._stop.wait(self.config.pack_compact_interval):
+                try:
+                    self.compact()
+                except Exception as e:
+                    logger.error(f"Pack compaction failed: {e}")
+        
+        self._thread = threading.Thread(target=run, name="pack-compaction", daemon=True)
+        self._thread.start()
+    
+    def reset(self):
+        """Delete every segment and start empty (after the index was cleared)."""
+        with self._lock, self._write_locks.hold(WRITE_LOCK):
+            for segment in list(self._maps):
+                self._unmap(segment)
+            self._writer.close()
+            for segment in self._segments():
+                try:
+                    self._segment_path(segment).unlink()
+                except OSError as e:
+                    logger.warning(f"Failed to delete pack segment {segment}: {e}")
+            self.active = 1
+            self._writer = open(self._segment_path(self.active), 'ab')
+    
+    def get_stats(self) -> dict:
+        """Get segment count, file bytes and live bytes."""
+        usage = self.index.segment_usage()
+        segments = self._segments()
+        return {
+            'segments': len(segments),
+            'active': self.active,
+            'file_bytes': sum(self._segment_path(s).stat().st_size for s in segments),
+            'live_entries': sum(count for count, _, _ in usage.values()),
+            'live_bytes': sum(size for _, size, _ in usage.values()),
+            'compactions': self.compactions
+        }
+    
+    def close(self):
+        """Stop compaction and close every file."""
+        self._stop.set()
+        with self._lock:
+            for segment in list(self._maps):
+                self._unmap(segment)
+            self._writer.close()
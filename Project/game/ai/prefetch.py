@@ -0,0 +1,166 @@
+"""Bounded worker pool for speculative prefetches.
+
+Jobs are queued under a key (e.g. a TTS line's cache key); submitting a key
+that is already queued or running returns the existing job's Future
+instead of queueing it twice. A fixed number of daemon workers take jobs
+in submission order and run them at Priority.PREFETCH, tagged with the
+job's group, so the request scheduler serves the line the player is
+waiting on first.
+
+Queued jobs can be cancelled by group, e.g. when the player jumps to
+another scene. Requests of running jobs that are still waiting for a
+scheduler slot are cancelled with them; a request already on the wire
+finishes and its result is cached as usual.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Hashable, List, Optional
+
+from scheduler import Priority, request_priority, get_scheduler
+
+
+logger = logging.getLogger(__name__)
+
+
+class _Job:
+    """A queued or running prefetch."""
+    
+    def __init__(self, key: Hashable, fn: Callable[[], Any],
+                 group: Optional[Hashable]):
+        self.key = key
+        self.fn = fn
+        self.group = group
+        self.future: Future = Future()
+
+
+class PrefetchPool:
+    """Deduplicated, cancellable job queue served by a few worker threads."""
+    
+    def __init__(self, workers: int = 4, max_queued: int = 64, name: str = "prefetch"):
+        """Initialize pool; workers start with the first job.
+        
+        Args:
+            workers: Worker threads (jobs running at once)
+            max_queued: Jobs waiting beyond this are refused
+            name: Thread name prefix
+        """
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self.name = name
+        
+        self._cond = threading.Condition()
+        self._queue: "OrderedDict[Hashable, _Job]" = OrderedDict()
+        self._running: dict = {}
+        self._threads: List[threading.Thread] = []
+        
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.refused = 0
+    
+    def submit(self, key: Hashable, fn: Callable[[], Any],
+               group: Optional[Hashable] = None) -> Optional[Future]:
+        """Queue fn unless a job for key is already queued or running.
+        
+        Args:
+            key: Identity of the job, for deduplication and lookup
+            fn: Work to run on a worker thread
+            group: Tag for cancel()
+        
+        Returns:
+            Future of the job's result, or None if the queue is full
+        """
+        with self._cond:
+            job = self._queue.get(key) or self._running.get(key)
+            if job is not None:
+                return job.future
+            if len(self._queue) >= self.max_queued:
+                self.refused += 1
+                logger.debug(f"Prefetch queue full, dropped {str(key)[:16]}...")
+                return None
+            
+            job = _Job(key, fn, group)
+            self._queue[key] = job
+            self._start_workers()
+            self._cond.notify()
+            return job.future
+    
+    def future(self, key: Hashable) -> Optional[Future]:
+        """Future of the queued or running job for key, if any."""
+        with self._cond:
+            job = self._queue.get(key) or self._running.get(key)
+            return job.future if job is not None else None
+    
+    def cancel(self, group: Optional[Hashable] = None) -> int:
+        """Cancel queued jobs and their requests still waiting for a slot.
+        
+        Args:
+            group: Only cancel jobs tagged with this group (None for all)
+        
+        Returns:
+            Number of queued jobs cancelled plus the number of requests
+            cancelled in the scheduler. A running job whose request was
+            still queued counts once; it fails with RequestCancelled (or
+            the result its function makes of that) rather than being
+            cancelled itself.
+        """
+        with self._cond:
+            matched = [job for job in self._queue.values()
+                       if group is None or job.group == group]
+            for job in matched:
+                del self._queue[job.key]
+                job.future.cancel()
+            self.cancelled += len(matched)
+        
+        requests = get_scheduler().cancel(Priority.PREFETCH, group)
+        if matched:
+            logger.info(f"Cancelled {len(matched)} queued prefetches")
+        return len(matched) + requests
+    
+    def _start_workers(self):
+        """Start missing worker threads (lock held)."""
+        self._threads = [t for t in self._threads if t.is_alive()]
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, daemon=True,
+                                      name=f"{self.name}-{len(self._threads)}")
+            thread.start()
+            self._threads.append(thread)
+    
+    def _work(self):
+        """Run queued jobs in order, forever."""
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                _, job = self._queue.popitem(last=False)
+                self._running[job.key] = job
+            
+            if job.future.set_running_or_notify_cancel():
+                try:
+                    with request_priority(Priority.PREFETCH, job.group):
+                        result = job.fn()
+                    job.future.set_result(result)
+                    self.completed += 1
+                except Exception as e:
+                    logger.debug(f"Prefetch {str(job.key)[:16]}... failed: {e}")
+                    job.future.set_exception(e)
+                    self.failed += 1
+            
+            with self._cond:
+                self._running.pop(job.key, None)
+    
+    def get_stats(self) -> dict:
+        """Get queue length and job counters."""
+        with self._cond:
+            return {
+                'workers': self.workers,
+                'queued': len(self._queue),
+                'running': len(self._running),
+                'completed': self.completed,
+                'failed': self.failed,
+                'cancelled': self.cancelled,
+                'refused': self.refused
+            }
@@ -0,0 +1,343 @@
+"""Priority scheduling for backend requests.
+
+Every request made by APIClient takes a slot from the shared
+RequestScheduler first. Slots are granted to the highest-priority waiter,
+and each priority class has its own concurrency limit, so speculative
+prefetches can never starve the line the player is waiting on.
+
+The priority of a request comes from the calling thread's context:
+
+    with request_priority(Priority.PREFETCH, group="scene_2"):
+        api_client.generate_speech(text)
+
+Queued requests can later be cancelled or deprioritized by class or group,
+for example when the player jumps to another scene.
+
+Coroutines wait for a slot with acquire_async, which takes no thread while
+queued; holding() then lets the APIClient calls made with that slot use it
+instead of queueing again (see async_api.py).
+"""
+
+import asyncio
+import itertools
+import logging
+import threading
+import contextvars
+from enum import IntEnum
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Hashable
+
+from config import get_config
+
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Request priority classes (lower value is served first)."""
+    INTERACTIVE = 0
+    PREFETCH = 1
+    BACKGROUND = 2
+
+
+class RequestCancelled(Exception):
+    """Raised when a queued request is cancelled before it gets a slot."""
+
+
+_current_priority = contextvars.ContextVar('request_priority',
+                                           default=Priority.INTERACTIVE)
+_current_group = contextvars.ContextVar('request_group', default=None)
+
+# Slot granted to the current context ahead of its requests (see holding)
+_held_slot = contextvars.ContextVar('held_slot', default=None)
+
+
+@contextmanager
+def request_priority(priority: Priority, group: Optional[Hashable] = None):
+    """Run the enclosed requests at the given priority and group."""
+    priority_token = _current_priority.set(priority)
+    group_token = _current_group.set(group)
+    try:
+        yield
+    finally:
+        _current_group.reset(group_token)
+        _current_priority.reset(priority_token)
+
+
+def current_priority() -> Priority:
+    """Priority of requests made from the current context."""
+    return _current_priority.get()
+
+
+def current_group() -> Optional[Hashable]:
+    """Group tag of requests made from the current context."""
+    return _current_group.get()
+
+
+class _Waiter:
+    """A request waiting for a slot."""
+    
+    def __init__(self, priority: Priority, seq: int,
+                 group: Optional[Hashable], key: Optional[Hashable]):
+        self.priority = priority
+        self.seq = seq
+        self.group = group
+        self.key = key
+        self.granted = False
+        self.cancelled = False
+        # Called (lock held) when granted or cancelled, for async waiters
+        self.wake: Optional[Callable[[], None]] = None
+    
+    def sort_key(self):
+        return (self.priority, self.seq)
+
+
+class RequestScheduler:
+    """Grants request slots by priority with per-class concurrency limits."""
+    
+    def __init__(self, total_slots: int = 10,
+                 class_limits: Optional[Dict[Priority, int]] = None):
+        """Initialize scheduler.
+        
+        Args:
+            total_slots: Maximum requests in flight across all classes
+            class_limits: Maximum requests in flight per priority class
+        """
+        self.total_slots = total_slots
+        self.class_limits = {p: total_slots for p in Priority}
+        self.class_limits.update(class_limits or {})
+        
+        self._cond = threading.Condition()
+        self._waiters: List[_Waiter] = []
+        self._active: Dict[Priority, int] = {p: 0 for p in Priority}
+        self._seq = itertools.count()
+    
+    def _dispatch(self):
+        """Grant slots to eligible waiters in priority order (lock held)."""
+        granted_any = False
+        self._waiters.sort(key=_Waiter.sort_key)
+        
+        for waiter in list(self._waiters):
+            if sum(self._active.values()) >= self.total_slots:
+                break
+            if self._active[waiter.priority] >= self.class_limits[waiter.priority]:
+                continue
+            self._waiters.remove(waiter)
+            self._active[waiter.priority] += 1
+            waiter.granted = True
+            granted_any = True
+            if waiter.wake is not None:
+                waiter.wake()
+        
+        if granted_any:
+            self._cond.notify_all()
+    
+    def acquire(self, priority: Optional[Priority] = None,
+                group: Optional[Hashable] = None,
+                key: Optional[Hashable] = None) -> _Waiter:
+        """Block until a slot is granted.
+        
+        Raises:
+            RequestCancelled: If the request is cancelled while queued
+        """
+        if priority is None:
+            priority = current_priority()
+        if group is None:
+            group = current_group()
+        
+        with self._cond:
+            waiter = _Waiter(priority, next(self._seq), group, key)
+            self._waiters.append(waiter)
+            self._dispatch()
+            
+            while not waiter.granted and not waiter.cancelled:
+                self._cond.wait()
+            
+            if waiter.cancelled:
+                raise RequestCancelled(
+                    f"Request cancelled while queued ({waiter.priority.name})"
+                )
+            return waiter
+    
+    async def acquire_async(self, priority: Optional[Priority] = None,
+                            group: Optional[Hashable] = None,
+                            key: Optional[Hashable] = None) -> _Waiter:
+        """Wait for a slot on the running event loop, without a thread.
+        
+        Raises:
+            RequestCancelled: If the request is cancelled while queued
+        """
+        if priority is None:
+            priority = current_priority()
+        if group is None:
+            group = current_group()
+        
+        loop = asyncio.get_running_loop()
+        woken = loop.create_future()
+        
+        def wake():
+            try:
+                loop.call_soon_threadsafe(
+                    lambda: woken.done() or woken.set_result(None))
+            except RuntimeError:
+                pass  # Loop closed; nobody is waiting any more
+        
+        with self._cond:
+            waiter = _Waiter(priority, next(self._seq), group, key)
+            waiter.wake = wake
+            self._waiters.append(waiter)
+            self._dispatch()
+        
+        try:
+            await woken
+        except asyncio.CancelledError:
+            # The coroutine was cancelled: give up the place or the slot
+            with self._cond:
+                if waiter.granted:
+                    self._active[waiter.priority] -= 1
+                    self._dispatch()
+                elif waiter in self._waiters:
+                    self._waiters.remove(waiter)
+            raise
+        
+        if waiter.cancelled:
+            raise RequestCancelled(
+                f"Request cancelled while queued ({waiter.priority.name})"
+            )
+        return waiter
+    
+    @contextmanager
+    def holding(self, waiter: _Waiter):
+        """Make slot() use an already granted slot in the enclosed block.
+        
+        The caller keeps responsibility for releasing it.
+        """
+        token = _held_slot.set(waiter)
+        try:
+            yield waiter
+        finally:
+            _held_slot.reset(token)
+    
+    def release(self, waiter: _Waiter):
+        """Return a slot and wake the next eligible waiter."""
+        with self._cond:
+            self._active[waiter.priority] -= 1
+            self._dispatch()
+    
+    @contextmanager
+    def slot(self, priority: Optional[Priority] = None,
+             group: Optional[Hashable] = None,
+             key: Optional[Hashable] = None):
+        """Context manager holding a request slot."""
+        held = _held_slot.get()
+        if held is not None:
+            yield held
+            return
+        
+        waiter = self.acquire(priority, group, key)
+        try:
+            yield waiter
+        finally:
+            self.release(waiter)
+    
+    def _matching(self, priority: Optional[Priority],
+                  group: Optional[Hashable]) -> List[_Waiter]:
+        """Queued waiters matching a class and/or group (lock held)."""
+        return [
+            w for w in self._waiters
+            if (priority is None or w.priority == priority)
+            and (group is None or w.group == group)
+        ]
+    
+    def cancel(self, priority: Optional[Priority] = Priority.PREFETCH,
+               group: Optional[Hashable] = None) -> int:
+        """Cancel queued (not yet running) requests.
+        
+        Args:
+            priority: Only cancel this class (None for all classes)
+            group: Only cancel requests tagged with this group
+        
+        Returns:
+            Number of requests cancelled
+        """
+        with self._cond:
+            matched = self._matching(priority, group)
+            for waiter in matched:
+                self._waiters.remove(waiter)
+                waiter.cancelled = True
+                if waiter.wake is not None:
+                    waiter.wake()
+            if matched:
+                self._cond.notify_all()
+                logger.info(f"Cancelled {len(matched)} queued requests")
+            return len(matched)
+    
+    def deprioritize(self, group: Optional[Hashable] = None,
+                     from_priority: Priority = Priority.PREFETCH,
+                     to_priority: Priority = Priority.BACKGROUND) -> int:
+        """Move queued requests to a lower priority class.
+        
+        Returns:
+            Number of requests moved
+        """
+        with self._cond:
+            matched = self._matching(from_priority, group)
+            for waiter in matched:
+                waiter.priority = to_priority
+            if matched:
+                self._dispatch()
+            return len(matched)
+    
+    def boost(self, key: Hashable, priority: Optional[Priority] = None) -> bool:
+        """Raise a queued request to a higher priority.
+        
+        Used when a foreground caller coalesces onto a request that was
+        queued as a prefetch, so the player does not wait behind it.
+        
+        Returns:
+            True if a queued request was boosted
+        """
+        if priority is None:
+            priority = current_priority()
+        
+        with self._cond:
+            boosted = False
+            for waiter in self._waiters:
+                if waiter.key == key and waiter.priority > priority:
+                    waiter.priority = priority
+                    boosted = True
+            if boosted:
+                self._dispatch()
+            return boosted
+    
+    def get_stats(self) -> dict:
+        """Get in-flight and queued counts per priority class."""
+        with self._cond:
+            return {
+                p.name.lower(): {
+                    'active': self._active[p],
+                    'queued': sum(1 for w in self._waiters if w.priority == p),
+                    'limit': self.class_limits[p]
+                }
+                for p in Priority
+            }
+
+
+# Global scheduler instance
+_scheduler: Optional[RequestScheduler] = None
+
+
+def get_scheduler(config=None) -> RequestScheduler:
+    """Get or create the global request scheduler."""
+    global _scheduler
+    if _scheduler is None:
+        config = config or get_config()
+        _scheduler = RequestScheduler(
+            total_slots=config.scheduler_slots,
+            class_limits={
+                Priority.INTERACTIVE: config.scheduler_slots,
+                Priority.PREFETCH: config.prefetch_slots,
+                Priority.BACKGROUND: config.background_slots
+            }
+        )
+    return _scheduler
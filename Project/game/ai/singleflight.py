@@ -0,0 +1,99 @@
+"""Single-flight coalescing for identical in-flight requests."""
+
+import json
+import hashlib
+import logging
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """An in-flight call that later callers can wait on."""
+    
+    def __init__(self, shared: Any = None):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+        self.shared = shared
+
+
+class SingleFlight:
+    """Ensures only one call per key is in flight at a time.
+    
+    Concurrent callers with the same key block until the first caller's
+    function returns, then all receive the same result (or exception).
+    
+    The leader can hand state to the callers joining it (shared), e.g. so
+    a foreground caller can raise the priority of a prefetch it joins.
+    """
+    
+    def __init__(self):
+        """Initialize with no calls in flight."""
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+    
+    def do(self, key: Hashable, fn: Callable[[], Any], shared: Any = None,
+           on_join: Optional[Callable[[Any], None]] = None) -> Any:
+        """Run fn once for all concurrent callers sharing key.
+        
+        Args:
+            key: Identity of the call
+            fn: Work to run if this caller leads
+            shared: State made available to callers joining this one, if
+                it leads
+            on_join: Called with the leader's shared state, before waiting,
+                if this caller joins a call in flight instead of leading
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call(shared)
+                self._calls[key] = call
+        
+        if not leader:
+            logger.debug(f"Coalesced in-flight request: {str(key)[:16]}...")
+            if on_join is not None:
+                on_join(call.shared)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+    
+    def in_flight(self, key: Hashable) -> bool:
+        """Check whether a call for key is currently running."""
+        with self._lock:
+            return key in self._calls
+    
+    def __len__(self) -> int:
+        """Number of distinct calls in flight."""
+        with self._lock:
+            return len(self._calls)
+
+
+def payload_key(*parts: Any) -> str:
+    """Hash request parts (method, URL, JSON payload...) into a stable key."""
+    hasher = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, bytes):
+            hasher.update(part)
+        elif isinstance(part, str):
+            hasher.update(part.encode('utf-8'))
+        else:
+            hasher.update(json.dumps(part, sort_keys=True).encode('utf-8'))
+        hasher.update(b'\0')
+    return hasher.hexdigest()
@@ -0,0 +1,64 @@
+"""Make the flat ai modules importable, as Ren'Py does for the game."""
+
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import balancer
+import config
+import scheduler
+from mock_backend import LatencyModel, MockBackend, MockSettings
+
+
+@pytest.fixture
+def make_config(tmp_path):
+    """Install a configuration for get_config() to return.
+    
+    Returns a function taking Config fields to override; the cache lives
+    in the test's temp directory and no backend is reachable.
+    """
+    def make(**overrides) -> config.Config:
+        settings = dict(api_base_url='http://127.0.0.1:9', api_key='test',
+                        cache_dir=tmp_path / 'cache')
+        settings.update(overrides)
+        config._config = config.Config(**settings)
+        return config._config
+    
+    yield make
+    config.reset_config()
+
+
+@pytest.fixture
+def fresh_scheduler():
+    """Drop the global scheduler and backend pools around a test.
+    
+    They are built again from the test's configuration on first use.
+    """
+    scheduler._scheduler = None
+    balancer._pools.clear()
+    yield
+    scheduler._scheduler = None
+    balancer._pools.clear()
+
+
+@pytest.fixture
+def backend():
+    """A mock backend that answers text and TTS requests in 50 ms."""
+    settings = MockSettings()
+    for endpoint in ('generate', 'chat', 'tts'):
+        settings.latency[endpoint] = LatencyModel('fixed', 0.05)
+    mock = MockBackend(settings).start()
+    yield mock
+    mock.stop()
+
+
+def wait_for(condition, timeout: float = 5.0):
+    """Poll until condition() is true, failing the test after timeout."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
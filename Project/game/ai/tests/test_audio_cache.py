@@ -0,0 +1,115 @@
+"""Tests for the TTS audio cache."""
+
+import threading
+
+import pytest
+
+import audio_cache
+from audio_cache import AudioCache
+from conftest import wait_for
+from scheduler import Priority, request_priority
+
+
+@pytest.fixture
+def make_cache(make_config, backend, fresh_scheduler, tmp_path):
+    """An AudioCache on the mock backend, with its own scheduler and pools."""
+    def make(**overrides) -> AudioCache:
+        make_config(api_base_url=backend.url, **overrides)
+        return AudioCache(str(tmp_path / 'tts'))
+    
+    return make
+
+
+def start_prefetch(cache: AudioCache, text: str, group: str) -> threading.Thread:
+    """Generate text as a prefetch of group, in a thread, and wait for it to queue."""
+    def run():
+        with request_priority(Priority.PREFETCH, group):
+            cache.get_tts_cached(text)
+    
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    wait_for(lambda: cache.api_client.scheduler.get_stats()['prefetch']['queued'] == 1)
+    return thread
+
+
+def play(cache: AudioCache, text: str, **kwargs) -> dict:
+    """Get text at INTERACTIVE priority in a thread; the result lands in the dict."""
+    result = {}
+    
+    def run():
+        result['path'] = cache.get_tts_cached(text, **kwargs)
+    
+    result['thread'] = threading.Thread(target=run, daemon=True)
+    result['thread'].start()
+    return result
+
+
+def test_playback_boosts_a_queued_prefetch(make_cache, backend):
+    cache = make_cache(prefetch_slots=1)
+    sched = cache.api_client.scheduler
+    busy = sched.acquire(Priority.PREFETCH)
+    try:
+        prefetch = start_prefetch(cache, "Hello there.", "scene1")
+        chunks = []
+        result = play(cache, "Hello there.", on_chunk=chunks.append)
+        
+        # The prefetch slot stays taken, so only the boost lets it run
+        result['thread'].join(5)
+        assert result['path'] is not None
+        assert chunks and b''.join(chunks) == open(result['path'], 'rb').read()
+        prefetch.join(5)
+        assert cache.cancel_prefetch("scene1") == 0
+    finally:
+        sched.release(busy)
+    
+    assert backend.get_stats()['requests'] == {'tts': 1}
+
+
+def test_playback_retries_a_cancelled_prefetch(make_cache):
+    cache = make_cache(scheduler_slots=1, prefetch_slots=1)
+    sched = cache.api_client.scheduler
+    busy = sched.acquire(Priority.INTERACTIVE)
+    try:
+        prefetch = start_prefetch(cache, "Hello there.", "scene1")
+        result = play(cache, "Hello there.")
+        wait_for(lambda: sched.get_stats()['interactive']['queued'] == 1)
+        
+        # Skipping the scene drops the request playback was waiting on
+        assert sched.cancel(None, "scene1") == 1
+        prefetch.join(5)
+        wait_for(lambda: sched.get_stats()['interactive']['queued'] == 1)
+    finally:
+        sched.release(busy)
+    
+    result['thread'].join(5)
+    assert result['path'] is not None
+
+
+
+def test_verify_cache_needs_every_part(make_cache):
+    cache = make_cache(tts_chunk_max_chars=40)
+    text = "This line is long enough to split. It ends with a second sentence."
+    parts = cache._parts(text, cache.config.tts_voice, cache.default_format)
+    assert len(parts) == 2
+    assert not cache.verify_cache(text)
+    
+    parts[0][2].parent.mkdir(parents=True, exist_ok=True)
+    parts[0][2].write_bytes(b'audio')
+    assert not cache.verify_cache(text)
+    
+    parts[1][2].parent.mkdir(parents=True, exist_ok=True)
+    parts[1][2].write_bytes(b'audio')
+    assert cache.verify_cache(text)
+
+
+def test_get_or_generate_tts_uses_the_part_cache(make_cache, monkeypatch):
+    cache = make_cache(tts_chunk_max_chars=40)
+    monkeypatch.setattr(audio_cache, '_audio_cache_instance', cache)
+    with pytest.warns(DeprecationWarning):
+        path = audio_cache.get_or_generate_tts("Hello there.")
+    assert path == cache.get_tts_parts("Hello there.")[0]
+    
+    with pytest.warns(DeprecationWarning):
+        long_line = "This line is long enough to split. It ends with a second sentence."
+        assert audio_cache.get_or_generate_tts(long_line) is None
+    assert cache.verify_cache(long_line)
@@ -0,0 +1,91 @@
+"""Tests for load balancing across backends."""
+
+from collections import Counter
+
+import pytest
+
+import api
+from api import APIResponse, get_circuit_breaker
+from balancer import BackendPool, service_urls
+
+URLS = ['http://127.0.0.1:9', 'http://127.0.0.1:10', 'http://127.0.0.1:11']
+
+
+@pytest.fixture(autouse=True)
+def breakers(monkeypatch):
+    """Keep the breakers opened by a test out of the shared registry."""
+    monkeypatch.setattr(api, '_breakers', {})
+
+
+@pytest.fixture
+def settings(make_config):
+    return make_config(health_check_interval=0, breaker_reset_timeout=60)
+
+
+def chosen(pool: BackendPool, count: int) -> Counter:
+    return Counter(pool.choose().url for _ in range(count))
+
+
+def test_round_robin_rotates(settings):
+    pool = BackendPool('api', URLS, settings, policy='round_robin')
+    assert chosen(pool, 9) == Counter({url: 3 for url in URLS})
+
+
+def test_least_outstanding_spreads_concurrent_requests(settings):
+    pool = BackendPool('api', URLS, settings)
+    with pool.acquire() as first, pool.acquire() as second, pool.acquire() as third:
+        assert {first.url, second.url, third.url} == set(URLS)
+    assert all(b.outstanding == 0 for b in pool.backends)
+    
+    # Ties go to the fastest backend
+    pool.record(pool.backends[0], 0.5, True)
+    pool.record(pool.backends[1], 0.1, True)
+    pool.record(pool.backends[2], 0.3, True)
+    assert pool.choose().url == URLS[1]
+
+
+def test_latency_weighted_shares_by_inverse_latency(settings):
+    pool = BackendPool('api', URLS[:2], settings, policy='latency_weighted')
+    pool.record(pool.backends[0], 0.1, True)
+    pool.record(pool.backends[1], 0.3, True)
+    assert chosen(pool, 40) == Counter({URLS[0]: 30, URLS[1]: 10})
+
+
+def test_drained_and_broken_backends_are_skipped(settings):
+    pool = BackendPool('api', URLS, settings, policy='round_robin')
+    assert pool.drain(URLS[0])
+    assert not pool.drain('http://elsewhere')
+    breaker = get_circuit_breaker(URLS[1], settings)
+    for _ in range(settings.breaker_failure_threshold):
+        breaker.record(APIResponse(503, None, 'down'))
+    assert chosen(pool, 4) == Counter({URLS[2]: 4})
+    
+    pool.backends[2].healthy = False
+    assert set(chosen(pool, 4)) == {URLS[1], URLS[2]}  # Nothing usable left: try anyway
+    assert pool.choose(exclude=pool.backends) is None
+    
+    pool.drain(URLS[0], False)
+    assert chosen(pool, 4) == Counter({URLS[0]: 4})
+
+
+def test_health_checks_need_two_failures(settings, backend):
+    pool = BackendPool('api', [backend.url, URLS[0]], settings)
+    up, down = pool.backends
+    assert pool.check_health(up) and up.avg_latency > 0
+    assert not pool.check_health(down) and down.healthy
+    assert not pool.check_health(down) and not down.healthy
+    
+    down.url = backend.url  # Back again
+    assert pool.check_health(down) and down.healthy
+
+
+def test_service_urls_fall_back_to_the_api_backends(make_config):
+    settings = make_config(api_base_urls=URLS[:2])
+    assert service_urls('tts', settings) == URLS[:2]
+    assert service_urls('api', settings) == URLS[:2]
+    assert service_urls('tts', make_config(tts_base_urls=[URLS[2]])) == [URLS[2]]
+
+
+def test_unknown_policy(settings):
+    with pytest.raises(ValueError):
+        BackendPool('api', URLS, settings, policy='random')
@@ -0,0 +1,80 @@
+"""Tests for the per-backend circuit breaker."""
+
+import pytest
+
+import api
+from api import APIResponse, CircuitBreaker, get_circuit_breaker
+from conftest import wait_for
+
+DOWN = 'http://127.0.0.1:9'
+
+
+@pytest.fixture(autouse=True)
+def breakers(monkeypatch):
+    """Keep the breakers made by a test out of the shared registry."""
+    monkeypatch.setattr(api, '_breakers', {})
+
+
+def response(status: int, elapsed: float = 0.1) -> APIResponse:
+    return APIResponse(status, None, None if status < 400 else 'failed', elapsed)
+
+
+def test_opens_after_consecutive_failures(make_config):
+    breaker = CircuitBreaker(DOWN, make_config(breaker_failure_threshold=3,
+                                               breaker_reset_timeout=60))
+    for status in (503, 500, 200, 502, 504):
+        breaker.record(response(status))
+    assert breaker.allow_request() and breaker.degraded
+    
+    breaker.record(response(408))
+    assert not breaker.allow_request()
+    assert breaker.get_stats()['times_opened'] == 1
+    assert breaker.get_stats()['total_failures'] == 5
+
+
+def test_client_errors_and_cancellations_are_not_failures(make_config):
+    breaker = CircuitBreaker(DOWN, make_config(breaker_failure_threshold=1))
+    for status in (400, 404, 429, 499):
+        breaker.record(response(status))
+    assert breaker.allow_request() and not breaker.degraded
+
+
+def test_slow_calls_count_as_failures(make_config):
+    breaker = CircuitBreaker(DOWN, make_config(breaker_failure_threshold=2,
+                                               breaker_slow_call_threshold=1.0,
+                                               breaker_reset_timeout=60))
+    breaker.record(response(200, elapsed=0.5))
+    assert not breaker.degraded
+    breaker.record(response(200, elapsed=2.0))
+    breaker.record(response(200, elapsed=3.0))
+    assert not breaker.allow_request()
+
+
+def test_probes_close_the_circuit_once_the_backend_answers(make_config, backend):
+    breaker = CircuitBreaker(backend.url, make_config(breaker_failure_threshold=1,
+                                                      breaker_reset_timeout=0.01))
+    breaker.record(response(503))
+    wait_for(lambda: breaker.state == CircuitBreaker.CLOSED)
+    assert breaker.allow_request() and not breaker.degraded
+
+
+def test_probes_keep_the_circuit_open_while_the_backend_is_down(make_config):
+    breaker = CircuitBreaker(DOWN, make_config(breaker_failure_threshold=1,
+                                               breaker_reset_timeout=0.01,
+                                               breaker_max_probe_interval=0.02))
+    probes = []
+    probe = breaker._probe
+    breaker._probe = lambda: probes.append(probe()) or probes[-1]
+    
+    breaker.record(response(503))
+    wait_for(lambda: len(probes) >= 3)
+    assert not any(probes)
+    assert not breaker.allow_request()
+    assert breaker.get_stats()['times_opened'] == 1
+    breaker.state = CircuitBreaker.CLOSED  # Ends the probe thread
+
+
+def test_breakers_are_shared_per_backend(make_config):
+    make_config()
+    assert get_circuit_breaker(f'{DOWN}/api/generate') is get_circuit_breaker(f'{DOWN}/v1/chat')
+    assert get_circuit_breaker(f'{DOWN}/api') is not get_circuit_breaker('http://127.0.0.1:10/api')
@@ -0,0 +1,36 @@
+"""Tests for the content cache shared by several processes."""
+
+import multiprocessing
+from dataclasses import asdict
+
+import config
+
+
+def _save_entries(settings: dict, worker: int, count: int):
+    """Process body: save count small text entries through a CacheManager."""
+    config._config = config.Config(**settings)
+    from cache import CacheManager
+    
+    cache = CacheManager()
+    for i in range(count):
+        cache.save_to_cache('text', f'{worker}-{i}', f'entry {worker}-{i} ' * (i % 7 + 1))
+
+
+def test_packed_saves_from_several_processes(make_config):
+    settings = asdict(make_config(pack_small_entries=True, pack_segment_bytes=8192))
+    from cache import CacheManager
+    
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=_save_entries, args=(settings, n, 150))
+               for n in range(3)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join(60)
+        assert process.exitcode == 0
+    
+    cache = CacheManager()
+    for n in range(3):
+        for i in range(150):
+            assert cache.get_cached('text', f'{n}-{i}') == f'entry {n}-{i} ' * (i % 7 + 1)
+    assert cache.packs.get_stats()['segments'] > 1
@@ -0,0 +1,115 @@
+"""Tests for the SQLite cache index."""
+
+import sqlite3
+import multiprocessing
+from pathlib import Path
+
+import pytest
+
+from cache_index import CacheIndex
+
+
+ROUNDS = 20
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = CacheIndex(tmp_path)
+    yield index
+    index.close()
+
+
+def recount(index: CacheIndex) -> dict:
+    """Totals counted from the entries themselves."""
+    rows = index._conn.execute(
+        "SELECT cache_type, COUNT(*), SUM(size), SUM(hits) FROM entries GROUP BY cache_type"
+    ).fetchall()
+    return {cache_type: {'files': files, 'size': size, 'hits': hits}
+            for cache_type, files, size, hits in rows}
+
+
+def test_totals_follow_puts_replaces_and_removes(index):
+    index.put('text/a.txt', 'text', 100)
+    index.put('text/b.txt', 'text', 50)
+    index.put('tts/c.mp3', 'tts', 1000)
+    index.put('text/a.txt', 'text', 70)  # Replaced
+    assert index.stats() == {'text': {'files': 2, 'size': 120, 'hits': 0},
+                             'tts': {'files': 1, 'size': 1000, 'hits': 0}}
+    
+    index.remove(['text/b.txt'])
+    index.delete_entries(['tts/c.mp3'])
+    assert index.stats() == {'text': {'files': 1, 'size': 70, 'hits': 0}}
+    assert index.stats() == recount(index)
+
+
+def test_totals_count_buffered_hits_once_flushed(index):
+    index.put('text/a.txt', 'text', 100)
+    for _ in range(3):
+        index.touch('text/a.txt')
+    assert index.stats()['text']['hits'] == 3
+    
+    # A replaced entry starts again from no hits
+    index.put('text/a.txt', 'text', 100)
+    index.touch('text/a.txt')
+    assert index.stats() == recount(index) == {'text': {'files': 1, 'size': 100, 'hits': 1}}
+
+
+def test_totals_survive_renames_and_clears(index):
+    for i in range(5):
+        index.put(f'tts/{i}.mp3', 'tts', 10)
+    index.put('text/a.txt', 'text', 100)
+    index.rename_many([(f'tts/{i}.mp3', f'tts/ab/{i}.mp3') for i in range(3)])
+    assert not index.rename('tts/3.mp3', 'tts/ab/0.mp3')
+    assert index.stats() == recount(index)
+    
+    assert index.clear('tts') == 5
+    assert index.stats() == {'text': {'files': 1, 'size': 100, 'hits': 0}}
+    index.clear()
+    assert index.stats() == {}
+
+
+def test_indexes_from_before_totals_are_counted_on_open(tmp_path):
+    index = CacheIndex(tmp_path)
+    for i in range(4):
+        index.put(f'text/{i}.txt', 'text', 25)
+    index.close()
+    
+    # As left by a version without the totals table
+    conn = sqlite3.connect(str(tmp_path / 'index.sqlite3'))
+    conn.execute("DELETE FROM totals")
+    conn.execute("DELETE FROM meta WHERE name = 'totals'")
+    conn.commit()
+    conn.close()
+    
+    index = CacheIndex(tmp_path)
+    assert index.stats() == {'text': {'files': 4, 'size': 100, 'hits': 0}}
+    index.close()
+    index = CacheIndex(tmp_path)
+    assert index.stats() == {'text': {'files': 4, 'size': 100, 'hits': 0}}
+    index.close()
+
+
+def _open_indexes(root: str, worker: int, barrier):
+    """Process body: open new indexes together with the other workers, adding an entry."""
+    for n in range(ROUNDS):
+        barrier.wait(30)
+        index = CacheIndex(Path(root) / str(n))
+        index.put(f'text/{worker}.txt', 'text', 10)
+        index.close()
+
+
+def test_processes_opening_a_new_index_together(tmp_path):
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(4)
+    workers = [context.Process(target=_open_indexes, args=(str(tmp_path), n, barrier))
+               for n in range(4)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join(60)
+        assert process.exitcode == 0
+    
+    for n in range(ROUNDS):
+        index = CacheIndex(tmp_path / str(n))
+        assert index.stats() == {'text': {'files': 4, 'size': 40, 'hits': 0}}
+        index.close()
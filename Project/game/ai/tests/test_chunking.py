@@ -0,0 +1,63 @@
+"""Tests for splitting dialogue into TTS chunks."""
+
+from chunking import split_for_tts
+
+
+def test_short_line_stays_whole():
+    assert split_for_tts("Hello there.") == ["Hello there."]
+
+
+def test_blank_line():
+    assert split_for_tts("   ") == []
+
+
+def test_splits_sentences():
+    assert split_for_tts("First one. Second one! Third?") == [
+        "First one.", "Second one!", "Third?"
+    ]
+
+
+def test_short_clauses_never_exceed_max_chars():
+    chunks = split_for_tts("one, two, three, " * 20, max_chars=200)
+    
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 200 for chunk in chunks)
+    assert ' '.join(chunks) == ' '.join(("one, two, three, " * 20).split())
+
+
+def test_tiny_last_chunk_takes_a_piece_from_the_one_before():
+    first, second = 'x' * 95 + ',', 'y' * 95 + ','
+    
+    chunks = split_for_tts(f"{first} {second} last one.", max_chars=200)
+    
+    assert chunks == [first, f"{second} last one."]
+
+
+def test_long_word_is_kept_whole():
+    word = 'a' * 250
+    
+    assert split_for_tts(f"{word} b", max_chars=200) == [word, "b"]
+
+
+def test_abbreviations_do_not_end_sentences():
+    text = "Mr. Smith met Dr. Jones at St. Mary's, e.g. today. They talked."
+    
+    assert split_for_tts(text) == [
+        "Mr. Smith met Dr. Jones at St. Mary's, e.g. today.", "They talked."
+    ]
+
+
+def test_quote_followed_by_lowercase_word_is_not_cut():
+    assert split_for_tts('"Wait!" she said. "Stop!" Then he left.') == [
+        '"Wait!" she said.', '"Stop!"', 'Then he left.'
+    ]
+
+
+def test_closing_quotes_stay_with_their_sentence():
+    assert split_for_tts('He said "no." Fine. (Really.) Done.') == [
+        'He said "no."', 'Fine.', '(Really.)', 'Done.'
+    ]
+
+
+def test_whitespace_is_normalized():
+    assert split_for_tts("  One.\n\n  Two\tthree.  ") == ["One.", "Two three."]
@@ -0,0 +1,55 @@
+"""Tests for cache entry compression."""
+
+import random
+
+import pytest
+
+import codec
+from codec import available_codecs, decode, encode, get_codec, register_codec
+
+
+TEXT = ("The lighthouse keeper climbs the stairs at midnight. " * 40).encode('utf-8')
+
+
+@pytest.mark.parametrize('name', available_codecs())
+def test_round_trip(name):
+    encoded = encode(TEXT, name)
+    assert encoded[0] == get_codec(name).tag
+    assert len(encoded) < len(TEXT)
+    assert decode(encoded) == TEXT
+
+
+@pytest.mark.parametrize('data', [
+    "Plain text written before compression was enabled".encode('utf-8') * 10,
+    "Ünïcödé dialog line".encode('utf-8') * 10,
+    b'\x89PNG\r\n\x1a\n' + bytes(200),
+    b'\xff\xfb\x90\x00' + bytes(200),
+    b'',
+])
+def test_untagged_data_decodes_as_itself(data):
+    assert decode(data) == data
+
+
+def test_small_and_incompressible_entries_stay_plain():
+    assert encode(b'short', 'zlib') == b'short'
+    noise = random.Random(0).randbytes(512)
+    assert encode(noise, 'lzma') == noise
+    assert encode(TEXT, None) == TEXT
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError, match='Unknown cache codec'):
+        encode(TEXT, 'brotli')
+
+
+def test_register_codec_checks_tags(monkeypatch):
+    monkeypatch.setattr(codec, '_codecs', dict(codec._codecs))
+    monkeypatch.setattr(codec, '_by_tag', dict(codec._by_tag))
+    with pytest.raises(ValueError):
+        register_codec('low', 0x7B, bytes, bytes)
+    with pytest.raises(ValueError, match='already used'):
+        register_codec('other', get_codec('zlib').tag, bytes, bytes)
+    
+    reverse = register_codec('reverse', 0xFE, lambda d: d[::-1], lambda d: d[::-1])
+    assert encode(TEXT, 'reverse') == TEXT  # Not smaller, so stored plain
+    assert decode(bytes((reverse.tag,)) + b'cba') == b'abc'
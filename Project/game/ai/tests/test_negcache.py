@@ -0,0 +1,84 @@
+"""Tests for the negative cache of failed generations."""
+
+import time
+
+import pytest
+
+from cache_index import CacheIndex
+from negcache import PERSISTENT_FACTOR, NegativeCache
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = CacheIndex(tmp_path / 'cache')
+    yield index
+    index.close()
+
+
+@pytest.fixture
+def settings(make_config):
+    return make_config(negative_backoff_base=5.0, negative_backoff_max=60.0)
+
+
+def delay(entry) -> float:
+    return round(entry.retry_after - time.time())
+
+
+def test_failures_back_off_exponentially_up_to_the_maximum(index, settings):
+    negative = NegativeCache(index, settings)
+    delays = [delay(negative.record('tts/a.mp3', 'timeout')) for _ in range(6)]
+    assert delays == [5, 10, 20, 40, 60, 60]
+    assert negative.check('tts/a.mp3').failures == 6
+    assert negative.check('tts/b.mp3') is None
+
+
+def test_persistent_failures_start_with_a_longer_backoff(index, make_config):
+    settings = make_config(negative_backoff_base=1.0, negative_backoff_max=3600.0)
+    negative = NegativeCache(index, settings)
+    assert delay(negative.record('tts/a.mp3', 'http_400')) == PERSISTENT_FACTOR
+    assert delay(negative.record('tts/b.mp3', 'http_503')) == 1
+
+
+@pytest.mark.parametrize('error_class', ['cancelled', 'circuit_open', 'write', 'not_configured'])
+def test_failures_unrelated_to_the_request_are_ignored(index, settings, error_class):
+    negative = NegativeCache(index, settings)
+    assert negative.record('tts/a.mp3', error_class) is None
+    assert negative.check('tts/a.mp3') is None
+
+
+def test_expired_entries_no_longer_block(index, settings):
+    negative = NegativeCache(index, settings)
+    negative.record('tts/a.mp3', 'timeout').retry_after = time.time() - 1
+    assert negative.check('tts/a.mp3') is None
+    assert negative.get_stats()['active'] == 0
+
+
+def test_failures_survive_a_restart_until_cleared(index, settings):
+    negative = NegativeCache(index, settings)
+    negative.record('tts/a.mp3', 'http_422', 'content filter')
+    negative.record('image/b.png', 'timeout')
+    
+    reloaded = NegativeCache(index, settings)
+    entry = reloaded.check('tts/a.mp3')
+    assert (entry.error_class, entry.failures, entry.error) == ('http_422', 1, 'content filter')
+    
+    reloaded.clear('tts/a.mp3')
+    assert NegativeCache(index, settings).check('tts/a.mp3') is None
+    reloaded.clear_all('image/')
+    assert NegativeCache(index, settings).get_stats()['entries'] == 0
+
+
+def test_disabled_cache_never_blocks(index, make_config):
+    negative = NegativeCache(index, make_config(negative_cache=False))
+    assert negative.record('tts/a.mp3', 'timeout') is None
+    assert negative.check('tts/a.mp3') is None
+
+
+def test_stats_count_active_entries_by_class(index, settings):
+    negative = NegativeCache(index, settings)
+    negative.record('tts/a.mp3', 'timeout')
+    negative.record('tts/b.mp3', 'timeout')
+    negative.record('tts/c.mp3', 'http_400')
+    negative.check('tts/a.mp3')
+    assert negative.get_stats() == {'entries': 3, 'active': 3, 'hits': 1,
+                                    'by_class': {'timeout': 2, 'http_400': 1}}
@@ -0,0 +1,137 @@
+"""Tests for pack segment files."""
+
+import pytest
+
+from cache_index import CacheIndex
+from packstore import RECORD_HEADER, RECORD_MAGIC, PackStore
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = CacheIndex(tmp_path / 'cache')
+    yield index
+    index.close()
+
+
+@pytest.fixture
+def make_store(make_config, index, tmp_path):
+    """Open PackStores on one pack directory, closing them after the test."""
+    stores = []
+    
+    def make(**overrides) -> PackStore:
+        store = PackStore(tmp_path / 'cache' / 'packs', index, make_config(**overrides))
+        stores.append(store)
+        return store
+    
+    yield make
+    for store in stores:
+        store.close()
+
+
+def put(store: PackStore, key: str, data: bytes):
+    """Append an entry and index it, as CacheManager does."""
+    segment, offset = store.append(key, data)
+    store.index.put(key, 'text', len(data), segment=segment, offset=offset)
+    return segment, offset
+
+
+def entry(i: int) -> bytes:
+    return f'entry {i} '.encode() * (i % 9 + 1)
+
+
+def test_append_and_read_round_trip(make_store):
+    store = make_store()
+    locations = [store.append(f'text/{i}', entry(i)) for i in range(50)]
+    for i, (segment, offset) in enumerate(locations):
+        assert store.read(segment, offset, len(entry(i))) == entry(i)
+
+
+def test_records_describe_themselves(make_store):
+    store = make_store()
+    segment, offset = store.append('text/key', b'data')
+    raw = store._segment_path(segment).read_bytes()
+    header = offset - len(b'text/key') - RECORD_HEADER.size
+    assert RECORD_HEADER.unpack_from(raw, header) == (RECORD_MAGIC, 8, 4)
+    assert raw[header + RECORD_HEADER.size:offset] == b'text/key'
+
+
+def test_reads_see_entries_appended_after_mapping(make_store):
+    store = make_store()
+    first = store.append('text/1', entry(1))
+    assert store.read(*first, len(entry(1))) == entry(1)
+    second = store.append('text/2', entry(2))
+    assert store.read(*second, len(entry(2))) == entry(2)
+
+
+def test_segments_rotate_without_splitting_records(make_store):
+    store = make_store(pack_segment_bytes=1024)
+    locations = [store.append(f'text/{i}', entry(i)) for i in range(100)]
+    assert store.get_stats()['segments'] > 1
+    for path in store.pack_dir.glob('*.pack'):
+        assert path.stat().st_size <= 1024
+    for i, (segment, offset) in enumerate(locations):
+        assert store.read(segment, offset, len(entry(i))) == entry(i)
+
+
+def test_stores_sharing_a_directory_never_overlap(make_store):
+    # Each store has its own file position, like separate processes
+    stores = [make_store(pack_segment_bytes=2048) for _ in range(3)]
+    locations = {}
+    for i in range(150):
+        locations[i] = stores[i % 3].append(f'text/{i}', entry(i))
+    
+    for i, (segment, offset) in locations.items():
+        assert stores[(i + 1) % 3].read(segment, offset, len(entry(i))) == entry(i)
+    assert len({store.active for store in stores}) == 1
+
+
+def test_reopening_continues_the_last_segment(make_store):
+    store = make_store(pack_segment_bytes=1024)
+    locations = [store.append(f'text/{i}', entry(i)) for i in range(40)]
+    store.close()
+    
+    reopened = make_store(pack_segment_bytes=1024)
+    assert reopened.active == store.active
+    segment, offset = reopened.append('text/last', b'last')
+    assert segment == store.active
+    assert reopened.read(segment, offset, 4) == b'last'
+    for i, (segment, offset) in enumerate(locations):
+        assert reopened.read(segment, offset, len(entry(i))) == entry(i)
+
+
+def test_compaction_moves_live_entries_out_of_mostly_dead_segments(make_store, index):
+    store = make_store(pack_segment_bytes=1024)
+    for i in range(60):
+        put(store, f'text/{i}', entry(i))
+    sealed = [s for s in store._segments() if s < store.active]
+    assert sealed
+    
+    # Leave one live entry in the first segment
+    first = index.packed_in(sealed[0])
+    index.remove([key for key, _, _ in first[1:]])
+    
+    assert store.compact(threshold=0.5) >= 1
+    assert not store._segment_path(sealed[0]).exists()
+    assert store.active in store._segments()
+    assert index.location(first[0][0])[0] != sealed[0]
+    for key in index.keys():
+        segment, offset, size = index.location(key)
+        assert store.read(segment, offset, size) == entry(int(key.split('/')[1]))
+
+
+def test_compaction_skips_the_active_segment(make_store, index):
+    store = make_store()
+    put(store, 'text/1', entry(1))
+    index.remove(['text/1'])
+    assert store.compact(threshold=0.0) == 0
+    assert store._segment_path(store.active).exists()
+
+
+def test_reset_starts_empty(make_store, index):
+    store = make_store(pack_segment_bytes=1024)
+    for i in range(40):
+        put(store, f'text/{i}', entry(i))
+    index.clear()
+    store.reset()
+    assert store._segments() == [1]
+    assert store.append('text/new', b'new') == (1, RECORD_HEADER.size + len('text/new'))
@@ -0,0 +1,71 @@
+"""Tests for the prefetch worker pool."""
+
+import threading
+from concurrent.futures import CancelledError
+
+import pytest
+
+from conftest import wait_for
+from prefetch import PrefetchPool
+from scheduler import (Priority, RequestCancelled, current_group, current_priority,
+                       get_scheduler)
+
+
+@pytest.fixture
+def sched(make_config, fresh_scheduler):
+    """The global scheduler, built fresh with one prefetch slot."""
+    return get_scheduler(make_config(prefetch_slots=1))
+
+
+def test_jobs_run_at_prefetch_priority_in_their_group(sched):
+    pool = PrefetchPool(workers=1)
+    future = pool.submit('a', lambda: (current_priority(), current_group()), group='scene1')
+    assert future.result(5) == (Priority.PREFETCH, 'scene1')
+    assert pool.get_stats()['completed'] == 1
+
+
+def test_submitting_a_key_twice_shares_the_job(sched):
+    release = threading.Event()
+    pool = PrefetchPool(workers=1)
+    first = pool.submit('a', release.wait)
+    assert pool.submit('a', lambda: None) is first
+    release.set()
+    assert first.result(5) is True
+
+
+def test_full_queue_refuses_jobs(sched):
+    release = threading.Event()
+    pool = PrefetchPool(workers=1, max_queued=1)
+    pool.submit('a', release.wait)
+    wait_for(lambda: pool.get_stats()['running'] == 1)
+    assert pool.submit('b', lambda: None) is not None
+    assert pool.submit('c', lambda: None) is None
+    assert pool.get_stats()['refused'] == 1
+    release.set()
+
+
+def test_cancel_counts_queued_jobs_and_requests(sched):
+    def request():
+        with sched.slot():
+            return 'done'
+    
+    busy = sched.acquire(Priority.PREFETCH)
+    try:
+        pool = PrefetchPool(workers=1)
+        running = pool.submit('a', request, group='scene1')
+        queued = pool.submit('b', request, group='scene1')
+        other = pool.submit('c', request, group='scene2')
+        wait_for(lambda: sched.get_stats()['prefetch']['queued'] == 1)
+        
+        # 'a' is running with its request queued; 'b' has not started
+        assert pool.cancel('scene1') == 2
+        with pytest.raises(RequestCancelled):
+            running.result(5)
+        with pytest.raises(CancelledError):
+            queued.result(0)
+        assert not other.done()
+    finally:
+        sched.release(busy)
+    
+    assert other.result(5) == 'done'
+    assert pool.cancel('scene1') == 0
@@ -0,0 +1,235 @@
+"""Tests for the priority request scheduler."""
+
+import asyncio
+import threading
+
+import pytest
+
+from conftest import wait_for
+from scheduler import Priority, RequestCancelled, RequestScheduler, request_priority
+
+
+class Requests:
+    """Requests acquiring slots on threads, recording the order they get them."""
+    
+    def __init__(self, scheduler: RequestScheduler):
+        self.scheduler = scheduler
+        self.granted = []
+        self.waiters = {}
+        self.errors = {}
+        self._threads = []
+    
+    def start(self, name, priority=Priority.INTERACTIVE, group=None, key=None):
+        """Queue a request and wait until it is granted or queued."""
+        queued = self.queued()
+        
+        def run():
+            try:
+                self.waiters[name] = self.scheduler.acquire(priority, group, key)
+                self.granted.append(name)
+            except RequestCancelled as e:
+                self.errors[name] = e
+        
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        wait_for(lambda: name in self.waiters or self.queued() == queued + 1)
+    
+    def queued(self) -> int:
+        return sum(s['queued'] for s in self.scheduler.get_stats().values())
+    
+    def release(self, name):
+        self.scheduler.release(self.waiters[name])
+    
+    def release_in_turn(self, count: int):
+        """Release each granted request until count were granted."""
+        while len(self.granted) < count:
+            granted = len(self.granted)
+            self.release(self.granted[-1])
+            wait_for(lambda: len(self.granted) > granted)
+    
+    def join(self):
+        for thread in self._threads:
+            thread.join(5)
+
+
+def test_class_limits_hold_back_only_their_class():
+    scheduler = RequestScheduler(total_slots=3, class_limits={Priority.PREFETCH: 1})
+    requests = Requests(scheduler)
+    requests.start('prefetch 1', Priority.PREFETCH)
+    requests.start('prefetch 2', Priority.PREFETCH)
+    requests.start('play', Priority.INTERACTIVE)
+    assert requests.granted == ['prefetch 1', 'play']
+    
+    requests.release('prefetch 1')
+    requests.join()
+    assert requests.granted == ['prefetch 1', 'play', 'prefetch 2']
+    assert scheduler.get_stats()['prefetch'] == {'active': 1, 'queued': 0, 'limit': 1}
+
+
+def test_free_slots_go_to_the_highest_priority_first():
+    scheduler = RequestScheduler(total_slots=1)
+    requests = Requests(scheduler)
+    requests.start('busy')
+    requests.start('background', Priority.BACKGROUND)
+    requests.start('prefetch', Priority.PREFETCH)
+    requests.start('play 1', Priority.INTERACTIVE)
+    requests.start('play 2', Priority.INTERACTIVE)
+    
+    requests.release_in_turn(5)
+    assert requests.granted == ['busy', 'play 1', 'play 2', 'prefetch', 'background']
+
+
+def test_cancel_drops_queued_requests_by_class_and_group():
+    scheduler = RequestScheduler(total_slots=1)
+    requests = Requests(scheduler)
+    requests.start('busy')
+    requests.start('scene 1', Priority.PREFETCH, group='scene1')
+    requests.start('scene 2', Priority.PREFETCH, group='scene2')
+    requests.start('background', Priority.BACKGROUND, group='scene1')
+    
+    assert scheduler.cancel(Priority.PREFETCH, 'scene1') == 1
+    assert scheduler.cancel(Priority.PREFETCH, 'scene1') == 0
+    wait_for(lambda: 'scene 1' in requests.errors)
+    
+    # The running request is not affected; the others still get slots
+    requests.release('busy')
+    wait_for(lambda: 'scene 2' in requests.granted)
+    requests.release('scene 2')
+    requests.join()
+    assert requests.granted == ['busy', 'scene 2', 'background']
+
+
+def test_cancel_all_classes_of_a_group():
+    scheduler = RequestScheduler(total_slots=1)
+    requests = Requests(scheduler)
+    requests.start('busy')
+    requests.start('play', Priority.INTERACTIVE, group='scene1')
+    requests.start('background', Priority.BACKGROUND, group='scene1')
+    
+    assert scheduler.cancel(None, 'scene1') == 2
+    requests.join()
+    assert set(requests.errors) == {'play', 'background'}
+    assert requests.queued() == 0
+
+
+def test_boost_lets_a_queued_request_past_its_class_limit():
+    scheduler = RequestScheduler(total_slots=2, class_limits={Priority.PREFETCH: 1})
+    requests = Requests(scheduler)
+    requests.start('busy', Priority.PREFETCH)
+    requests.start('prefetch', Priority.PREFETCH, key='line')
+    
+    assert not scheduler.boost('other line', Priority.INTERACTIVE)
+    assert scheduler.boost('line', Priority.INTERACTIVE)
+    wait_for(lambda: 'prefetch' in requests.granted)
+    assert scheduler.get_stats()['interactive']['active'] == 1
+    
+    # Released from the class it was granted in
+    requests.release('prefetch')
+    assert scheduler.get_stats()['interactive']['active'] == 0
+    assert not scheduler.boost('line', Priority.INTERACTIVE)
+
+
+def test_boost_defaults_to_the_callers_priority_and_never_lowers():
+    scheduler = RequestScheduler(total_slots=1)
+    requests = Requests(scheduler)
+    requests.start('busy')
+    requests.start('prefetch', Priority.PREFETCH, key='line')
+    
+    with request_priority(Priority.BACKGROUND):
+        assert not scheduler.boost('line')
+    with request_priority(Priority.INTERACTIVE):
+        assert scheduler.boost('line')
+    assert scheduler.get_stats()['interactive']['queued'] == 1
+    requests.release('busy')
+    requests.join()
+
+
+def test_deprioritize_moves_a_group_behind_other_prefetches():
+    scheduler = RequestScheduler(total_slots=1)
+    requests = Requests(scheduler)
+    requests.start('busy')
+    requests.start('old scene', Priority.PREFETCH, group='scene1')
+    requests.start('new scene', Priority.PREFETCH, group='scene2')
+    
+    assert scheduler.deprioritize('scene1') == 1
+    assert scheduler.get_stats()['background']['queued'] == 1
+    requests.release_in_turn(3)
+    assert requests.granted == ['busy', 'new scene', 'old scene']
+
+
+def test_slot_takes_the_contexts_priority_and_releases():
+    scheduler = RequestScheduler(total_slots=2, class_limits={Priority.BACKGROUND: 1})
+    with request_priority(Priority.BACKGROUND, 'scene1'):
+        with scheduler.slot() as waiter:
+            assert (waiter.priority, waiter.group) == (Priority.BACKGROUND, 'scene1')
+            assert scheduler.get_stats()['background']['active'] == 1
+    assert scheduler.get_stats()['background']['active'] == 0
+
+
+def test_async_waiters_queue_without_a_thread():
+    scheduler = RequestScheduler(total_slots=1)
+    
+    async def main():
+        first = await scheduler.acquire_async(Priority.INTERACTIVE)
+        later = [asyncio.ensure_future(scheduler.acquire_async(priority))
+                 for priority in (Priority.BACKGROUND, Priority.PREFETCH)]
+        await asyncio.sleep(0.05)
+        assert not any(task.done() for task in later)
+        assert threading.active_count() <= threads
+        
+        scheduler.release(first)
+        done, _ = await asyncio.wait(later, return_when=asyncio.FIRST_COMPLETED)
+        assert done == {later[1]}
+        scheduler.release(later[1].result())
+        scheduler.release(await later[0])
+    
+    threads = threading.active_count()
+    asyncio.run(asyncio.wait_for(main(), 5))
+    assert scheduler.get_stats()['interactive']['active'] == 0
+
+
+def test_async_waiters_can_be_cancelled_both_ways():
+    scheduler = RequestScheduler(total_slots=1)
+    
+    async def main():
+        busy = await scheduler.acquire_async()
+        
+        # Through the scheduler, like a scene jump
+        task = asyncio.ensure_future(scheduler.acquire_async(Priority.PREFETCH))
+        await asyncio.sleep(0.01)
+        assert scheduler.cancel(Priority.PREFETCH) == 1
+        with pytest.raises(RequestCancelled):
+            await task
+        
+        # Through asyncio, which gives up the place in the queue
+        task = asyncio.ensure_future(scheduler.acquire_async(Priority.PREFETCH))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert scheduler.get_stats()['prefetch']['queued'] == 0
+        scheduler.release(busy)
+    
+    asyncio.run(asyncio.wait_for(main(), 5))
+    assert sum(s['active'] for s in scheduler.get_stats().values()) == 0
+
+
+def test_held_slot_is_used_by_nested_requests():
+    scheduler = RequestScheduler(total_slots=1)
+    
+    async def main():
+        waiter = await scheduler.acquire_async()
+        
+        def request():
+            # Would wait forever for the only slot without holding()
+            with scheduler.holding(waiter):
+                with scheduler.slot() as slot:
+                    return slot
+        
+        slot = await asyncio.get_running_loop().run_in_executor(None, request)
+        assert slot is waiter
+        scheduler.release(waiter)
+    
+    asyncio.run(asyncio.wait_for(main(), 5))
+    assert scheduler.get_stats()['interactive']['active'] == 0
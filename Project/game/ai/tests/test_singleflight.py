@@ -0,0 +1,135 @@
+"""Tests for request coalescing."""
+
+import threading
+
+from api import APIClient
+from conftest import wait_for
+from scheduler import Priority, current_priority, get_scheduler, request_priority
+from singleflight import SingleFlight, payload_key
+
+
+def start(target) -> threading.Thread:
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_followers_share_the_leaders_result():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+    results = []
+    
+    def work():
+        calls.append(1)
+        release.wait(5)
+        return 'result'
+    
+    leader = start(lambda: results.append(flight.do('k', work)))
+    wait_for(lambda: flight.in_flight('k'))
+    followers = [start(lambda: results.append(flight.do('k', work))) for _ in range(3)]
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+    
+    assert calls == [1]
+    assert results == ['result'] * 4
+    assert len(flight) == 0
+
+
+def test_followers_get_the_leaders_exception():
+    flight = SingleFlight()
+    release = threading.Event()
+    errors = []
+    
+    def work():
+        release.wait(5)
+        raise ValueError('failed')
+    
+    def call():
+        try:
+            flight.do('k', work)
+        except ValueError as e:
+            errors.append(e)
+    
+    leader = start(call)
+    wait_for(lambda: flight.in_flight('k'))
+    follower = start(call)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    
+    assert len(errors) == 2 and errors[0] is errors[1]
+    assert not flight.in_flight('k')
+
+
+def test_a_key_runs_again_once_its_call_is_done():
+    flight = SingleFlight()
+    assert flight.do('k', lambda: 1) == 1
+    assert flight.do('k', lambda: 2) == 2
+
+
+def test_work_runs_at_the_leaders_priority_and_followers_join_its_state():
+    flight = SingleFlight()
+    release = threading.Event()
+    seen = {}
+    
+    def work():
+        seen['priority'] = current_priority()
+        release.wait(5)
+        return 'line'
+    
+    def prefetch():
+        with request_priority(Priority.PREFETCH):
+            seen['leader'] = flight.do('k', work, shared='state',
+                                       on_join=lambda state: seen.setdefault('leader_join', state))
+    
+    def play():
+        seen['follower'] = flight.do('k', lambda: 'own', shared='other',
+                                     on_join=lambda state: seen.setdefault('joined', state))
+    
+    leader = start(prefetch)
+    wait_for(lambda: 'priority' in seen)
+    follower = start(play)
+    wait_for(lambda: 'joined' in seen)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    
+    assert seen['priority'] == Priority.PREFETCH
+    assert seen['joined'] == 'state'
+    assert 'leader_join' not in seen
+    assert seen['leader'] == seen['follower'] == 'line'
+
+
+def test_payload_key_is_stable_and_distinguishes_parts():
+    assert payload_key('POST', '/api', {'a': 1, 'b': 2}) == payload_key('POST', '/api', {'b': 2, 'a': 1})
+    assert payload_key('ab', 'c') != payload_key('a', 'bc')
+    assert payload_key(b'x') == payload_key('x')
+
+
+def test_interactive_follower_boosts_a_queued_prefetch(make_config, backend, fresh_scheduler):
+    make_config(api_base_url=backend.url, prefetch_slots=1)
+    sched = get_scheduler()
+    client = APIClient()
+    results = {}
+    
+    def generate(name, priority):
+        with request_priority(priority):
+            results[name] = client.generate_text("Describe the harbor.")
+    
+    busy = sched.acquire(Priority.PREFETCH)
+    try:
+        leader = start(lambda: generate('prefetch', Priority.PREFETCH))
+        wait_for(lambda: sched.get_stats()['prefetch']['queued'] == 1)
+        
+        # The prefetch slot stays taken, so only the boost lets it run
+        follower = start(lambda: generate('play', Priority.INTERACTIVE))
+        follower.join(5)
+        leader.join(5)
+        assert results['play'] and results['play'] == results['prefetch']
+    finally:
+        sched.release(busy)
+        client.close()
+    
+    assert backend.get_stats()['requests'] == {'generate': 1}
@@ -0,0 +1,141 @@
+"""Tests for MP3 frame parsing and segmenting."""
+
+import pytest
+
+from tts_stream import MP3Segmenter, parse_frame_header
+
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, no padding: 417 bytes, 1152 samples
+HEADER = b'\xff\xfb\x90\x00'
+FRAME_SECONDS = 1152 / 44100
+
+
+def frame(fill: bytes = b'\x11') -> bytes:
+    """An audio frame; the fill keeps sync bytes out of the payload."""
+    return HEADER + fill * 413
+
+
+def xing_frame() -> bytes:
+    """A Xing header frame, as encoders write first."""
+    return HEADER + b'\x00' * 32 + b'Xing' + b'\x00' * 377
+
+
+def id3_tag(body: bytes, footer: bool = False) -> bytes:
+    """An ID3v2.4 tag around body (synchsafe size, optional footer)."""
+    size = len(body)
+    header = b'ID3\x04\x00' + bytes([0x10 if footer else 0])
+    header += bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+    return header + body + (b'3DI' + header[3:] if footer else b'')
+
+
+@pytest.fixture
+def frames():
+    """Ten distinguishable audio frames."""
+    return [frame(bytes([0x10 + i])) for i in range(10)]
+
+
+@pytest.fixture
+def mp3(frames):
+    """A small MP3 file: ID3 tag (with a fake frame header inside), Xing frame, audio."""
+    return id3_tag(HEADER + b'tag data') + xing_frame() + b''.join(frames)
+
+
+def segment(data: bytes, chunk_sizes=None, first_seconds=0.05, seconds=0.1):
+    """Feed data in chunks of the given sizes (repeated); return segments and segmenter."""
+    segmenter = MP3Segmenter(first_seconds, seconds)
+    segments = []
+    pos = 0
+    sizes = chunk_sizes or [len(data)]
+    i = 0
+    while pos < len(data):
+        size = sizes[i % len(sizes)]
+        segments += segmenter.feed(data[pos:pos + size])
+        pos += size
+        i += 1
+    final = segmenter.flush()
+    if final is not None:
+        segments.append(final)
+    return segments, segmenter
+
+
+def test_parse_mpeg1_layer3():
+    assert parse_frame_header(HEADER) == (417, FRAME_SECONDS)
+
+
+def test_parse_padding_adds_a_byte():
+    assert parse_frame_header(b'\xff\xfb\x92\x00') == (418, FRAME_SECONDS)
+
+
+def test_parse_mpeg2_layer3():
+    # 32 kbps, 24 kHz, mono: 576 samples per frame
+    assert parse_frame_header(b'\xff\xf3\x44\xc0') == (96, 0.024)
+
+
+@pytest.mark.parametrize('header', [
+    b'\xff\xfb\x90',        # too short
+    b'\x00\xfb\x90\x00',    # no sync
+    b'\xff\xeb\x90\x00',    # reserved version
+    b'\xff\xf9\x90\x00',    # reserved layer
+    b'\xff\xfb\x00\x00',    # free format bitrate
+    b'\xff\xfb\xf0\x00',    # bad bitrate
+    b'\xff\xfb\x9c\x00',    # reserved sample rate
+    b'ID3\x04',
+])
+def test_parse_rejects_invalid_headers(header):
+    assert parse_frame_header(header) is None
+
+
+def test_skips_id3_tag_and_drops_xing_frame(mp3, frames):
+    segments, _ = segment(mp3)
+    
+    assert b''.join(segments) == b''.join(frames)
+
+
+def test_skips_id3_tag_with_footer(frames):
+    data = id3_tag(b'tag data', footer=True) + b''.join(frames)
+    
+    segments, _ = segment(data)
+    
+    assert b''.join(segments) == b''.join(frames)
+
+
+def test_keeps_first_frame_without_xing_header(frames):
+    segments, _ = segment(b''.join(frames))
+    
+    assert b''.join(segments) == b''.join(frames)
+
+
+def test_segments_are_whole_frames_with_offsets(mp3, frames):
+    segments, segmenter = segment(mp3)
+    
+    # 0.05 s takes 2 frames, each later 0.1 s takes 4; the rest is flushed
+    assert segments == [b''.join(frames[0:2]), b''.join(frames[2:6]),
+                        b''.join(frames[6:10])]
+    assert segmenter.offsets == pytest.approx([0.0, 2 * FRAME_SECONDS, 6 * FRAME_SECONDS])
+    assert segmenter.position == pytest.approx(10 * FRAME_SECONDS)
+    assert segmenter.segments == 3
+
+
+def test_flush_without_pending_frames(frames):
+    segmenter = MP3Segmenter(0.05, 0.1)
+    segmenter.feed(b''.join(frames[:2]))
+    
+    assert segmenter.flush() is None
+
+
+@pytest.mark.parametrize('chunk_sizes', [[1], [3], [7, 2], [417], [100, 5, 1000], [9, 11, 13]])
+def test_chunk_boundaries_do_not_change_segments(mp3, chunk_sizes):
+    whole, whole_segmenter = segment(mp3)
+    
+    segments, segmenter = segment(mp3, chunk_sizes)
+    
+    assert segments == whole
+    assert segmenter.offsets == pytest.approx(whole_segmenter.offsets)
+
+
+def test_resyncs_after_junk(frames):
+    data = b''.join(frames[:3]) + b'\x00junk' + b''.join(frames[3:])
+    
+    segments, _ = segment(data, [5])
+    
+    assert b''.join(segments) == b''.join(frames)
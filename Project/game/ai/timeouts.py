@@ -0,0 +1,103 @@
+"""Adaptive read timeouts from observed per-endpoint latency.
+
+A fixed read timeout has to fit the slowest call (an SD render), so a hung
+TTS or LLM request is only noticed after the same long wait. AdaptiveTimeouts
+keeps a rolling window of time-to-first-byte samples per (endpoint, model)
+and derives each call's read timeout from it:
+
+    read_timeout = clamp(p99 * factor, floor, ceiling)
+
+Until an endpoint has enough samples the configured read_timeout is used.
+Requests that time out are recorded at their deadline, so an endpoint that
+really has become slower pushes its own deadline up instead of failing
+forever.
+"""
+
+import math
+import logging
+import threading
+from collections import deque
+from urllib.parse import urlsplit
+from typing import Deque, Dict, Optional, Tuple
+
+from config import get_config
+
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveTimeouts:
+    """Per-(endpoint, model) read timeouts from rolling latency windows."""
+    
+    def __init__(self, config=None):
+        """Initialize with empty windows.
+        
+        Args:
+            config: Configuration (defaults to global)
+        """
+        self.config = config or get_config()
+        self._lock = threading.Lock()
+        self._samples: Dict[Tuple[str, str], Deque[float]] = {}
+        self._deadlines: Dict[Tuple[str, str], float] = {}
+    
+    @staticmethod
+    def _key(url: str, model: Optional[str]) -> Tuple[str, str]:
+        return (urlsplit(url).path or url, model or "")
+    
+    def observe(self, url: str, model: Optional[str], seconds: float):
+        """Record the time to first byte of one call.
+        
+        Args:
+            url: Request URL; windows are keyed by its path
+            model: Model named in the request, if any
+            seconds: Time until response headers (or the deadline, on timeout)
+        """
+        key = self._key(url, model)
+        with self._lock:
+            window = self._samples.get(key)
+            if window is None:
+                window = self._samples[key] = deque(maxlen=self.config.timeout_window)
+            window.append(seconds)
+            
+            if len(window) >= self.config.timeout_min_samples:
+                ordered = sorted(window)
+                p99 = ordered[min(math.ceil(0.99 * len(ordered)) - 1, len(ordered) - 1)]
+                self._deadlines[key] = min(
+                    max(p99 * self.config.timeout_factor, self.config.timeout_floor),
+                    self.config.timeout_ceiling
+                )
+    
+    def read_timeout(self, url: str, model: Optional[str] = None) -> float:
+        """Read timeout for the next call to url with model."""
+        if not self.config.adaptive_timeouts:
+            return self.config.read_timeout
+        with self._lock:
+            return self._deadlines.get(self._key(url, model), self.config.read_timeout)
+    
+    def timeout(self, url: str, model: Optional[str] = None) -> Tuple[float, float]:
+        """(connect, read) timeout tuple for requests."""
+        return (self.config.connect_timeout, self.read_timeout(url, model))
+    
+    def get_stats(self) -> Dict[str, dict]:
+        """Get current deadline and sample count per endpoint and model."""
+        with self._lock:
+            return {
+                f"{path} [{model}]" if model else path: {
+                    'samples': len(window),
+                    'read_timeout': round(self._deadlines.get((path, model),
+                                                              self.config.read_timeout), 3)
+                }
+                for (path, model), window in self._samples.items()
+            }
+
+
+# Global timeouts instance
+_timeouts: Optional[AdaptiveTimeouts] = None
+
+
+def get_timeouts(config=None) -> AdaptiveTimeouts:
+    """Get or create the global adaptive timeouts."""
+    global _timeouts
+    if _timeouts is None:
+        _timeouts = AdaptiveTimeouts(config)
+    return _timeouts
@@ -0,0 +1,285 @@
+"""Progressive playback of TTS audio while it downloads.
+
+The TTS response is written to the cache file as usual, and each chunk is
+also handed to a TTSStream. For MP3 the stream cuts the data at frame
+boundaries into short segments that each decode on their own: the first
+segment is small so playback can start as soon as the first frames
+arrive, later ones are longer so the player queues fewer of them. Ren'Py
+plays the segments back to back from memory (see audio_tts.rpy).
+
+Only MP3 can be cut like this; other formats and parts already in the
+cache are queued as their cache files instead. A part another caller is
+already generating streams too, from the audio received so far. A line split into sentence chunks streams its first chunk
+and queues the others' files as they finish.
+
+Each item is tagged with its part and its start time within the part, so
+playback can look up the part's lip-sync envelope (see lipsync.py).
+"""
+
+import logging
+import threading
+from collections import deque
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+
+logger = logging.getLogger(__name__)
+
+
+# Bitrates in kbps by (MPEG-1?, layer)
+_BITRATES = {
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+# Sample rates by version bits (3 = MPEG-1, 2 = MPEG-2, 0 = MPEG-2.5)
+_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def parse_frame_header(header: bytes) -> Optional[tuple]:
+    """Decode a 4-byte MPEG audio frame header.
+    
+    Returns:
+        (frame length in bytes, duration in seconds), or None if header is
+        not a valid frame header
+    """
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version = (header[1] >> 3) & 3
+    layer = 4 - ((header[1] >> 1) & 3)
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 3
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    
+    mpeg1 = version == 3
+    bitrate = _BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+    padding = (header[2] >> 1) & 1
+    
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4, 384 / sample_rate
+    if layer == 2 or mpeg1:
+        return 144 * bitrate // sample_rate + padding, 1152 / sample_rate
+    return 72 * bitrate // sample_rate + padding, 576 / sample_rate
+
+
+class MP3Segmenter:
+    """Cuts an MP3 byte stream into independently playable segments."""
+    
+    def __init__(self, first_seconds: float = 0.5, seconds: float = 2.0):
+        """Initialize segmenter.
+        
+        Args:
+            first_seconds: Audio in the first segment
+            seconds: Audio in each later segment
+        """
+        self.first_seconds = first_seconds
+        self.seconds = seconds
+        self._buf = bytearray()
+        self._frames = bytearray()
+        self._duration = 0.0
+        self._started = False
+        self._first_frame = True
+        self.segments = 0
+        
+        # Start time of each emitted segment, and of the next one
+        self.offsets: List[float] = []
+        self.position = 0.0
+    
+    def feed(self, data: bytes) -> List[bytes]:
+        """Consume data and return the segments completed by it."""
+        self._buf += data
+        segments = []
+        
+        if not self._started and not self._skip_id3():
+            return segments
+        
+        pos = 0
+        buf = self._buf
+        while len(buf) - pos >= 4:
+            parsed = parse_frame_header(buf[pos:pos + 4])
+            if parsed is None:
+                # Lost sync (junk or a tag); scan for the next frame
+                pos += 1
+                continue
+            length, duration = parsed
+            if len(buf) - pos < length:
+                break
+            
+            frame = buf[pos:pos + length]
+            pos += length
+            # The Xing/Info frame describes the whole file; in a
+            # segment it would make the decoder trim or stop early
+            if self._first_frame:
+                self._first_frame = False
+                if b'Xing' in frame[:64] or b'Info' in frame[:64]:
+                    continue
+            
+            self._frames += frame
+            self._duration += duration
+            target = self.seconds if self.segments else self.first_seconds
+            if self._duration >= target:
+                segments.append(self._take())
+        
+        del buf[:pos]
+        return segments
+    
+    def flush(self) -> Optional[bytes]:
+        """Return the frames not yet emitted as a final segment."""
+        return self._take() if self._frames else None
+    
+    def _take(self) -> bytes:
+        segment = bytes(self._frames)
+        self.offsets.append(self.position)
+        self.position += self._duration
+        self._frames.clear()
+        self._duration = 0.0
+        self.segments += 1
+        return segment
+    
+    def _skip_id3(self) -> bool:
+        """Drop a leading ID3v2 tag; False until enough data arrived."""
+        if len(self._buf) < 10:
+            return False
+        if self._buf[:3] == b'ID3':
+            size = 10 + ((self._buf[6] & 0x7F) << 21 | (self._buf[7] & 0x7F) << 14
+                         | (self._buf[8] & 0x7F) << 7 | (self._buf[9] & 0x7F))
+            if self._buf[5] & 0x10:
+                size += 10
+            if len(self._buf) < size:
+                return False
+            del self._buf[:size]
+        self._started = True
+        return True
+
+
+class TTSStream:
+    """Playable items of a TTS line, in order, as they become ready.
+    
+    Items are bytes (an MP3 segment of a part still downloading) or str
+    (the cache path of a finished part, played from its file). A line has
+    one part, or one per chunk when it is split into sentences (see
+    chunking.py); parts lists each finished part's path (None if it
+    failed) in order.
+    """
+    
+    def __init__(self, format: str = "mp3", first_seconds: float = 0.5,
+                 seconds: float = 2.0):
+        """Initialize stream.
+        
+        Args:
+            format: Audio format of the line; only mp3 is segmented
+            first_seconds: Audio in the line's first segment
+            seconds: Audio in each later segment
+        """
+        self.format = format
+        self.first_seconds = first_seconds
+        self.seconds = seconds
+        # (item, part index, start seconds within the part)
+        self._items: deque = deque()
+        self._cond = threading.Condition()
+        self.paths: List[Path] = []
+        self.parts: List[Optional[Path]] = []
+        self.error: Optional[str] = None
+        self.done = False
+        self.streamed = 0
+        self._part_segments = 0
+        self._segmenter = self._new_segmenter()
+    
+    @classmethod
+    def finished(cls, paths: List[Path], error: Optional[str] = None) -> 'TTSStream':
+        """A stream that is complete already (cached or failed line)."""
+        stream = cls(format="")
+        for path in paths:
+            stream.end_part(path)
+        stream.finish(error)
+        return stream
+    
+    def _new_segmenter(self) -> Optional[MP3Segmenter]:
+        if self.format != "mp3":
+            return None
+        first = self.seconds if self._items or self.parts else self.first_seconds
+        return MP3Segmenter(first, self.seconds)
+    
+    def feed(self, data: bytes):
+        """Consume the next chunk of the part being downloaded."""
+        if self._segmenter is None or self.done:
+            return
+        segments = self._segmenter.feed(data)
+        if segments:
+            part = len(self.parts)
+            offsets = self._segmenter.offsets[-len(segments):]
+            with self._cond:
+                self._items.extend((segment, part, offset)
+                                   for segment, offset in zip(segments, offsets))
+                self.streamed += len(segments)
+                self._part_segments += len(segments)
+                self._cond.notify_all()
+    
+    def end_part(self, path: Optional[Path], error: Optional[str] = None):
+        """Mark the part being fed complete, with its cache path.
+        
+        A part that produced segments queues its remaining frames, any
+        other part its file. A failed part (no path) is skipped.
+        """
+        with self._cond:
+            part = len(self.parts)
+            if path is None:
+                self.error = error or "TTS generation failed"
+            else:
+                if self._part_segments:
+                    tail = self._segmenter.flush()
+                    if tail:
+                        self._items.append((tail, part, self._segmenter.offsets[-1]))
+                        self.streamed += 1
+                else:
+                    self._items.append((str(path), part, 0.0))
+                self.paths.append(Path(path))
+            self.parts.append(Path(path) if path is not None else None)
+            self._part_segments = 0
+            self._segmenter = self._new_segmenter()
+            self._cond.notify_all()
+    
+    def finish(self, error: Optional[str] = None):
+        """Mark the line complete (after its last part)."""
+        with self._cond:
+            if error:
+                self.error = error
+            self.done = True
+            self._cond.notify_all()
+    
+    @property
+    def streaming(self) -> bool:
+        """True once segments were produced from a download."""
+        return self.streamed > 0
+    
+    def poll(self) -> List[Union[bytes, str]]:
+        """Take the items available now, without blocking."""
+        return [item for item, _, _ in self.poll_timed()]
+    
+    def poll_timed(self) -> List[Tuple[Union[bytes, str], int, float]]:
+        """Take the items available now as (item, part index, start seconds)."""
+        with self._cond:
+            items = list(self._items)
+            self._items.clear()
+            return items
+    
+    def next_item(self, timeout: Optional[float] = None) -> Optional[Union[bytes, str]]:
+        """Wait for the next item.
+        
+        Returns:
+            The item, or None once the stream is done or on timeout
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._items or self.done, timeout)
+            return self._items.popleft()[0] if self._items else None
+    
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait until the line is complete; True if it is."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.done, timeout)